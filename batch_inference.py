@@ -0,0 +1,355 @@
+"""
+离线批量推理(--batch)
+夜间批量任务不需要交互式延迟, 供应商的批量接口吞吐更高、价格更低。流程:
+1. 渲染: 每个切片任务渲染为 OpenAI 兼容的批量输入行, custom_id 为切片ID
+       {"custom_id": ..., "method": "POST", "url": "/v1/chat/completions", "body": {...}}
+2. 提交: 上传输入文件并创建批次
+3. 轮询: 等待批次进入终态(completed / failed / expired / cancelled)
+4. 下载: 取回输出文件(与错误文件), 按 custom_id 匹配回切片, 之后走正常的解析、校验、去重流程
+
+幂等:
+- 提交状态按 (接口, 输入文件哈希) 记录在工作目录的 batch_state.json 中,
+  中断后重新运行相同的输入会继续轮询已提交的批次, 已下载的输出直接复用, 不会重复提交
+- 输出中同一 custom_id 出现多次(供应商重试)时只取第一条成功结果
+
+接口:
+- siliconflow: 供应商批量接口(OpenAI 兼容的 files / batches)
+- local:       本地替身, 用同步聊天客户端逐条执行请求, 输入输出文件格式与供应商相同, 供测试与不支持批量接口的部署使用
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from config import load_env
+from siliconflow_client import DEFAULT_BASE_URL, DEFAULT_MODEL
+
+BATCH_ENDPOINTS = ["siliconflow", "local"]
+CHAT_COMPLETIONS_URL = "/v1/chat/completions"
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def batch_request(custom_id: str, messages: List[Dict], max_tokens: int, model: str = DEFAULT_MODEL,
+                  temperature: float = 0.7, top_p: float = 0.9) -> Dict:
+    """一个批量输入行(参数与 SiliconFlowClient.chat_completion 的默认值一致)"""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": CHAT_COMPLETIONS_URL,
+        "body": {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+        },
+    }
+
+
+def write_batch_input(path: str, requests: Iterable[Dict]) -> str:
+    """写出批量输入 JSONL, 返回内容哈希(用于幂等提交)"""
+    digest = hashlib.sha256()
+    with open(path, 'w', encoding='utf-8') as f:
+        for request in requests:
+            line = json.dumps(request, ensure_ascii=False, separators=(',', ':')) + '\n'
+            digest.update(line.encode('utf-8'))
+            f.write(line)
+    return digest.hexdigest()
+
+
+class BatchResult:
+    """一个 custom_id 的批量结果"""
+
+    __slots__ = ("custom_id", "content", "finish_reason", "completion_tokens", "error")
+
+    def __init__(self, custom_id: str, content: Optional[str] = None, finish_reason: Optional[str] = None,
+                 completion_tokens: Optional[int] = None, error: Optional[str] = None):
+        self.custom_id = custom_id
+        self.content = content
+        self.finish_reason = finish_reason
+        self.completion_tokens = completion_tokens
+        self.error = error
+
+    @classmethod
+    def from_line(cls, record: Dict) -> "BatchResult":
+        custom_id = record.get("custom_id")
+        response = record.get("response") or {}
+        body = response.get("body") or {}
+        if record.get("error") or response.get("status_code", 200) != 200 or not body.get("choices"):
+            error = record.get("error") or body.get("error") or f"status_code={response.get('status_code')}"
+            return cls(custom_id, error=json.dumps(error, ensure_ascii=False) if not isinstance(error, str) else error)
+        choice = body["choices"][0]
+        usage = body.get("usage") or {}
+        return cls(
+            custom_id,
+            content=(choice.get("message") or {}).get("content") or "",
+            finish_reason=choice.get("finish_reason"),
+            completion_tokens=usage.get("completion_tokens"),
+        )
+
+
+def read_batch_output(paths: Iterable[str]) -> Dict[str, BatchResult]:
+    """
+    读取输出/错误文件, 按 custom_id 汇总
+    同一 custom_id 有多条记录时保留第一条成功结果, 都失败时保留第一条错误
+    """
+    results = {}
+    for path in paths:
+        if not path or not os.path.exists(path):
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                result = BatchResult.from_line(json.loads(line))
+                previous = results.get(result.custom_id)
+                if previous is None or (previous.error is not None and result.error is None):
+                    results[result.custom_id] = result
+    return results
+
+
+# ===== 接口 =====
+
+class OpenAIBatchEndpoint:
+    """OpenAI 兼容的批量接口(SiliconFlow)"""
+
+    name = "siliconflow"
+
+    def __init__(self, api_key: Optional[str] = None, base_url: str = DEFAULT_BASE_URL,
+                 completion_window: str = "24h"):
+        load_env()
+        api_key = api_key or (os.getenv('SILICONFLOW_API_KEYS') or os.getenv('SILICONFLOW_API_KEY') or "").split(',')[0].strip()
+        if not api_key:
+            raise ValueError("未设置 SILICONFLOW_API_KEY!\n请在 .env 文件中设置或传入 api_key 参数")
+        from openai import OpenAI
+
+        self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self.completion_window = completion_window
+
+    def upload(self, path: str) -> str:
+        with open(path, 'rb') as f:
+            return self.client.files.create(file=f, purpose="batch").id
+
+    def create(self, input_file_id: str) -> str:
+        batch = self.client.batches.create(
+            input_file_id=input_file_id, endpoint=CHAT_COMPLETIONS_URL, completion_window=self.completion_window
+        )
+        return batch.id
+
+    def retrieve(self, batch_id: str) -> Dict:
+        batch = self.client.batches.retrieve(batch_id)
+        counts = getattr(batch, "request_counts", None)
+        return {
+            "status": batch.status,
+            "output_file_id": getattr(batch, "output_file_id", None),
+            "error_file_id": getattr(batch, "error_file_id", None),
+            "completed": getattr(counts, "completed", 0) if counts else 0,
+            "failed": getattr(counts, "failed", 0) if counts else 0,
+            "total": getattr(counts, "total", 0) if counts else 0,
+        }
+
+    def download(self, file_id: str, path: str):
+        content = self.client.files.content(file_id)
+        with open(path, 'wb') as f:
+            f.write(content.read() if hasattr(content, "read") else content.content)
+
+
+class LocalBatchEndpoint:
+    """
+    本地批量替身: 在后台线程中用同步聊天客户端(如 SiliconFlowClient)逐条执行输入文件中的请求,
+    按供应商格式写出输出与错误文件。文件和批次状态保存在 root 目录下, 跨进程可见
+    """
+
+    name = "local"
+
+    def __init__(self, client, root: str = "batch_jobs/local_endpoint", workers: int = 4):
+        """
+        Args:
+            client: 提供 chat_completion(messages, max_tokens, temperature, top_p) 的客户端
+            root: 文件与批次状态目录
+            workers: 并发请求数
+        """
+        self.client = client
+        self.root = root
+        self.workers = workers
+        os.makedirs(os.path.join(root, "files"), exist_ok=True)
+        os.makedirs(os.path.join(root, "batches"), exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _file_path(self, file_id: str) -> str:
+        return os.path.join(self.root, "files", f"{file_id}.jsonl")
+
+    def _batch_path(self, batch_id: str) -> str:
+        return os.path.join(self.root, "batches", f"{batch_id}.json")
+
+    def _save_batch(self, batch_id: str, batch: Dict):
+        with self._lock:
+            tmp_path = self._batch_path(batch_id) + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(batch, f)
+            os.replace(tmp_path, self._batch_path(batch_id))
+
+    def upload(self, path: str) -> str:
+        file_id = f"file-{uuid.uuid4().hex}"
+        shutil.copyfile(path, self._file_path(file_id))
+        return file_id
+
+    def create(self, input_file_id: str) -> str:
+        batch_id = f"batch-{uuid.uuid4().hex}"
+        batch = {"status": "in_progress", "input_file_id": input_file_id, "output_file_id": None,
+                 "error_file_id": None, "completed": 0, "failed": 0, "total": 0, "pid": os.getpid()}
+        self._save_batch(batch_id, batch)
+        threading.Thread(target=self._execute, args=(batch_id, batch), daemon=True).start()
+        return batch_id
+
+    def retrieve(self, batch_id: str) -> Dict:
+        path = self._batch_path(batch_id)
+        if not os.path.exists(path):
+            raise KeyError(f"批次不存在: {batch_id}")
+        with open(path, 'r', encoding='utf-8') as f:
+            batch = json.load(f)
+        # 执行批次的进程已退出(如上次运行被中断), 未完成的批次视为过期, 由调用方重新提交
+        if batch["status"] not in TERMINAL_STATUSES and batch.get("pid") not in (None, os.getpid()):
+            batch["status"] = "expired"
+        return batch
+
+    def download(self, file_id: str, path: str):
+        shutil.copyfile(self._file_path(file_id), path)
+
+    def _call(self, request: Dict) -> Dict:
+        body = request["body"]
+        try:
+            response = self.client.chat_completion(
+                messages=body["messages"], max_tokens=body["max_tokens"],
+                temperature=body.get("temperature", 0.7), top_p=body.get("top_p", 0.9)
+            )
+        except Exception as e:
+            return {"custom_id": request["custom_id"], "response": None,
+                    "error": {"code": type(e).__name__, "message": str(e)}}
+        choice = response.choices[0]
+        usage = getattr(response, "usage", None)
+        return {
+            "custom_id": request["custom_id"],
+            "response": {"status_code": 200, "body": {
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": choice.message.content},
+                             "finish_reason": getattr(choice, "finish_reason", None)}],
+                "usage": {"completion_tokens": getattr(usage, "completion_tokens", None)},
+            }},
+            "error": None,
+        }
+
+    def _execute(self, batch_id: str, batch: Dict):
+        with open(self._file_path(batch["input_file_id"]), 'r', encoding='utf-8') as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        batch["total"] = len(requests)
+        self._save_batch(batch_id, batch)
+
+        output_id, error_id = f"file-{uuid.uuid4().hex}", f"file-{uuid.uuid4().hex}"
+        with open(self._file_path(output_id), 'w', encoding='utf-8') as out, \
+                open(self._file_path(error_id), 'w', encoding='utf-8') as err, \
+                ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for record in pool.map(self._call, requests):
+                failed = record["error"] is not None
+                (err if failed else out).write(json.dumps(record, ensure_ascii=False) + '\n')
+                batch["failed" if failed else "completed"] += 1
+                self._save_batch(batch_id, batch)
+        batch.update(status="completed", output_file_id=output_id, error_file_id=error_id)
+        self._save_batch(batch_id, batch)
+
+
+# ===== 作业 =====
+
+class BatchJob:
+    """渲染 → 提交 → 轮询 → 下载; 状态保存在工作目录, 相同输入重复运行时复用已提交的批次"""
+
+    def __init__(self, endpoint, work_dir: str = "batch_jobs", poll_interval: float = 30.0,
+                 timeout: Optional[float] = None):
+        self.endpoint = endpoint
+        self.work_dir = work_dir
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        os.makedirs(work_dir, exist_ok=True)
+        self._state_path = os.path.join(work_dir, "batch_state.json")
+
+    def _load_state(self) -> Dict:
+        if not os.path.exists(self._state_path):
+            return {}
+        with open(self._state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_state(self, state: Dict):
+        tmp_path = self._state_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self._state_path)
+
+    def run(self, requests: List[Dict]) -> Dict[str, BatchResult]:
+        """
+        执行批量请求
+        Returns:
+            custom_id -> BatchResult(未返回结果的 custom_id 不在其中)
+        """
+        input_path = os.path.join(self.work_dir, "batch_input.jsonl")
+        digest = write_batch_input(input_path, requests)
+        key = f"{self.endpoint.name}:{digest}"
+        state = self._load_state()
+        entry = state.get(key)
+
+        if entry and entry.get("outputs"):
+            print(f"批量推理: 复用已下载的批次结果 {entry['batch_id']}")
+            return read_batch_output(entry["outputs"])
+
+        batch = None
+        if entry:
+            try:
+                batch = self.endpoint.retrieve(entry["batch_id"])
+                print(f"批量推理: 继续轮询已提交的批次 {entry['batch_id']} ({batch['status']})")
+            except Exception as e:
+                print(f"批量推理: 无法查询已提交的批次 {entry['batch_id']}({e}), 重新提交")
+            if batch is not None and batch["status"] in ("failed", "expired", "cancelled"):
+                print(f"批量推理: 批次 {entry['batch_id']} 状态为 {batch['status']}, 重新提交")
+                batch = None
+        if batch is None:
+            file_id = self.endpoint.upload(input_path)
+            entry = {"batch_id": self.endpoint.create(file_id), "input_file_id": file_id,
+                     "requests": len(requests), "submitted_at": time.time()}
+            state[key] = entry
+            self._save_state(state)
+            print(f"批量推理: 已提交批次 {entry['batch_id']} ({len(requests)} 个请求)")
+
+        batch = self._wait(entry["batch_id"])
+        if batch["status"] != "completed":
+            raise RuntimeError(f"批次 {entry['batch_id']} 未完成: {batch['status']}")
+
+        outputs = []
+        for field in ("output_file_id", "error_file_id"):
+            if batch.get(field):
+                path = os.path.join(self.work_dir, f"{entry['batch_id']}_{field[:-3]}.jsonl")
+                self.endpoint.download(batch[field], path)
+                outputs.append(path)
+        entry["outputs"] = outputs
+        self._save_state(state)
+        return read_batch_output(outputs)
+
+    def _wait(self, batch_id: str) -> Dict:
+        started = time.monotonic()
+        last_progress = None
+        while True:
+            batch = self.endpoint.retrieve(batch_id)
+            progress = (batch["status"], batch.get("completed"), batch.get("failed"))
+            if progress != last_progress:
+                print(f"  批次 {batch_id}: {batch['status']}, 完成 {batch.get('completed', 0)}"
+                      f"/{batch.get('total', 0)}, 失败 {batch.get('failed', 0)}")
+                last_progress = progress
+            if batch["status"] in TERMINAL_STATUSES:
+                return batch
+            if self.timeout is not None and time.monotonic() - started > self.timeout:
+                raise TimeoutError(f"等待批次 {batch_id} 超时, 重新运行可继续轮询")
+            time.sleep(self.poll_interval)
@@ -0,0 +1,142 @@
+"""
+紧凑输出格式的编解码
+标准格式中每个事项都重复 "description"、"value_type"、"references" 等键名和缩进空白,
+2000 token 的输出里有相当一部分是语法。紧凑格式(--compact-output)让模型输出定长数组:
+
+    {"events": [[title, summary, content, category, is_valid, [[type, name, description, value_type, value, unit], ...]], ...]}
+
+- 实体数组末尾为空的字段省略, 中间为空的字段用 ""
+- is_valid 用 1/0
+- references 不需要模型输出, 本地补为当前切片ID
+
+本地解析后用 expand_events 还原为 config.SCHEMA 定义的标准事项, 之后的校验、去重、输出与标准格式完全相同。
+运行本模块可检查标准格式与紧凑格式的往返一致性:
+    python compact_format.py
+"""
+
+import json
+from typing import Dict, List
+
+from config import COMPACT_ENTITY_FIELDS, COMPACT_EVENT_FIELDS
+
+_EVENT_INDEX = {field: i for i, field in enumerate(COMPACT_EVENT_FIELDS)}
+# 实体中必须保留的字段, 其余字段为空时省略
+_ENTITY_REQUIRED = 3
+
+
+def _truthy(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() not in ("0", "false", "no", "")
+    return bool(value)
+
+
+def expand_entity(row) -> Dict:
+    """[type, name, description, value_type, value, unit] -> 实体对象"""
+    if isinstance(row, dict):
+        return row
+    entity = {}
+    for field, value in zip(COMPACT_ENTITY_FIELDS, row):
+        if field in COMPACT_ENTITY_FIELDS[:_ENTITY_REQUIRED]:
+            entity[field] = "" if value is None else value
+        elif value not in (None, ""):
+            entity[field] = value
+    return entity
+
+
+def expand_event(row, slice_id: str) -> Dict:
+    """紧凑事项数组 -> 标准事项对象; 模型误输出对象时原样返回"""
+    if isinstance(row, dict):
+        return row
+    values = list(row) + [None] * (len(COMPACT_EVENT_FIELDS) - len(row))
+    event = {}
+    for field in COMPACT_EVENT_FIELDS:
+        value = values[_EVENT_INDEX[field]]
+        if field == "is_valid":
+            event[field] = True if value is None else _truthy(value)
+        elif field == "entities":
+            event[field] = [expand_entity(e) for e in (value or []) if isinstance(e, (list, dict))]
+        else:
+            event[field] = "" if value is None else value
+    event["references"] = [slice_id]
+    return event
+
+
+def expand_events(rows: List, slice_id: str) -> List[Dict]:
+    return [expand_event(row, slice_id) for row in rows if isinstance(row, (list, dict))]
+
+
+def compact_entity(entity: Dict) -> List:
+    row = [entity.get(field, "") for field in COMPACT_ENTITY_FIELDS]
+    while len(row) > _ENTITY_REQUIRED and row[-1] in (None, ""):
+        row.pop()
+    return row
+
+
+def compact_event(event: Dict) -> List:
+    """标准事项对象 -> 紧凑事项数组(references 不编码)"""
+    row = []
+    for field in COMPACT_EVENT_FIELDS:
+        if field == "is_valid":
+            row.append(1 if event.get(field, True) else 0)
+        elif field == "entities":
+            row.append([compact_entity(e) for e in event.get(field) or []])
+        else:
+            row.append(event.get(field, ""))
+    return row
+
+
+def dumps_compact(events: List[Dict]) -> str:
+    """按模型应输出的样子序列化(无缩进、无多余空白)"""
+    return json.dumps({"events": [compact_event(e) for e in events]}, ensure_ascii=False, separators=(",", ":"))
+
+
+def _self_check():
+    """往返一致性检查: 标准事项 → 紧凑输出文本 → 解析还原, 结果应与原事项一致"""
+    from json_salvage import parse_events_response
+    from token_budget import estimate_tokens
+
+    slice_id = "doc.md_slice_3"
+    events = [
+        {
+            "title": "成都蓉城1-0战胜江原FC",
+            "summary": "亚冠精英联赛东亚区第2轮,成都蓉城主场1-0击败江原FC",
+            "content": "北京时间9月30日20点15分,成都蓉城主场迎战江原FC,最终以1比0获胜。",
+            "category": "体育赛事",
+            "references": [slice_id],
+            "entities": [
+                {"type": "organization", "name": "成都蓉城", "description": "主场球队"},
+                {"type": "time", "name": "比赛时间", "description": "比赛开始时间", "value_type": "datetime", "value": "2024-09-30T20:15:00"},
+                {"type": "metric", "name": "比分", "description": "最终比分", "value": "1-0"},
+                {"type": "metric", "name": "摩尔质量", "description": "分子量", "value_type": "float", "value": "218.03", "unit": "g/mol"},
+                {"type": "other", "name": "含\"引号\"的名称", "description": ""},
+            ],
+            "is_valid": True,
+        },
+        {
+            "title": "广告",
+            "summary": "",
+            "content": "点击链接购买",
+            "category": "广告",
+            "references": [slice_id],
+            "entities": [],
+            "is_valid": False,
+        },
+    ]
+
+    compact_text = dumps_compact(events)
+    rows, info = parse_events_response(compact_text, compact=True)
+    assert info["mode"] == "clean", info
+    assert expand_events(rows, slice_id) == events, "往返结果不一致"
+
+    # 截断的紧凑输出: 已闭合的事项仍可恢复
+    truncated = compact_text[:compact_text.index('["广告"') + 5]
+    rows, info = parse_events_response(truncated, compact=True)
+    assert info["truncated"] and expand_events(rows, slice_id) == events[:1], info
+
+    standard_text = json.dumps({"events": events}, ensure_ascii=False, indent=2)
+    print("往返一致性检查通过")
+    print(f"输出 token 估计: 标准格式 {estimate_tokens(standard_text)}, 紧凑格式 {estimate_tokens(compact_text)}")
+
+
+if __name__ == "__main__":
+    _self_check()
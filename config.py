@@ -1,3 +1,24 @@
+import os
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def load_env():
+    """
+    读取 .env 文件到环境变量(整个进程只执行一次)
+    已存在的环境变量以 .env 中的值为准, 与原先各模块各自加载的行为一致
+    """
+    env_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
+    if os.path.exists(env_path):
+        with open(env_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#') and '=' in line:
+                    key, value = line.split('=', 1)
+                    os.environ[key.strip()] = value.strip()
+    return env_path
+
+
 # Schema 定义 - 用于 prompts_v2.py
 # 注意: prompts_v2.py 中包含完整的实体定义和示例,这里只是用于验证的基础schema
 
@@ -83,3 +104,44 @@ SCHEMA = {
     "required": ["events"]
 }
 
+
+
+# 紧凑输出格式(--compact-output): 事项和实体用定长数组代替带键名的对象, 减少模型输出的语法 token
+# 本地解析后按下面的字段顺序还原为 SCHEMA 定义的事项; references 由本地按切片ID补全, 不需要模型输出
+COMPACT_EVENT_FIELDS = ["title", "summary", "content", "category", "is_valid", "entities"]
+COMPACT_ENTITY_FIELDS = ["type", "name", "description", "value_type", "value", "unit"]
+
+
+def _compact_schema():
+    event_props = SCHEMA["properties"]["events"]["items"]["properties"]
+    entity_props = event_props["entities"]["items"]["properties"]
+    entity_items = [
+        {"type": entity_props[f]["type"], "description": f"{f}: {entity_props[f]['description']}"}
+        for f in COMPACT_ENTITY_FIELDS
+    ]
+    event_items = []
+    for field in COMPACT_EVENT_FIELDS:
+        if field == "is_valid":
+            event_items.append({"type": "integer", "enum": [1, 0], "description": "is_valid: 1=有效, 0=无效(广告/乱码/纯链接/垃圾信息)"})
+        elif field == "entities":
+            event_items.append({
+                "type": "array",
+                "description": "entities: 实体数组, 每个实体为 [" + ", ".join(COMPACT_ENTITY_FIELDS) + "], 末尾为空的字段可省略",
+                "items": {"type": "array", "prefixItems": entity_items, "minItems": 3},
+            })
+        else:
+            event_items.append({"type": event_props[field]["type"], "description": f"{field}: {event_props[field]['description']}"})
+    return {
+        "type": "object",
+        "properties": {
+            "events": {
+                "type": "array",
+                "description": "事项数组, 每个事项为 [" + ", ".join(COMPACT_EVENT_FIELDS) + "]",
+                "items": {"type": "array", "prefixItems": event_items, "minItems": len(COMPACT_EVENT_FIELDS)},
+            }
+        },
+        "required": ["events"],
+    }
+
+
+COMPACT_SCHEMA = _compact_schema()
@@ -0,0 +1,112 @@
+"""
+本地语料批量并发加载
+原流程逐个文件串行: os.path.exists 检查 → 整体读入 → 按空行拆段并 strip 后重新拼接 →
+切片时再拆一次、strip 一次。冷缓存(网络盘、刚复制的语料)时主要耗时在串行的文件 I/O 上。
+
+这里用线程池并发读取(大文件用 mmap 直接解码, 避免多一次缓冲区拷贝),
+每个文件只做一次段落规范化, 得到的段落列表直接交给 segment_into_slices;
+load() 按输入顺序流式返回已就绪的文档, 读取与切片、预过滤重叠进行, 同时在途的文件数有上限, 内存占用有界。
+
+    loader = CorpusLoader(workers=8)
+    for doc in loader.load(paths):
+        if doc.error is None:
+            slices = segment_into_slices(doc.paragraphs)
+"""
+
+import mmap
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Optional
+
+from profiling import profiled
+
+LOCAL_SUFFIXES = (".md", ".txt")
+
+# 超过该大小的文件用 mmap 读取
+MMAP_THRESHOLD = 4 << 20
+
+
+def normalize_paragraphs(text: str) -> List[str]:
+    """按空行拆分段落并去除首尾空白, 丢弃空段落"""
+    return [p.strip() for p in text.split('\n\n') if p.strip()]
+
+
+def _decode(data) -> str:
+    text = str(data, 'utf-8')
+    # 与文本模式读取一致: 统一换行符
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+def read_text(path: str, mmap_threshold: int = MMAP_THRESHOLD) -> str:
+    """读取 UTF-8 文本文件"""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= mmap_threshold:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return _decode(mapped)
+        return _decode(f.read())
+
+
+@profiled("read_paragraphs")
+def read_paragraphs(path: str, mmap_threshold: int = MMAP_THRESHOLD) -> List[str]:
+    """读取本地 .md/.txt 文件并规范化为段落列表"""
+    if not path.endswith(LOCAL_SUFFIXES):
+        raise ValueError("不支持的文件格式或URL")
+    return normalize_paragraphs(read_text(path, mmap_threshold))
+
+
+class Document:
+    """已加载的文档: 规范化后的段落列表, 或读取失败的异常"""
+
+    __slots__ = ("path", "paragraphs", "error")
+
+    def __init__(self, path: str, paragraphs: Optional[List[str]] = None, error: Optional[Exception] = None):
+        self.path = path
+        self.paragraphs = paragraphs or []
+        self.error = error
+
+    @property
+    def length(self) -> int:
+        """段落以空行拼接后的字符数(即 read_document 返回内容的长度)"""
+        if not self.paragraphs:
+            return 0
+        return sum(len(p) for p in self.paragraphs) + 2 * (len(self.paragraphs) - 1)
+
+    @property
+    def content(self) -> str:
+        return '\n\n'.join(self.paragraphs)
+
+
+class CorpusLoader:
+    """线程池并发加载本地文档, 按输入顺序流式返回"""
+
+    def __init__(self, workers: int = 8, prefetch: Optional[int] = None, mmap_threshold: int = MMAP_THRESHOLD):
+        """
+        Args:
+            workers: 并发读取线程数
+            prefetch: 同时在途(已提交未取走)的文件数上限, 默认 workers 的 4 倍
+            mmap_threshold: 超过该字节数的文件用 mmap 读取
+        """
+        self.workers = max(1, workers)
+        self.prefetch = prefetch or self.workers * 4
+        self.mmap_threshold = mmap_threshold
+
+    def _load(self, path: str) -> Document:
+        try:
+            return Document(path, read_paragraphs(path, self.mmap_threshold))
+        except Exception as e:
+            return Document(path, error=e)
+
+    def load(self, paths: Iterable[str]) -> Iterator[Document]:
+        """按输入顺序返回文档; 读取失败(含文件不存在)的文档 error 不为空, 不会中断整个加载"""
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="corpus-loader") as pool:
+            pending = deque()
+            for path in paths:
+                pending.append(pool.submit(self._load, path))
+                if len(pending) >= self.prefetch:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
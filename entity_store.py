@@ -0,0 +1,334 @@
+"""
+跨切片实体消解
+模型按事项逐个返回实体, 同一个药品、人物、机构在不同切片中常以不同写法或别名出现
+(如 "硝酸甘油" / "硝酸甘油(Nitroglycerin)" / "Nitroglycerin"), 文件级去重看不到这种关联。
+这里建立规范实体表:
+- 规范化键: (类型, 规范化名称), 规范化包括 NFKC、大小写折叠、去除空白与引号书名号
+- 别名证据: 名称中括号内的外文名, 以及 description 中 "又称/别名/简称/英文名..." 之后的名称
+- 并查集: 同键或有别名证据的提及合并为一个实体, 分配稳定的实体ID;
+  只作为别名出现(不是任何实体名称)的别名被多个不同实体声称时视为有歧义, 不据此合并
+事项中的实体可以加上 entity_id, 或压缩为只引用实体ID(名称、类型、描述只在实体表中保存一次)
+
+命令行用法:
+    python entity_store.py extracted_events.json --output entities.json
+    python entity_store.py extracted_events.json --lookup 硝酸甘油
+"""
+
+import json
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 规范化时去除的字符: 空白、引号、书名号、间隔号等
+_STRIP_CHARS = re.compile(r"[\s\"'“”‘’「」『』《》〈〉·•・\-_]")
+# 名称末尾括号中的外文名: "硝酸甘油(Nitroglycerin)"
+_PAREN_ALIAS = re.compile(r"^(.+?)\s*[(（]([^()（）]+)[)）]\s*$")
+_LATIN = re.compile(r"[A-Za-z]")
+_CJK = re.compile(r"[㐀-䶿一-鿿]")
+# description 中的别名线索: 线索词后的名称须完整到标点或结尾为止, 如 "又称三硝酸甘油酯。"
+_ALIAS_CUE = re.compile(
+    r"(?:又称|又名|又叫|别名|别称|亦称|也称|也叫|俗称|简称|全称|原名|学名|通称|英文名称?|外文名)"
+    r"(?:为|是|作)?[：:\s]*([^，。；;,（）()\s][^，。；;,（）()]{0,39})(?=[，。；;,（）()]|$)"
+)
+# 线索词后常见的非名称内容
+_ALIAS_STOPWORDS = frozenset((
+    "不详", "未知", "不明", "无", "没有", "暂无", "其他", "其它", "等", "教师", "老师", "学生", "医生", "本名", "同上",
+))
+_ALIAS_SPLIT = re.compile(r"[、/]|或")
+_ALIAS_QUOTES = "\"'“”‘’「」『』《》"
+
+# 过短的别名容易误合并不相关的实体
+_MIN_ALIAS_KEY_LENGTH = 2
+
+# 压缩输出时每次提及保留的字段(与具体事项相关的值)
+_MENTION_FIELDS = ("value_type", "value", "unit")
+
+
+def normalize_name(name: str) -> str:
+    """实体名称的规范化形式"""
+    name = unicodedata.normalize("NFKC", str(name or "")).casefold()
+    return _STRIP_CHARS.sub("", name)
+
+
+def extract_aliases(entity: Dict) -> List[str]:
+    """从实体名称和描述中提取别名"""
+    aliases = []
+    match = _PAREN_ALIAS.match(unicodedata.normalize("NFKC", entity.get("name") or ""))
+    if match:
+        base, inner = match.group(1).strip(), match.group(2).strip()
+        # 只有外文名当作别名; 中文括号通常是消歧说明, 如 "高志远(演员)"
+        if _LATIN.search(inner) and not _LATIN.search(base):
+            aliases.extend([base, inner])
+    for match in _ALIAS_CUE.finditer(entity.get("description") or ""):
+        for alias in _ALIAS_SPLIT.split(match.group(1)):
+            alias = alias.strip().strip(_ALIAS_QUOTES).strip()
+            if alias and alias not in _ALIAS_STOPWORDS:
+                aliases.append(alias)
+    return aliases
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def add(self, item):
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = 1
+
+    def find(self, item):
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return
+        if self.size[ra] < self.size[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.size[ra] += self.size[rb]
+
+
+class EntityStore:
+    """
+    规范实体表
+    用法:
+        store = EntityStore()
+        store.add_events(events)
+        store.resolve()
+        store.annotate(events)                   # 事项中的实体加上 entity_id
+        compact = store.compact(events)          # 或: 只保留实体ID引用
+    """
+
+    def __init__(self):
+        self._uf = _UnionFind()
+        self._alias_links = []                     # (提及的键, 别名的键)
+        self._alias_surface = {}                   # 别名的键 -> 首次出现的别名写法
+        self._surface = defaultdict(Counter)       # 键 -> 原始名称计数
+        self._descriptions = defaultdict(Counter)  # 键 -> 描述计数
+        self._mentions = []                        # (事项序号, 实体位置, 键)
+        self._key_to_id = {}
+        self._name_to_id = {}                      # 规范化名称 -> 实体ID(不区分类型)
+        self._entities = {}                        # 实体ID -> 实体记录
+        self._entity_events = defaultdict(list)    # 实体ID -> 事项序号
+        self.stats = {"mentions": 0, "alias_links": 0}
+
+    @staticmethod
+    def _key(entity_type: str, name: str) -> Tuple[str, str]:
+        return (entity_type or "other", normalize_name(name))
+
+    def add_events(self, events: Iterable[Dict], start_index: int = 0):
+        """登记事项中的所有实体提及, 事项序号从 start_index 开始"""
+        for event_index, event in enumerate(events, start_index):
+            for position, entity in enumerate(event.get("entities") or []):
+                name = entity.get("name")
+                if not name:
+                    continue
+                key = self._key(entity.get("type"), name)
+                self._surface[key][name] += 1
+                if entity.get("description"):
+                    self._descriptions[key][entity["description"]] += 1
+                self._mentions.append((event_index, position, key))
+                self.stats["mentions"] += 1
+
+                for alias in extract_aliases(entity):
+                    alias_key = self._key(entity.get("type"), alias)
+                    if len(alias_key[1]) < _MIN_ALIAS_KEY_LENGTH or alias_key == key:
+                        continue
+                    self._alias_links.append((key, alias_key))
+                    self._alias_surface.setdefault(alias_key, alias)
+
+    def _link_aliases(self):
+        """
+        按别名证据合并: 别名本身是某个实体的名称时直接合并;
+        只作为别名出现的, 仅当所有声称它的提及属于同一个实体时才合并(共享 "不详" 之类的别名不能把不同实体连起来)
+        """
+        self._uf = _UnionFind()
+        for key in self._surface:
+            self._uf.add(key)
+        self.stats["alias_links"] = 0
+        claims = defaultdict(set)
+        for key, alias_key in self._alias_links:
+            if alias_key in self._surface:
+                self._uf.union(key, alias_key)
+                self.stats["alias_links"] += 1
+            else:
+                claims[alias_key].add(key)
+        for alias_key, keys in claims.items():
+            if len({self._uf.find(key) for key in keys}) > 1:
+                continue
+            self._uf.add(alias_key)
+            for key in keys:
+                self._uf.union(key, alias_key)
+            self.stats["alias_links"] += len(keys)
+
+    def resolve(self) -> List[Dict]:
+        """
+        合并完成后分配实体ID(按首次出现顺序, 结果稳定)
+        Returns:
+            实体表 [{"id", "type", "name", "aliases", "description", "mentions"}]
+        """
+        self._link_aliases()
+        members = defaultdict(list)
+        for key in self._uf.parent:
+            members[self._uf.find(key)].append(key)
+
+        root_ids = {}
+        self._key_to_id = {}
+        self._name_to_id = {}
+        self._entities = {}
+        self._entity_events = defaultdict(list)
+        for event_index, _, key in self._mentions:
+            root = self._uf.find(key)
+            if root not in root_ids:
+                root_ids[root] = f"E{len(root_ids) + 1}"
+                self._entities[root_ids[root]] = self._build_entity(root_ids[root], members[root])
+            entity_id = root_ids[root]
+            events = self._entity_events[entity_id]
+            if not events or events[-1] != event_index:
+                events.append(event_index)
+        for root, entity_id in root_ids.items():
+            for key in members[root]:
+                self._key_to_id[key] = entity_id
+                self._name_to_id.setdefault(key[1], entity_id)
+        return list(self._entities.values())
+
+    def _build_entity(self, entity_id: str, keys: List[Tuple[str, str]]) -> Dict:
+        surface = Counter()
+        descriptions = Counter()
+        for key in keys:
+            surface.update(self._surface.get(key, {}))
+            descriptions.update(self._descriptions.get(key, {}))
+        # 规范名称: 出现最多的写法, 其次优先中文名、较短的名称
+        ranked = sorted(surface.items(), key=lambda item: (-item[1], not _CJK.search(item[0]), len(item[0]), item[0]))
+        name = ranked[0][0]
+        surface_keys = {normalize_name(n) for n in surface}
+        aliases = sorted({n for n, _ in ranked[1:]} | {self._alias_surface.get(k, k[1]) for k in keys if k[1] not in surface_keys})
+        description = max(descriptions, key=lambda d: (descriptions[d], len(d))) if descriptions else ""
+        return {
+            "id": entity_id,
+            "type": keys[0][0],
+            "name": name,
+            "aliases": [a for a in aliases if normalize_name(a) != normalize_name(name)],
+            "description": description,
+            "mentions": sum(surface.values()),
+        }
+
+    # ===== 查询 =====
+
+    @property
+    def entities(self) -> List[Dict]:
+        return list(self._entities.values())
+
+    def entity_id(self, name: str, entity_type: Optional[str] = None) -> Optional[str]:
+        """按名称(或别名)查实体ID; 不指定类型时返回任一类型下的匹配"""
+        if entity_type is not None:
+            return self._key_to_id.get(self._key(entity_type, name))
+        return self._name_to_id.get(normalize_name(name))
+
+    def get(self, entity_id: str) -> Optional[Dict]:
+        return self._entities.get(entity_id)
+
+    def events_of(self, entity_id: str) -> List[int]:
+        """提及该实体的事项序号"""
+        return self._entity_events.get(entity_id, [])
+
+    # ===== 输出 =====
+
+    def annotate(self, events: List[Dict]):
+        """为事项中的每个实体加上 entity_id(原地修改)"""
+        for event in events:
+            for entity in event.get("entities") or []:
+                if entity.get("name"):
+                    entity["entity_id"] = self._key_to_id.get(self._key(entity.get("type"), entity["name"]))
+
+    def compact(self, events: List[Dict]) -> List[Dict]:
+        """
+        压缩输出: 事项中的实体只保留实体ID和与该事项相关的值(value_type/value/unit),
+        名称、类型、描述见实体表; 同一事项内指向同一实体的提及只保留一次
+        """
+        compacted = []
+        for event in events:
+            refs = {}
+            for entity in event.get("entities") or []:
+                if not entity.get("name"):
+                    continue
+                entity_id = self._key_to_id.get(self._key(entity.get("type"), entity["name"]))
+                ref = refs.setdefault(entity_id, {"id": entity_id})
+                for field in _MENTION_FIELDS:
+                    if entity.get(field) not in (None, "") and field not in ref:
+                        ref[field] = entity[field]
+            compacted.append(dict(event, entities=list(refs.values())))
+        return compacted
+
+    def save(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.entities, f, ensure_ascii=False, indent=2)
+
+    def format_stats(self) -> str:
+        mentions = self.stats["mentions"]
+        count = len(self._entities)
+        ratio = f" ({mentions / count:.2f} 次提及/实体)" if count else ""
+        return f"实体消解: {mentions} 次提及 → {count} 个实体{ratio}, 别名关联 {self.stats['alias_links']} 条"
+
+
+def expand_events(events: Iterable[Dict], entities: Iterable[Dict]) -> List[Dict]:
+    """把压缩输出还原为普通事项(实体名称使用规范名称)"""
+    table = {entity["id"]: entity for entity in entities}
+    expanded = []
+    for event in events:
+        restored = []
+        for ref in event.get("entities") or []:
+            entity = table.get(ref.get("id"), {})
+            item = {"type": entity.get("type"), "name": entity.get("name"), "description": entity.get("description")}
+            item.update({k: v for k, v in ref.items() if k != "id"})
+            item["entity_id"] = ref.get("id")
+            restored.append(item)
+        expanded.append(dict(event, entities=restored))
+    return expanded
+
+
+def main():
+    import argparse
+    import sys
+
+    from event_io import open_events
+
+    if sys.platform == "win32":
+        import codecs
+        sys.stdout = codecs.getwriter("utf-8")(sys.stdout.detach())
+
+    parser = argparse.ArgumentParser(description="跨切片实体消解")
+    parser.add_argument("input", help="抽取结果文件(任意输出格式)")
+    parser.add_argument("--output", help="实体表输出路径(JSON)")
+    parser.add_argument("--lookup", help="按名称或别名查询实体")
+    args = parser.parse_args()
+
+    events = list(open_events(args.input))
+    store = EntityStore()
+    store.add_events(events)
+    store.resolve()
+    print(store.format_stats())
+
+    if args.output:
+        store.save(args.output)
+        print(f"实体表已保存到: {args.output}")
+    if args.lookup:
+        entity_id = store.entity_id(args.lookup)
+        if entity_id is None:
+            print(f"未找到实体: {args.lookup}")
+            return
+        print(json.dumps(store.get(entity_id), ensure_ascii=False, indent=2))
+        for event_index in store.events_of(entity_id):
+            print(f"  - {events[event_index].get('title')}")
+
+
+if __name__ == "__main__":
+    main()
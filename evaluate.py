@@ -8,22 +8,22 @@
 5. 类型频率分布 - 统计各类型的频率
 """
 
-import json
 import os
 from collections import defaultdict, Counter
-from typing import List, Dict
+from typing import Dict, Iterable
 import glob
 from entity_types import get_all_entity_types, get_entity_type_mapping
+from event_io import open_events
 
 
 class EntityEvaluator:
     """实体抽取评估器"""
 
-    def __init__(self, events_data: List[Dict]):
+    def __init__(self, events_data: Iterable[Dict]):
         """
         初始化评估器
         Args:
-            events_data: 提取的事件数据列表
+            events_data: 提取的事件数据列表, 或 event_io.EventReader 惰性读取器(每个指标流式遍历一次)
         """
         self.events = events_data
         self.entity_types = get_all_entity_types()
@@ -346,7 +346,8 @@ def main():
         sys.stdout = codecs.getwriter("utf-8")(sys.stdout.detach())
 
     parser = argparse.ArgumentParser(description="实体抽取评估工具")
-    parser.add_argument("--input", default="extracted_events.json", help="提取结果JSON文件路径")
+    parser.add_argument("--input", default="extracted_events.json",
+                        help="提取结果路径, 支持 .json/.jsonl/.jsonl.zst 文件与 .parquet/.arrow 目录")
     parser.add_argument("--consistency-test", help="一致性测试的MD文件路径")
     parser.add_argument("--consistency-runs", type=int, default=3, help="一致性测试次数")
     parser.add_argument("--output", default="evaluation_report.txt", help="评估报告输出路径")
@@ -358,8 +359,7 @@ def main():
         print(f"错误: 找不到文件 {args.input}")
         return
 
-    with open(args.input, 'r', encoding='utf-8') as f:
-        events = json.load(f)
+    events = open_events(args.input)
 
     print(f"\n已加载 {len(events)} 个事件")
 
@@ -0,0 +1,283 @@
+"""
+事件结果读写
+支持以下输出格式:
+- json:      原有格式, 整个列表一次写入(indent=2)
+- jsonl:     每行一个事件, 可流式写入与读取
+- jsonl.zst: zstd 压缩的 JSONL (需要 zstandard)
+- parquet / arrow: 列式存储, 事件与实体分为两张表, 通过 event_id 关联 (需要 pyarrow)
+  输出路径为目录, 包含 events.<ext> 与 entities.<ext>
+
+读取统一通过 open_events(), 返回可重复迭代的 EventReader, 评估时按需逐条加载
+"""
+
+import io
+import json
+import os
+from typing import Dict, Iterable, Iterator, List
+
+from event_model import to_events
+
+OUTPUT_FORMATS = ["json", "jsonl", "jsonl.zst", "parquet", "arrow"]
+
+# 事件与实体的固定列, 其余字段序列化到 extra 列中
+_EVENT_COLUMNS = ["title", "summary", "content", "category"]
+_ENTITY_COLUMNS = ["type", "name", "description", "value_type", "unit"]
+_BATCH_SIZE = 10000
+
+
+def _require_zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("jsonl.zst 格式需要安装 zstandard: pip install zstandard")
+    return zstandard
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("parquet/arrow 格式需要安装 pyarrow: pip install pyarrow")
+    return pyarrow
+
+
+def detect_format(path: str) -> str:
+    """根据路径推断格式"""
+    if path.endswith('.jsonl.zst'):
+        return "jsonl.zst"
+    if path.endswith('.jsonl'):
+        return "jsonl"
+    if path.endswith('.parquet'):
+        return "parquet"
+    if path.endswith('.arrow'):
+        return "arrow"
+    return "json"
+
+
+def output_path_for(base: str, fmt: str) -> str:
+    """由不带扩展名的文件名生成输出路径, 如 extracted_events + jsonl.zst"""
+    return f"{base}.{fmt}"
+
+
+# ===== 写入 =====
+
+def write_events(path: str, events: Iterable[Dict], fmt: str = None) -> int:
+    """
+    写出事件列表
+    Args:
+        path: 输出路径(parquet/arrow 为目录)
+        events: 事件迭代器
+        fmt: 输出格式, 默认根据扩展名推断
+    Returns:
+        写出的事件数
+    """
+    fmt = fmt or detect_format(path)
+    if fmt == "json":
+        events = list(events)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(events, f, ensure_ascii=False, indent=2)
+        return len(events)
+    if fmt == "jsonl":
+        with open(path, 'w', encoding='utf-8') as f:
+            return _write_jsonl(f, events)
+    if fmt == "jsonl.zst":
+        zstandard = _require_zstd()
+        with open(path, 'wb') as raw:
+            with zstandard.ZstdCompressor(level=3).stream_writer(raw) as compressed:
+                with io.TextIOWrapper(compressed, encoding='utf-8') as f:
+                    return _write_jsonl(f, events)
+    if fmt in ("parquet", "arrow"):
+        return _write_columnar(path, events, fmt)
+    raise ValueError(f"不支持的输出格式: {fmt}")
+
+
+def _write_jsonl(f, events: Iterable[Dict]) -> int:
+    count = 0
+    for event in events:
+        f.write(json.dumps(event, ensure_ascii=False, separators=(',', ':')))
+        f.write('\n')
+        count += 1
+    return count
+
+
+def _split_event(event_id: int, event: Dict):
+    """把一个事件拆成事件行和实体行"""
+    event_row = {"event_id": event_id}
+    for column in _EVENT_COLUMNS:
+        event_row[column] = event.get(column)
+    event_row["references"] = [str(r) for r in event.get("references", []) or []]
+    event_row["is_valid"] = event.get("is_valid")
+    extra = {k: v for k, v in event.items()
+             if k not in _EVENT_COLUMNS and k not in ("references", "is_valid", "entities")}
+    event_row["extra"] = json.dumps(extra, ensure_ascii=False) if extra else None
+
+    entity_rows = []
+    for position, entity in enumerate(event.get("entities", []) or []):
+        row = {"event_id": event_id, "position": position}
+        for column in _ENTITY_COLUMNS:
+            row[column] = entity.get(column)
+        value = entity.get("value")
+        row["value"] = None if value is None else json.dumps(value, ensure_ascii=False)
+        extra = {k: v for k, v in entity.items() if k not in _ENTITY_COLUMNS and k != "value"}
+        row["extra"] = json.dumps(extra, ensure_ascii=False) if extra else None
+        entity_rows.append(row)
+    return event_row, entity_rows
+
+
+def _columnar_schemas(pa):
+    event_schema = pa.schema(
+        [("event_id", pa.int64())]
+        + [(c, pa.string()) for c in _EVENT_COLUMNS]
+        + [("references", pa.list_(pa.string())), ("is_valid", pa.bool_()), ("extra", pa.string())]
+    )
+    entity_schema = pa.schema(
+        [("event_id", pa.int64()), ("position", pa.int32())]
+        + [(c, pa.string()) for c in _ENTITY_COLUMNS]
+        + [("value", pa.string()), ("extra", pa.string())]
+    )
+    return event_schema, entity_schema
+
+
+def _write_columnar(path: str, events: Iterable[Dict], fmt: str) -> int:
+    pa = _require_pyarrow()
+    event_schema, entity_schema = _columnar_schemas(pa)
+    os.makedirs(path, exist_ok=True)
+
+    if fmt == "parquet":
+        event_writer = pa.parquet.ParquetWriter(os.path.join(path, "events.parquet"), event_schema)
+        entity_writer = pa.parquet.ParquetWriter(os.path.join(path, "entities.parquet"), entity_schema)
+    else:
+        event_writer = pa.ipc.new_file(os.path.join(path, "events.arrow"), event_schema)
+        entity_writer = pa.ipc.new_file(os.path.join(path, "entities.arrow"), entity_schema)
+
+    count = 0
+    event_rows, entity_rows = [], []
+
+    def flush():
+        if event_rows:
+            event_writer.write_table(pa.Table.from_pylist(event_rows, schema=event_schema))
+            event_rows.clear()
+        if entity_rows:
+            entity_writer.write_table(pa.Table.from_pylist(entity_rows, schema=entity_schema))
+            entity_rows.clear()
+
+    try:
+        for event in events:
+            event_row, rows = _split_event(count, event)
+            event_rows.append(event_row)
+            entity_rows.extend(rows)
+            count += 1
+            if len(event_rows) >= _BATCH_SIZE:
+                flush()
+        flush()
+    finally:
+        event_writer.close()
+        entity_writer.close()
+    return count
+
+
+# ===== 读取 =====
+
+class EventReader:
+    """
+    惰性事件读取器
+    每次迭代都重新从文件流式读取, 不在内存中保留全部事件, 可被 EntityEvaluator 多次遍历
+    """
+
+    def __init__(self, path: str, fmt: str = None):
+        self.path = path
+        self.fmt = fmt or detect_format(path)
+        if self.fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"不支持的输入格式: {self.fmt}")
+        self._length = None
+        self._cached = None
+
+    def __iter__(self) -> Iterator[Dict]:
+        if self.fmt == "json":
+            # 普通 JSON 无法流式解析, 首次读取后以紧凑的 Event 表示缓存(映射接口与字典相同)
+            if self._cached is None:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._cached = to_events(json.load(f))
+            yield from self._cached
+        elif self.fmt == "jsonl":
+            with open(self.path, 'r', encoding='utf-8') as f:
+                yield from _iter_jsonl(f)
+        elif self.fmt == "jsonl.zst":
+            zstandard = _require_zstd()
+            with open(self.path, 'rb') as raw:
+                with zstandard.ZstdDecompressor().stream_reader(raw) as decompressed:
+                    yield from _iter_jsonl(io.TextIOWrapper(decompressed, encoding='utf-8'))
+        else:
+            yield from self._iter_columnar()
+
+    def __len__(self) -> int:
+        if self._length is None:
+            if self.fmt in ("parquet", "arrow"):
+                self._length = self._open_table("events").num_rows
+            else:
+                self._length = sum(1 for _ in self)
+        return self._length
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def _open_table(self, name: str):
+        """以内存映射方式打开列式表"""
+        pa = _require_pyarrow()
+        file_path = os.path.join(self.path, f"{name}.{self.fmt}")
+        if self.fmt == "parquet":
+            return pa.parquet.read_table(file_path, memory_map=True)
+        return pa.ipc.open_file(pa.memory_map(file_path, 'r')).read_all()
+
+    def _iter_columnar(self) -> Iterator[Dict]:
+        events_table = self._open_table("events")
+        entities_table = self._open_table("entities")
+
+        # 两张表都按 event_id 顺序写入, 归并连接即可, 无需建立索引
+        entity_iter = _iter_rows(entities_table)
+        pending = next(entity_iter, None)
+        for row in _iter_rows(events_table):
+            event_id = row.pop("event_id")
+            extra = row.pop("extra")
+            event = {k: v for k, v in row.items() if v is not None}
+            if extra:
+                event.update(json.loads(extra))
+            entities = []
+            while pending is not None and pending["event_id"] == event_id:
+                entities.append(_restore_entity(pending))
+                pending = next(entity_iter, None)
+            event["entities"] = entities
+            yield event
+
+
+def _iter_jsonl(f) -> Iterator[Dict]:
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def _iter_rows(table) -> Iterator[Dict]:
+    for batch in table.to_batches(max_chunksize=_BATCH_SIZE):
+        yield from batch.to_pylist()
+
+
+def _restore_entity(row: Dict) -> Dict:
+    entity = {k: row[k] for k in _ENTITY_COLUMNS if row.get(k) is not None}
+    if row.get("value") is not None:
+        entity["value"] = json.loads(row["value"])
+    if row.get("extra"):
+        entity.update(json.loads(row["extra"]))
+    return entity
+
+
+def open_events(path: str, fmt: str = None) -> EventReader:
+    """打开事件文件, 返回惰性读取器"""
+    return EventReader(path, fmt)
+
+
+def load_events(path: str, fmt: str = None) -> List[Dict]:
+    """一次性读取全部事件"""
+    return list(open_events(path, fmt))
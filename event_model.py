@@ -0,0 +1,199 @@
+"""
+紧凑的事件/实体内存表示
+流水线中每个事件原本是一个字符串字典, 内含实体字典列表; all_events 与去重过程中的副本同时驻留内存,
+每个字典都要保存自己的键表, 实体类型、单位、切片ID等大量重复的短字符串也各自占用一份内存。
+
+这里用 __slots__ 类表示事件与实体:
+- 固定字段存在槽位中, 没有每个对象一份的 __dict__; 缺失的字段不占槽位值(读取时按不存在处理)
+- 实体类型、名称、描述、值类型、单位、实体ID、事件类别和切片ID经 sys.intern 驻留, 相同取值只保存一份
+- 流水线附加的段落溯源(provenance, 见 provenance.py)也占一个槽位, 同一切片的事项共享同一份列表
+- schema 之外的其他字段放在 _extra 字典中(通常为空, 不分配)
+Event / Entity 实现了与 dict 相同的映射接口(get、[]、in、keys、items、赋值), 去重、合并、实体消解、
+评估等按字典读取事件的代码无需修改; 只在输入输出边界(JSON 序列化、清单、数据库)用 to_dict 转回字典。
+
+运行本模块可对比两种表示的内存占用:
+    python event_model.py
+"""
+
+import sys
+from collections.abc import MutableMapping
+from typing import Dict, Iterable, Iterator, List
+
+# 需要驻留的短字符串字段(取值大量重复)
+_INTERNED_ENTITY_FIELDS = frozenset(("type", "name", "description", "value_type", "unit", "entity_id"))
+_INTERNED_EVENT_FIELDS = frozenset(("category",))
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+class _SlotRecord(MutableMapping):
+    """槽位记录的公共映射接口: 子类定义 _FIELDS(固定字段) 与 _INTERNED(驻留字段)"""
+
+    __slots__ = ("_extra",)
+    _FIELDS = ()
+    _INTERNED = frozenset()
+
+    def __init__(self, data: Dict = None):
+        self._extra = None
+        if data:
+            for key, value in data.items():
+                self[key] = value
+
+    def __getitem__(self, key):
+        if key in self._FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def get(self, key, default=None):
+        if key in self._FIELDS:
+            return getattr(self, key, default)
+        if self._extra is None:
+            return default
+        return self._extra.get(key, default)
+
+    def __setitem__(self, key, value):
+        if key in self._FIELDS:
+            setattr(self, key, self._convert(key, value))
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._FIELDS:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is None:
+            raise KeyError(key)
+        else:
+            del self._extra[key]
+            if not self._extra:
+                self._extra = None
+
+    def __contains__(self, key):
+        if key in self._FIELDS:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self) -> Iterator[str]:
+        for field in self._FIELDS:
+            if hasattr(self, field):
+                yield field
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def _convert(self, key, value):
+        return _intern(value) if key in self._INTERNED else value
+
+    def to_dict(self) -> Dict:
+        return {key: self[key] for key in self}
+
+    def __repr__(self):
+        # 与 dict 的 repr 一致, 按 str() 长度比较字段的代码(如 _merge_events)结果不变
+        return repr(self.to_dict())
+
+
+class Entity(_SlotRecord):
+    __slots__ = ("type", "name", "description", "value_type", "value", "unit", "entity_id")
+    _FIELDS = __slots__
+    _INTERNED = _INTERNED_ENTITY_FIELDS
+
+
+class Event(_SlotRecord):
+    __slots__ = ("title", "summary", "content", "category", "references", "entities", "is_valid", "provenance")
+    _FIELDS = __slots__
+    _INTERNED = _INTERNED_EVENT_FIELDS
+
+    def _convert(self, key, value):
+        if key == "entities" and isinstance(value, list):
+            return [e if isinstance(e, Entity) else Entity(e) if isinstance(e, dict) else e for e in value]
+        if key == "references" and isinstance(value, list):
+            return [_intern(r) for r in value]
+        return super()._convert(key, value)
+
+    def to_dict(self) -> Dict:
+        data = {}
+        for key in self:
+            value = self[key]
+            if key == "entities" and isinstance(value, list):
+                value = [e.to_dict() if isinstance(e, Entity) else e for e in value]
+            elif key in ("references", "provenance") and isinstance(value, list):
+                value = list(value)
+            data[key] = value
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Event":
+        return data if isinstance(data, cls) else cls(data)
+
+
+def to_events(events: Iterable[Dict]) -> List[Event]:
+    """字典事件 -> Event(已是 Event 的原样保留)"""
+    return [Event.from_dict(e) for e in events]
+
+
+def iter_dicts(events: Iterable) -> Iterator[Dict]:
+    """Event -> 字典, 惰性转换, 用于写出结果等输出边界"""
+    for event in events:
+        yield event.to_dict() if isinstance(event, Event) else event
+
+
+def _self_check(count: int = 20000):
+    """往返一致性与内存对比"""
+    import json
+    import tracemalloc
+
+    def sample(i):
+        return {
+            "title": f"第{i}届全国运动会开幕",
+            "summary": f"第{i}届全国运动会在某市开幕, 共设 {i % 40} 个大项",
+            "content": f"第{i}届全国运动会于某日在某市体育中心开幕。" * 3,
+            "category": "体育赛事",
+            "references": [f"doc_{i // 10}.md_slice_{i % 10 + 1}"],
+            "entities": [
+                {"type": "event", "name": "全国运动会", "description": "综合性运动会"},
+                {"type": "time", "name": "开幕时间", "description": "开幕日期",
+                 "value_type": "datetime", "value": f"20{i % 25:02d}-09-10"},
+                {"type": "metric", "name": "大项数量", "description": "比赛大项",
+                 "value_type": "int", "value": str(i % 40), "unit": "项"},
+            ],
+            "is_valid": True,
+            "person": "张三,李四",
+        }
+
+    text = json.dumps([sample(i) for i in range(count)], ensure_ascii=False)
+
+    tracemalloc.start()
+    dicts = json.loads(text)
+    dict_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    events = to_events(json.loads(text))
+    event_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    assert list(iter_dicts(events)) == dicts, "往返结果不一致"
+    event = events[0]
+    assert event.get("person") == "张三,李四" and "summary" in event and "missing" not in event
+    assert str(event["entities"]) == str(dicts[0]["entities"])
+    assert events[1]["entities"][0]["type"] is events[2]["entities"][0]["type"]
+    print("往返一致性检查通过")
+    print(f"{count} 个事件内存占用: 字典 {dict_size / 1e6:.1f}MB, Event {event_size / 1e6:.1f}MB "
+          f"({event_size / dict_size:.0%})")
+
+
+if __name__ == "__main__":
+    _self_check()
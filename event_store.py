@@ -0,0 +1,376 @@
+"""
+SQLite 事件存储
+把抽取结果(事件、实体、来源引用)写入本地 SQLite 数据库:
+- events_fts: FTS5 全文索引 (title / summary / content), 中文使用 trigram 分词
+- entities(type, name) 与 event_references(reference) 上建立 B-tree 索引
+支持批量事务写入, 以及按全文/实体/来源文件/引用ID查询
+
+命令行用法:
+    python event_store.py --db events.db import extracted_events.json
+    python event_store.py --db events.db search 自行车锦标赛
+    python event_store.py --db events.db entity 北京大学 --type organization
+    python event_store.py --db events.db file 0999996_2023年亚洲场地自行车锦标赛.md
+"""
+
+import json
+import sqlite3
+from typing import Dict, Iterable, List, Optional
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS events (
+    id          INTEGER PRIMARY KEY,
+    title       TEXT,
+    summary     TEXT,
+    content     TEXT,
+    category    TEXT,
+    is_valid    INTEGER,
+    source_file TEXT,
+    extra       TEXT
+);
+CREATE TABLE IF NOT EXISTS entities (
+    id          INTEGER PRIMARY KEY,
+    event_id    INTEGER NOT NULL REFERENCES events(id),
+    position    INTEGER,
+    type        TEXT,
+    name        TEXT,
+    description TEXT,
+    value_type  TEXT,
+    value       TEXT,
+    unit        TEXT
+);
+CREATE TABLE IF NOT EXISTS event_references (
+    event_id    INTEGER NOT NULL REFERENCES events(id),
+    reference   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entities_type_name ON entities(type, name);
+CREATE INDEX IF NOT EXISTS idx_entities_name ON entities(name);
+CREATE INDEX IF NOT EXISTS idx_entities_event ON entities(event_id);
+CREATE INDEX IF NOT EXISTS idx_references_reference ON event_references(reference);
+CREATE INDEX IF NOT EXISTS idx_references_event ON event_references(event_id);
+CREATE INDEX IF NOT EXISTS idx_events_source_file ON events(source_file);
+"""
+
+_FTS_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5(
+    title, summary, content,
+    content='events', content_rowid='id', tokenize='{tokenizer}'
+)
+"""
+
+_EVENT_FIELDS = ("title", "summary", "content", "category", "is_valid", "references", "entities")
+_ENTITY_FIELDS = ("type", "name", "description", "value_type", "value", "unit")
+
+# trigram 分词无法匹配少于3个字符的查询, 此时退化为 LIKE
+_TRIGRAM_MIN_QUERY = 3
+
+
+def source_file_of(reference: str) -> str:
+    """从切片ID(如 xxx.md_slice_3)中还原来源文件名"""
+    return reference.rsplit('_slice_', 1)[0]
+
+
+def event_source_file(event: Dict) -> Optional[str]:
+    """
+    事件的来源文件: 优先取段落溯源中的文档路径(相对数据文件夹, 不同子文件夹的同名文件不会混淆),
+    没有溯源字段的旧结果退化为切片ID中的文件名
+    """
+    for span in event.get("provenance") or []:
+        if span.get("document"):
+            return span["document"]
+    references = event.get("references") or []
+    return source_file_of(str(references[0])) if references else None
+
+
+class EventStore:
+    """SQLite 事件存储"""
+
+    def __init__(self, db_path: str):
+        """
+        打开(或创建)事件数据库
+        Args:
+            db_path: 数据库文件路径
+        """
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA_SQL)
+        self.tokenizer = self._create_fts()
+
+    def _create_fts(self) -> str:
+        row = self.conn.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'events_fts'"
+        ).fetchone()
+        if row is not None:
+            return "trigram" if "trigram" in row["sql"] else "unicode61"
+        try:
+            self.conn.execute(_FTS_SQL.format(tokenizer="trigram"))
+            return "trigram"
+        except sqlite3.OperationalError:
+            # SQLite < 3.34 不支持 trigram 分词
+            self.conn.execute(_FTS_SQL.format(tokenizer="unicode61"))
+            return "unicode61"
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ===== 写入 =====
+
+    def insert_events(self, events: Iterable[Dict], batch_size: int = 5000) -> int:
+        """
+        批量写入事件, 每批一个事务
+        Returns:
+            写入的事件数
+        """
+        count = 0
+        batch = []
+        for event in events:
+            batch.append(event)
+            if len(batch) >= batch_size:
+                count += self._insert_batch(batch)
+                batch = []
+        if batch:
+            count += self._insert_batch(batch)
+        return count
+
+    def replace_events(self, events: Iterable[Dict], source_files: Iterable[str] = (),
+                       batch_size: int = 5000) -> int:
+        """
+        写入事件, 先删除这些事件来源文件的已有记录; 对同一批语料重复运行时结果不会重复
+        Args:
+            source_files: 本次处理过的全部文件(相对路径), 其中这次没有抽取到事件的文件也清除旧记录
+        Returns:
+            写入的事件数
+        """
+        events = list(events)
+        self.delete_source_files(set(source_files) | {event_source_file(e) for e in events})
+        return self.insert_events(events, batch_size)
+
+    def delete_source_files(self, source_files: Iterable[Optional[str]]) -> int:
+        """
+        删除来源文件的全部事件(及其实体、引用和全文索引)
+        Returns:
+            删除的事件数
+        """
+        deleted = 0
+        with self.conn:
+            for source_file in source_files:
+                ids = "SELECT id FROM events WHERE source_file IS ?"
+                # 外部内容的 FTS 表需要用原内容写入 delete 命令
+                self.conn.execute(
+                    "INSERT INTO events_fts (events_fts, rowid, title, summary, content) "
+                    "SELECT 'delete', id, title, summary, content FROM events WHERE source_file IS ?",
+                    (source_file,)
+                )
+                self.conn.execute(f"DELETE FROM entities WHERE event_id IN ({ids})", (source_file,))
+                self.conn.execute(f"DELETE FROM event_references WHERE event_id IN ({ids})", (source_file,))
+                deleted += self.conn.execute("DELETE FROM events WHERE source_file IS ?", (source_file,)).rowcount
+        return deleted
+
+    def _insert_batch(self, events: List[Dict]) -> int:
+        with self.conn:
+            cursor = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM events")
+            next_id = cursor.fetchone()[0] + 1
+
+            event_rows, entity_rows, reference_rows = [], [], []
+            for offset, event in enumerate(events):
+                event_id = next_id + offset
+                references = [str(r) for r in event.get("references", []) or []]
+                extra = {k: v for k, v in event.items() if k not in _EVENT_FIELDS}
+                event_rows.append((
+                    event_id,
+                    event.get("title"),
+                    event.get("summary"),
+                    event.get("content"),
+                    event.get("category"),
+                    None if event.get("is_valid") is None else int(bool(event.get("is_valid"))),
+                    event_source_file(event),
+                    json.dumps(extra, ensure_ascii=False) if extra else None,
+                ))
+                reference_rows.extend((event_id, r) for r in references)
+                for position, entity in enumerate(event.get("entities", []) or []):
+                    value = entity.get("value")
+                    entity_rows.append((
+                        event_id,
+                        position,
+                        entity.get("type"),
+                        entity.get("name"),
+                        entity.get("description"),
+                        entity.get("value_type"),
+                        None if value is None else json.dumps(value, ensure_ascii=False),
+                        entity.get("unit"),
+                    ))
+
+            self.conn.executemany(
+                "INSERT INTO events (id, title, summary, content, category, is_valid, source_file, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                event_rows
+            )
+            self.conn.executemany(
+                "INSERT INTO entities (event_id, position, type, name, description, value_type, value, unit) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                entity_rows
+            )
+            self.conn.executemany(
+                "INSERT INTO event_references (event_id, reference) VALUES (?, ?)",
+                reference_rows
+            )
+            self.conn.execute(
+                "INSERT INTO events_fts (rowid, title, summary, content) "
+                "SELECT id, title, summary, content FROM events WHERE id >= ?",
+                (next_id,)
+            )
+        return len(events)
+
+    # ===== 查询 =====
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    def search(self, query: str, limit: int = 20) -> List[Dict]:
+        """全文检索 title / summary / content"""
+        if self.tokenizer == "trigram" and len(query) < _TRIGRAM_MIN_QUERY:
+            pattern = f"%{query}%"
+            rows = self.conn.execute(
+                "SELECT id FROM events WHERE title LIKE ? OR summary LIKE ? OR content LIKE ? "
+                "ORDER BY id LIMIT ?",
+                (pattern, pattern, pattern, limit)
+            ).fetchall()
+        else:
+            # 整体作为短语检索, 避免查询中的标点被解析为 FTS 语法
+            phrase = '"' + query.replace('"', '""') + '"'
+            rows = self.conn.execute(
+                "SELECT rowid AS id FROM events_fts WHERE events_fts MATCH ? ORDER BY rank LIMIT ?",
+                (phrase, limit)
+            ).fetchall()
+        return self.get_events([row["id"] for row in rows])
+
+    def find_by_entity(self, name: str, entity_type: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        """查询提及某实体的事件"""
+        if entity_type:
+            rows = self.conn.execute(
+                "SELECT DISTINCT event_id FROM entities WHERE type = ? AND name = ? LIMIT ?",
+                (entity_type, name, limit)
+            ).fetchall()
+        else:
+            rows = self.conn.execute(
+                "SELECT DISTINCT event_id FROM entities WHERE name = ? LIMIT ?",
+                (name, limit)
+            ).fetchall()
+        return self.get_events([row["event_id"] for row in rows])
+
+    def find_by_reference(self, reference: str, limit: int = 100) -> List[Dict]:
+        """查询来自某个切片的事件"""
+        rows = self.conn.execute(
+            "SELECT DISTINCT event_id FROM event_references WHERE reference = ? LIMIT ?",
+            (reference, limit)
+        ).fetchall()
+        return self.get_events([row["event_id"] for row in rows])
+
+    def find_by_file(self, file_name: str, limit: int = 1000) -> List[Dict]:
+        """查询来自某个文件的事件, file_name 可以是相对数据文件夹的路径或文件名"""
+        rows = self.conn.execute(
+            "SELECT id FROM events WHERE source_file = ? OR substr(source_file, -?) = ? ORDER BY id LIMIT ?",
+            (file_name, len(file_name) + 1, "/" + file_name, limit)
+        ).fetchall()
+        return self.get_events([row["id"] for row in rows])
+
+    def get_events(self, event_ids: List[int]) -> List[Dict]:
+        """按ID取回完整事件(保持传入顺序)"""
+        if not event_ids:
+            return []
+        placeholders = ",".join("?" * len(event_ids))
+        events = {}
+        for row in self.conn.execute(
+            f"SELECT * FROM events WHERE id IN ({placeholders})", event_ids
+        ):
+            event = {
+                "id": row["id"],
+                "title": row["title"],
+                "summary": row["summary"],
+                "content": row["content"],
+                "category": row["category"],
+                "references": [],
+                "entities": [],
+            }
+            if row["is_valid"] is not None:
+                event["is_valid"] = bool(row["is_valid"])
+            if row["extra"]:
+                event.update(json.loads(row["extra"]))
+            events[row["id"]] = event
+
+        for row in self.conn.execute(
+            f"SELECT event_id, reference FROM event_references WHERE event_id IN ({placeholders}) "
+            f"ORDER BY rowid", event_ids
+        ):
+            events[row["event_id"]]["references"].append(row["reference"])
+
+        for row in self.conn.execute(
+            f"SELECT * FROM entities WHERE event_id IN ({placeholders}) ORDER BY event_id, position",
+            event_ids
+        ):
+            entity = {k: row[k] for k in _ENTITY_FIELDS if row[k] is not None}
+            if "value" in entity:
+                entity["value"] = json.loads(entity["value"])
+            events[row["event_id"]]["entities"].append(entity)
+
+        return [events[i] for i in event_ids if i in events]
+
+
+def main():
+    """命令行查询工具"""
+    import argparse
+    from event_io import open_events
+
+    parser = argparse.ArgumentParser(description="SQLite 事件存储")
+    parser.add_argument("--db", default="extracted_events.db", help="数据库文件路径")
+    parser.add_argument("--limit", type=int, default=20, help="最多返回的事件数")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p_import = subparsers.add_parser("import", help="导入抽取结果")
+    p_import.add_argument("input", help="抽取结果路径(json/jsonl/jsonl.zst/parquet/arrow)")
+    p_import.add_argument("--replace", action="store_true", help="先删除这些事件来源文件的已有记录(重复导入不产生重复事件)")
+
+    p_search = subparsers.add_parser("search", help="全文检索")
+    p_search.add_argument("query")
+
+    p_entity = subparsers.add_parser("entity", help="按实体查询")
+    p_entity.add_argument("name")
+    p_entity.add_argument("--type", help="实体类型, 如 organization")
+
+    p_file = subparsers.add_parser("file", help="按来源文件查询")
+    p_file.add_argument("file_name")
+
+    p_ref = subparsers.add_parser("ref", help="按切片ID查询")
+    p_ref.add_argument("reference")
+
+    args = parser.parse_args()
+
+    with EventStore(args.db) as store:
+        if args.command == "import":
+            events = open_events(args.input)
+            count = store.replace_events(events) if args.replace else store.insert_events(events)
+            print(f"已导入 {count} 个事件, 数据库共 {store.count()} 个事件")
+            return
+        if args.command == "search":
+            events = store.search(args.query, limit=args.limit)
+        elif args.command == "entity":
+            events = store.find_by_entity(args.name, args.type, limit=args.limit)
+        elif args.command == "file":
+            events = store.find_by_file(args.file_name, limit=args.limit)
+        else:
+            events = store.find_by_reference(args.reference, limit=args.limit)
+
+    print(f"共找到 {len(events)} 个事件")
+    print(json.dumps(events, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
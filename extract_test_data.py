@@ -7,17 +7,122 @@
 
 import os
 import json
-import glob
-import random
+import heapq
+import hashlib
 import shutil
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+COPY_MODES = ["copy", "hardlink", "reflink"]
+
+# Linux FICLONE ioctl: 在支持写时复制的文件系统(btrfs/xfs)上克隆文件, 不复制数据块
+_FICLONE = 0x40049409
+
+
+def _sample_key(seed: int, relative_path: str) -> int:
+    """文件的抽样优先级: 只取决于种子和以 '/' 分隔的相对路径, 与目录遍历顺序和操作系统无关"""
+    digest = hashlib.blake2b(f"{seed}:{relative_path}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def _size_bucket(size: int) -> int:
+    """按 log2(文件大小) 分层"""
+    return max(0, size.bit_length() - 1)
+
+
+def sample_folder(folder_path: str, folder_name: str, n_sample: int, seed: int,
+                  stratify_by_size: bool = False):
+    """
+    流式抽样一个子文件夹中的 md 文件(bottom-k 蓄水池抽样)
+    逐个遍历目录项, 只在堆中保留优先级最小的 n_sample 个文件, 内存与文件总数无关;
+    优先级由 (种子, 相对路径) 的哈希决定, 因此同一种子的抽样结果可重复, 且不受文件系统遍历顺序影响。
+    按大小分层时, 每层各保留一个堆, 最后按各层文件数比例分配名额。
+
+    返回:
+        (抽中的相对路径列表, 文件总数, 各层 {层号: 文件数})
+    """
+    # 堆中保存 (-优先级, 相对路径), 堆顶是当前保留的优先级最大的文件
+    reservoirs = {}
+    bucket_counts = {}
+    total = 0
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".md") or entry.name.startswith(".") or not entry.is_file():
+                continue
+            total += 1
+            relative_path = os.path.join(folder_name, entry.name)
+            bucket = _size_bucket(entry.stat().st_size) if stratify_by_size else 0
+            bucket_counts[bucket] = bucket_counts.get(bucket, 0) + 1
+
+            heap = reservoirs.setdefault(bucket, [])
+            item = (-_sample_key(seed, f"{folder_name}/{entry.name}"), relative_path)
+            if len(heap) < n_sample:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+    quotas = _allocate(bucket_counts, min(n_sample, total))
+    selected = []
+    for bucket, quota in quotas.items():
+        ranked = sorted(reservoirs[bucket], reverse=True)
+        selected.extend(path for _, path in ranked[:quota])
+    return sorted(selected), total, bucket_counts
+
+
+def _allocate(bucket_counts, n_sample):
+    """按各层文件数比例分配抽样名额(最大余数法), 每层至多分到该层文件数"""
+    total = sum(bucket_counts.values())
+    if total == 0:
+        return {}
+    quotas = {b: n_sample * c // total for b, c in bucket_counts.items()}
+    remainders = sorted(
+        bucket_counts, key=lambda b: (-(n_sample * bucket_counts[b] % total), b)
+    )
+    for bucket in remainders[:n_sample - sum(quotas.values())]:
+        quotas[bucket] += 1
+    return quotas
+
+
+def _reflink(source: str, destination: str):
+    import fcntl
+
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+    shutil.copystat(source, destination)
+
+
+def place_file(source: str, destination: str, mode: str = "copy") -> str:
+    """
+    把文件放到目标位置; hardlink/reflink 不支持时(跨设备、文件系统不支持、Windows)退回普通复制
+    返回实际使用的方式
+    """
+    if os.path.exists(destination):
+        os.remove(destination)
+    if mode == "hardlink":
+        try:
+            os.link(source, destination)
+            return "hardlink"
+        except OSError:
+            pass
+    elif mode == "reflink":
+        try:
+            _reflink(source, destination)
+            return "reflink"
+        except (ImportError, OSError):
+            if os.path.exists(destination):
+                os.remove(destination)
+    shutil.copy2(source, destination)
+    return "copy"
+
+
 def extract_test_data(
     data_folder: str,
     output_folder: str,
     n_per_folder: int = 10,
-    seed: int = 42
+    seed: int = 42,
+    stratify_by_size: bool = False,
+    copy_mode: str = "copy",
+    workers: int = 16
 ):
     """
     从数据文件夹中抽取测试样本
@@ -27,9 +132,12 @@ def extract_test_data(
         output_folder: 输出文件夹路径
         n_per_folder: 每个子文件夹抽取的文件数
         seed: 随机种子,保证可重复性
+        stratify_by_size: 是否按文件大小(log2 分层)分层抽样
+        copy_mode: copy=复制, hardlink=硬链接, reflink=写时复制克隆
+        workers: 并行遍历/复制的线程数
     """
-    # 设置随机种子
-    random.seed(seed)
+    if copy_mode not in COPY_MODES:
+        raise ValueError(f"不支持的复制方式: {copy_mode}")
 
     # 创建输出文件夹
     os.makedirs(output_folder, exist_ok=True)
@@ -41,75 +149,77 @@ def extract_test_data(
     print(f"输出文件夹: {output_folder}")
     print(f"每个子文件夹抽取: {n_per_folder} 个文件")
     print(f"随机种子: {seed}")
+    print(f"按大小分层: {'是' if stratify_by_size else '否'}")
+    print(f"复制方式: {copy_mode}")
     print(f"{'='*80}\n")
 
-    # 按子文件夹分组
-    files_by_folder = defaultdict(list)
-
     # 获取所有子文件夹
-    for subfolder in os.scandir(data_folder):
-        if subfolder.is_dir():
-            # 获取该文件夹下的所有md文件
-            md_files = glob.glob(os.path.join(subfolder.path, "*.md"))
-            if md_files:
-                files_by_folder[subfolder.name] = md_files
-
-    print(f"找到 {len(files_by_folder)} 个子文件夹")
-    print("="*80)
+    subfolders = sorted(
+        (entry.name, entry.path) for entry in os.scandir(data_folder) if entry.is_dir()
+    )
+
+    # 各子文件夹并行流式抽样
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(pool.map(
+            lambda folder: sample_folder(folder[1], folder[0], n_per_folder, seed, stratify_by_size),
+            subfolders
+        ))
 
-    # 从每个文件夹抽取文件
     selected_files = []
     folder_stats = {}
-
-    for folder_name, md_files in sorted(files_by_folder.items()):
-        n_sample = min(n_per_folder, len(md_files))
-        selected = random.sample(md_files, n_sample)
+    for (folder_name, _), (selected, total, bucket_counts) in zip(subfolders, results):
+        if total == 0:
+            continue
         selected_files.extend(selected)
-
         folder_stats[folder_name] = {
-            "total_files": len(md_files),
-            "selected_files": n_sample,
+            "total_files": total,
+            "selected_files": len(selected),
             "files": [os.path.basename(f) for f in selected]
         }
+        if stratify_by_size:
+            folder_stats[folder_name]["size_buckets"] = {
+                f"{2 ** b}B+": count for b, count in sorted(bucket_counts.items())
+            }
 
-        print(f"  {folder_name}: 抽取 {n_sample}/{len(md_files)} 个文件")
+    print(f"找到 {len(folder_stats)} 个子文件夹")
+    print("="*80)
+    for folder_name, stats in folder_stats.items():
+        print(f"  {folder_name}: 抽取 {stats['selected_files']}/{stats['total_files']} 个文件")
 
     print(f"\n共抽取 {len(selected_files)} 个文件")
     print("="*80)
 
-    # 复制文件到输出文件夹
+    # 并行复制文件到输出文件夹, 保持原有的文件夹结构
     print("\n开始复制文件...")
-    copied_files = []
-
-    for file_path in selected_files:
-        # 保持原有的文件夹结构
-        relative_path = os.path.relpath(file_path, data_folder)
-        output_path = os.path.join(output_folder, relative_path)
-
-        # 创建目标文件夹
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    for folder_name in folder_stats:
+        os.makedirs(os.path.join(output_folder, folder_name), exist_ok=True)
+
+    def place(relative_path):
+        return place_file(
+            os.path.join(data_folder, relative_path),
+            os.path.join(output_folder, relative_path),
+            copy_mode
+        )
 
-        # 复制文件
-        shutil.copy2(file_path, output_path)
-        copied_files.append({
-            "source": file_path,
-            "destination": output_path,
-            "relative_path": relative_path
-        })
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        used_modes = list(pool.map(place, selected_files))
 
-    print(f"已复制 {len(copied_files)} 个文件")
+    fallback = sum(1 for mode in used_modes if mode != copy_mode)
+    print(f"已复制 {len(selected_files)} 个文件" + (f" (其中 {fallback} 个退回普通复制)" if fallback else ""))
 
-    # 生成元数据文件
+    # 生成元数据文件: 除抽取时间外, 同样的源数据和参数总是得到相同的内容
     metadata = {
         "extraction_date": datetime.now().isoformat(),
         "source_folder": data_folder,
         "output_folder": output_folder,
         "n_per_folder": n_per_folder,
         "random_seed": seed,
-        "total_folders": len(files_by_folder),
+        "sampling": "bottom-k-hash",
+        "stratify_by_size": stratify_by_size,
+        "total_folders": len(folder_stats),
         "total_files": len(selected_files),
         "folder_stats": folder_stats,
-        "file_list": [f["relative_path"] for f in copied_files]
+        "file_list": selected_files
     }
 
     metadata_path = os.path.join(output_folder, "metadata.json")
@@ -187,6 +297,23 @@ def main():
         default=42,
         help="随机种子"
     )
+    parser.add_argument(
+        "--stratify-size",
+        action="store_true",
+        help="按文件大小(log2 分层)分层抽样, 让长短文档在测试集中按原比例出现"
+    )
+    parser.add_argument(
+        "--copy-mode",
+        choices=COPY_MODES,
+        default="copy",
+        help="文件放置方式: copy=复制, hardlink=硬链接(同一文件系统), reflink=写时复制克隆(btrfs/xfs)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=16,
+        help="并行遍历/复制的线程数"
+    )
 
     args = parser.parse_args()
 
@@ -204,7 +331,10 @@ def main():
             data_folder=args.data_folder,
             output_folder=args.output_folder,
             n_per_folder=args.n_per_folder,
-            seed=args.seed
+            seed=args.seed,
+            stratify_by_size=args.stratify_size,
+            copy_mode=args.copy_mode,
+            workers=args.workers
         )
 
     elif args.action == "list":
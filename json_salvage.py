@@ -0,0 +1,195 @@
+"""
+模型输出 JSON 容错解析
+模型输出可能因 max_tokens 被截断或夹杂轻微格式错误, 直接 json.loads 失败会丢掉其中所有完整事项。
+这里逐字符扫描 events 数组, 恢复每一个已经完整闭合的事项对象, 并记录截断位置,
+供调用方只针对缺失的尾部发起续写请求。
+"""
+
+import json
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Tuple
+
+# 全局统计(多线程抽取时共享)
+SALVAGE_STATS = Counter()
+_stats_lock = threading.Lock()
+
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_EVENTS_KEY = re.compile(r'"events"\s*:\s*\[')
+
+
+def record_stat(key: str, value: int = 1):
+    with _stats_lock:
+        SALVAGE_STATS[key] += value
+
+
+def strip_code_fence(text: str) -> str:
+    """去掉 ```json 代码块标记, 代码块未闭合(被截断)时取到文本末尾"""
+    if '```json' in text:
+        start = text.find('```json') + 7
+        end = text.find('```', start)
+        return text[start:end].strip() if end != -1 else text[start:].strip()
+    if text.lstrip().startswith('```'):
+        start = text.find('\n') + 1
+        end = text.find('```', start)
+        return text[start:end].strip() if end != -1 else text[start:].strip()
+    return text.strip()
+
+
+def _loads_lenient(fragment: str):
+    """先严格解析, 失败后去掉多余的尾随逗号再试一次"""
+    try:
+        return json.loads(fragment)
+    except ValueError:
+        pass
+    try:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", fragment))
+    except ValueError:
+        return None
+
+
+def _find_array_start(text: str) -> int:
+    """定位 events 数组的起始 '[' 位置, 找不到返回 -1"""
+    match = _EVENTS_KEY.search(text)
+    if match:
+        return match.end() - 1
+    stripped = text.lstrip()
+    if stripped.startswith('['):
+        return len(text) - len(stripped)
+    return -1
+
+
+def _scan_objects(text: str, start: int, item_open: str = '{') -> Tuple[List, Dict]:
+    """
+    从数组起始位置扫描, 逐个恢复深度为1的完整对象(紧凑格式下 item_open='[', 恢复完整数组)
+    Returns:
+        (对象列表, {"closed": 数组是否闭合, "tail_offset": 最后一个完整对象之后的位置, "malformed": 无法解析的对象数})
+    """
+    objects = []
+    malformed = 0
+    depth = 0
+    in_string = False
+    escaped = False
+    obj_start = -1
+    tail_offset = start + 1
+    closed = False
+
+    for pos in range(start + 1, len(text)):
+        ch = text[pos]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+
+        if ch == '"':
+            in_string = True
+        elif ch in '{[':
+            if depth == 0 and ch == item_open:
+                obj_start = pos
+            depth += 1
+        elif ch in '}]':
+            if depth == 0:
+                # events 数组本身闭合
+                closed = ch == ']'
+                break
+            depth -= 1
+            if depth == 0 and obj_start != -1:
+                obj = _loads_lenient(text[obj_start:pos + 1])
+                if isinstance(obj, dict if item_open == '{' else list):
+                    objects.append(obj)
+                else:
+                    malformed += 1
+                obj_start = -1
+                tail_offset = pos + 1
+
+    return objects, {"closed": closed, "tail_offset": tail_offset, "malformed": malformed}
+
+
+def parse_events_response(text: str, compact: bool = False) -> Tuple[List, Dict]:
+    """
+    解析模型输出中的事项列表
+    Args:
+        text: 模型原始输出
+        compact: 紧凑输出格式, 事项为数组而不是对象(见 compact_format.py)
+    Returns:
+        (事项列表, 解析信息)
+        解析信息: {
+            "mode": "clean" / "salvaged" / "failed",
+            "truncated": 输出是否未闭合(被截断),
+            "tail_offset": 原文中最后一个完整事项结束的位置, 用于续写,
+            "malformed": 无法恢复的事项数
+        }
+    """
+    info = {"mode": "failed", "truncated": False, "tail_offset": 0, "malformed": 0}
+    if not text:
+        return [], info
+
+    body = strip_code_fence(text)
+    body_offset = text.find(body) if body else 0
+
+    # 快速路径: 完整合法的 JSON
+    # 顶层是数组时不能截取首尾花括号之间的内容: 被截断的数组会截出第一个事项, 被当作没有 events 的对象
+    stripped = body.strip()
+    candidates = []
+    if stripped.startswith('{'):
+        candidates.append(stripped[:stripped.rfind('}') + 1])
+    elif stripped.startswith('['):
+        candidates.append(stripped)
+    for candidate in candidates:
+        data = _loads_lenient(candidate)
+        if isinstance(data, dict):
+            data = data.get("events", [])
+        if isinstance(data, list):
+            info.update(mode="clean", tail_offset=len(text))
+            return data, info
+
+    # 容错路径: 逐个恢复已闭合的事项
+    start = _find_array_start(body)
+    if start == -1:
+        return [], info
+
+    objects, scan = _scan_objects(body, start, '[' if compact else '{')
+    info.update(
+        mode="salvaged" if objects else "failed",
+        truncated=not scan["closed"],
+        tail_offset=body_offset + scan["tail_offset"],
+        malformed=scan["malformed"],
+    )
+    return objects, info
+
+
+def build_continuation_messages(prompt: str, partial_output: str, tail_offset: int) -> List[Dict]:
+    """
+    构造续写请求: 把截断前已完整输出的部分作为 assistant 消息, 只请求剩余的事项
+    """
+    prefix = partial_output[:tail_offset].rstrip().rstrip(',')
+    return [
+        {"role": "user", "content": prompt},
+        {"role": "assistant", "content": prefix},
+        {
+            "role": "user",
+            "content": (
+                "上面的输出在此处被截断。请从下一个尚未输出的事项开始继续抽取,"
+                "不要重复已经输出的事项, 按与上面相同的格式直接输出 JSON: {\"events\": [...]}"
+            ),
+        },
+    ]
+
+
+def format_salvage_stats(stats: Dict = None) -> str:
+    """格式化统计信息, 用于运行结束时打印"""
+    stats = SALVAGE_STATS if stats is None else stats
+    responses = stats.get("responses", 0)
+    if not responses:
+        return "JSON解析: 无响应"
+    return (
+        f"JSON解析: 共 {responses} 个响应, 直接解析 {stats.get('clean', 0)}, "
+        f"容错恢复 {stats.get('salvaged', 0)} (恢复事项 {stats.get('salvaged_events', 0)}), "
+        f"截断 {stats.get('truncated', 0)}, 续写 {stats.get('continuations', 0)} "
+        f"(补回事项 {stats.get('continuation_events', 0)}), 失败 {stats.get('failed', 0)}"
+    )
@@ -1,33 +1,96 @@
 import os
 import json
-import requests
-from lxml import etree
+import inspect
+import re
+import threading
 from difflib import SequenceMatcher
-from config import SCHEMA
-from prompts_v2 import PROMPT_TEMPLATE
-from siliconflow_client import SiliconFlowClient
-
-# 读取 .env 文件
-def load_env():
-    env_path = os.path.join(os.path.dirname(__file__), '.env')
-    if os.path.exists(env_path):
-        with open(env_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    os.environ[key.strip()] = value.strip()
-
-load_env()
-
-# 初始化 SiliconFlow API 客户端
-client = SiliconFlowClient()
+from functools import lru_cache
+from config import SCHEMA, COMPACT_SCHEMA
+from prompts_v2 import PROMPT_TEMPLATE, COMPACT_PROMPT_TEMPLATE, CONTEXT_SECTION
+from compact_format import expand_events as expand_compact_events
+from schema_validator import validate_events, format_validation_stats
+from json_salvage import (
+    parse_events_response, build_continuation_messages, record_stat, format_salvage_stats
+)
+from event_io import OUTPUT_FORMATS, output_path_for, write_events
+from event_model import Event, iter_dicts, to_events
+from corpus_loader import LOCAL_SUFFIXES, CorpusLoader, Document, normalize_paragraphs, read_paragraphs
+from provenance import PROVENANCE_VERSION, SliceSource, align_windows, content_hash, paragraph_spans, plan_windows
+from slice_context import SLICING_MODES, slice_contexts, with_context
+from batch_inference import BATCH_ENDPOINTS, BatchJob, LocalBatchEndpoint, OpenAIBatchEndpoint, batch_request
+from event_store import EventStore
+from entity_store import EntityStore
+from semantic_dedup import HASH_EMBEDDER, SemanticDeduplicator
+from manifest import Manifest, pipeline_version
+from slice_dedup import DEDUP_MODES, SliceCoalescer
+from prefilter import ROUTE_KEEP, ROUTE_LOW, ROUTE_SKIP, SlicePrefilter
+from scheduler import SCHEDULE_STRATEGIES, SliceScheduler, SliceTask, estimate_slice_cost
+from token_budget import TokenBudgetPredictor, estimate_tokens
+from siliconflow_client import DEFAULT_MODEL, SiliconFlowClient
+from model_router import ROUTING_POLICIES, ModelRouter
+from profiling import PROFILE_MODES, PROFILER, profiled, stage
+
+# SiliconFlow API 客户端, 首次调用模型时才创建(导入本模块不需要 API Key)
+_client = None
+_client_lock = threading.Lock()
+_client_options = {}
+
+def configure_client(**options):
+    """
+    设置客户端构造参数(如 hedge=True), 需在首次调用模型之前设置
+    model_tiers / routing_policy 用于多模型路由, 未设置 model_tiers 时读取环境变量 MODEL_TIERS
+    """
+    _client_options.update(options)
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                options = dict(_client_options)
+                model_tiers = options.pop("model_tiers", None) or os.getenv("MODEL_TIERS")
+                policy = options.pop("routing_policy", "cost")
+                if model_tiers:
+                    _client = ModelRouter.from_config(model_tiers, policy=policy, **options)
+                else:
+                    _client = SiliconFlowClient(**options)
+    return _client
+
+# 紧凑输出格式(--compact-output): 模型输出定长数组而不是带键名的对象, 本地还原(见 compact_format.py)
+compact_output = False
+# 切片方式(--slicing): overlap=相邻窗口重叠一个段落, context=窗口不重叠, 每个切片携带上文摘要
+slicing_mode = "overlap"
+
+@lru_cache(maxsize=None)
+def _prompt_context(compact=False):
+    """Schema 与实体类型描述在整个进程内只渲染一次"""
+    from entity_types import get_entity_type_description
+
+    schema_json = json.dumps(COMPACT_SCHEMA if compact else SCHEMA, ensure_ascii=False, indent=2)
+    return schema_json, get_entity_type_description()
+
+def _active_template():
+    """当前输出格式对应的 prompt 模板与渲染参数"""
+    template = COMPACT_PROMPT_TEMPLATE if compact_output else PROMPT_TEMPLATE
+    return template, _prompt_context(compact_output)
+
+def _prompt_overhead_tokens():
+    """prompt 模板(不含切片文本)的估计 token 数"""
+    template, (schema_json, entity_types_desc) = _active_template()
+    return estimate_tokens(template.format(
+        slice_id="", slice_text="", schema_json=schema_json, entity_types_desc=entity_types_desc
+    ))
 
 def read_document(file_path):
     # 读取本地文件内容，转换为MD格式
     if file_path.startswith('http'):
-        response = requests.get(file_path)
-        response.raise_for_status()
+        # 网页抓取依赖只在处理URL时加载
+        import requests
+        from lxml import etree
+
+        with stage("fetch_url"):
+            response = requests.get(file_path)
+            response.raise_for_status()
         tree = etree.HTML(response.content)
         title_elements = tree.xpath('/html/head/title/text()')
         title = title_elements[0] if title_elements else "网页内容"
@@ -54,98 +117,296 @@ def read_document(file_path):
             raise ValueError(f"无法从网页中提取内容: {file_path}")
 
         content = f"# {title}\n\n" + '\n\n'.join(paragraphs)
-    elif file_path.endswith('.txt') or file_path.endswith('.md'):
+    elif file_path.endswith(LOCAL_SUFFIXES):
         # TXT或MD文件
-        with open(file_path, 'r', encoding='utf-8') as f:
-            text = f.read()
-        paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()]
-        content = '\n\n'.join(paragraphs)  
+        content = '\n\n'.join(read_paragraphs(file_path))
     else:
         raise ValueError("不支持的文件格式或URL")
     return content
 
-def segment_into_slices(content, window_size=3, overlap=1, min_length=10):
+# Markdown 表格分隔行, 如 |---|:---:|
+_TABLE_SEPARATOR = re.compile(r"^\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?$")
+
+def _split_table_blocks(paragraph):
+    """
+    把段落拆成普通文本块和 Markdown 表格块(表头 + 分隔行 + 数据行)
+    返回 [(is_table, 文本)]
+    """
+    lines = paragraph.split('\n')
+    blocks = []
+    text_lines = []
+    i = 0
+    while i < len(lines):
+        if (lines[i].lstrip().startswith('|') and i + 1 < len(lines)
+                and _TABLE_SEPARATOR.match(lines[i + 1].strip())):
+            end = i + 2
+            while end < len(lines) and lines[end].lstrip().startswith('|'):
+                end += 1
+            if text_lines:
+                blocks.append((False, '\n'.join(text_lines)))
+                text_lines = []
+            blocks.append((True, '\n'.join(lines[i:end])))
+            i = end
+        else:
+            text_lines.append(lines[i])
+            i += 1
+    if text_lines:
+        blocks.append((False, '\n'.join(text_lines)))
+    return blocks
+
+def _table_slices(table, heading, max_tokens):
+    """
+    大表格按行分块: 每块重复表头(和所在章节标题), 行数按 token 预算确定, 避免一次调用输出被截断而丢行
+    """
+    lines = table.split('\n')
+    header = '\n'.join(lines[:2])
+    prefix = f"{heading}\n\n{header}" if heading else header
+    prefix_tokens = estimate_tokens(prefix)
+
+    slices = []
+    rows, row_tokens = [], 0
+    for row in lines[2:]:
+        tokens = estimate_tokens(row)
+        if rows and prefix_tokens + row_tokens + tokens > max_tokens:
+            slices.append(prefix + '\n' + '\n'.join(rows))
+            rows, row_tokens = [], 0
+        rows.append(row)
+        row_tokens += tokens
+    if rows:
+        slices.append(prefix + '\n' + '\n'.join(rows))
+    return slices
+
+def segment_into_slices(content, window_size=3, overlap=1, min_length=10, table_max_tokens=600):
     """
     滑动窗口
     参数:    
+        content: 文档内容, 或已规范化的段落列表(如 corpus_loader 加载的结果, 不再重复拆分)
         window_size: 窗口大小(段落数)
         overlap: 重叠大小(段落数)
         min_length: 过滤过短段落，比如责编名字
+        table_max_tokens: Markdown 表格单独切片, 每个切片(表头+若干行)的估计 token 上限
 
     """
-    # 按段落分割
-    paragraphs = [p.strip() for p in content.split('\n\n') if p.strip()]
-
-    # 过滤过短的段落
-    paragraphs = [p for p in paragraphs if len(p) >= min_length]
+    return [source.text for source in segment_document(
+        content, window_size=window_size, overlap=overlap, min_length=min_length, table_max_tokens=table_max_tokens
+    )]
 
-    if not paragraphs:
-        return []
+@profiled("segment_into_slices")
+def segment_document(content, window_size=3, overlap=1, min_length=10, table_max_tokens=600, previous_windows=None):
+    """
+    切片并记录每个切片覆盖的段落(见 provenance.py), 参数同 segment_into_slices
+    参数:
+        previous_windows: 上次运行的窗口划分(段落块哈希序列的列表), 仍完整存在的旧窗口原样保留
+    返回:
+        SliceSource 列表
+    """
+    # 按段落分割
+    paragraphs = content if isinstance(content, list) else normalize_paragraphs(content)
+    spans = paragraph_spans(paragraphs)
 
     slices = []
-    step = window_size - overlap  # 滑动步长
 
-    for i in range(0, len(paragraphs), step):
-        slice_paragraphs = paragraphs[i:i+window_size]
-        if len(slice_paragraphs) > 0:
-            slice_text = '\n\n'.join(slice_paragraphs)
-            slices.append(slice_text.strip())
+    def window(run):
+        # run: [(段落块, 段落块哈希, 所属段落序号元组)]
+        keys = [key for _, key, _ in run]
+        for start, end in plan_windows(len(run), window_size, overlap, align_windows(keys, previous_windows)):
+            blocks = run[start:end]
+            slice_text = '\n\n'.join(block for block, _, _ in blocks)
+            covered = sorted({index for _, _, indices in blocks for index in indices})
+            slices.append(SliceSource(slice_text.strip(), [spans[i] for i in covered], tuple(keys[start:end])))
+
+    # 表格从段落流中取出单独切片, 表格前后的普通段落各自按滑动窗口切片
+    run = []
+    heading = None
+    pending = None      # 只有标题的块: (文本, 段落序号元组), 并入下一个段落块, 不单独占一个窗口位置
+    for index, paragraph in enumerate(paragraphs):
+        for is_table, block in _split_table_blocks(paragraph):
+            block = block.strip()
+            if not block:
+                continue
+            # 只有表头和分隔行、没有数据行的表格按普通段落切片
+            if is_table and block.count('\n') < 2:
+                is_table = False
+            if is_table:
+                window(run)
+                run = []
+                # 表格前的标题已在每个分块的前缀中
+                indices = (pending[1] if pending else ()) + (index,)
+                covered = [spans[i] for i in sorted(set(indices))]
+                slices.extend(SliceSource(text, covered) for text in _table_slices(block, heading, table_max_tokens))
+                pending = None
+                continue
 
-        # 如果已经到达或超过最后一个段落,停止
-        if i + window_size >= len(paragraphs):
-            break
+            # 章节标题在长度过滤之前记录, 短标题(如 "# 比赛成绩")同样作为表格分块的前缀
+            if block.startswith('#'):
+                heading = block.split('\n')[0]
+            if all(line.lstrip().startswith('#') for line in block.split('\n') if line.strip()):
+                pending = (f"{pending[0]}\n\n{block}", pending[1] + (index,)) if pending else (block, (index,))
+                continue
+            # 过滤过短的段落
+            if len(block) < min_length:
+                continue
+            indices = (index,)
+            if pending:
+                block = f"{pending[0]}\n\n{block}"
+                indices = pending[1] + indices
+                pending = None
+            # 段落块通常就是整个段落, 直接复用段落哈希
+            key = spans[index].sha256 if block == paragraph else content_hash(block)
+            run.append((block, key[:16], indices))
+    # 文末只有标题、没有正文时不单独切片
+    window(run)
 
     return slices
 
-def extract_events_from_slice(slice_text, slice_id):
-    from entity_types import get_entity_type_description
-
-    schema_json = json.dumps(SCHEMA, ensure_ascii=False, indent=2)
-    entity_types_desc = get_entity_type_description()
-
-    prompt = PROMPT_TEMPLATE.format(
+def attach_provenance(events, source, document):
+    """事项加上切片覆盖的段落及所在文档(同一切片的事项共享同一份列表)"""
+    provenance = source.provenance(document)
+    return [{**event, "provenance": provenance} for event in events]
+
+def _pipeline_version():
+    """prompt 模板、schema、实体类型说明和切片参数决定了抽取结果, 其中任何一项变化时增量缓存失效"""
+    template, (schema_json, entity_types_desc) = _active_template()
+    slicing_params = {
+        name: param.default
+        for name, param in inspect.signature(segment_into_slices).parameters.items()
+        if param.default is not param.empty
+    }
+    if slicing_mode == "context":
+        # 上文摘要的 prompt 片段也决定抽取结果
+        template += CONTEXT_SECTION
+        slicing_params.update(overlap=0, slicing=slicing_mode)
+    # 事项携带的溯源字段格式
+    slicing_params["provenance"] = PROVENANCE_VERSION
+    return pipeline_version(template, schema_json, entity_types_desc, **slicing_params)
+
+# 预过滤判定为低价值的切片, 降级使用更小的输出预算
+LOW_VALUE_MAX_TOKENS = 800
+
+# 按切片长度和历史统计预测输出预算
+budget_predictor = TokenBudgetPredictor()
+
+def build_slice_prompt(slice_text, slice_id, context=None):
+    """渲染切片的抽取 prompt; context 为不重叠切片的上文摘要, 插入在切片文本之前"""
+    template, (schema_json, entity_types_desc) = _active_template()
+
+    prompt = template.format(
         slice_id=slice_id,
         slice_text=slice_text,
         schema_json=schema_json,
         entity_types_desc=entity_types_desc
     )
+    if context:
+        prompt = with_context(prompt, context)
+    return prompt
 
+def extract_events_from_slice(slice_text, slice_id, max_tokens=None, raise_errors=False, context=None):
+    """
+    调用模型抽取切片中的事项
+    max_tokens 为本次调用的预算上限, 实际预算由 budget_predictor 按切片长度预测
+    raise_errors: 模型调用失败时抛出异常而不是返回空列表(便于调用方区分失败与无事件, 如不缓存失败的切片)
+    context: 不重叠切片的上文摘要, 插入在切片文本之前
+    """
+    prompt = build_slice_prompt(slice_text, slice_id, context)
+    budget = budget_predictor.predict(slice_text, ceiling=max_tokens)
     try:
-        response = client.chat_completion(
+        response = get_client().chat_completion(
             messages=[{"role": "user", "content": prompt}],
-            max_tokens=2000
+            max_tokens=budget
         )
         result = response.choices[0].message.content.strip()
+        finish_reason = getattr(response.choices[0], "finish_reason", None)
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"模型调用失败:{e}")
         return []
 
-    if '```json' in result:
-        start = result.find('```json') + 7
-        end = result.find('```', start)
-        result = result[start:end].strip()
-    else:
-        l = result.find('{')
-        r = result.rfind('}')
-        if l != -1 and r != -1 and r > l:
-            result = result[l:r+1]
-        else:
-            return []
+    usage = getattr(response, "usage", None)
+    return events_from_output(
+        prompt, result, slice_text, slice_id, budget,
+        finish_reason=finish_reason, completion_tokens=getattr(usage, "completion_tokens", None)
+    )
 
+def events_from_output(prompt, result, slice_text, slice_id, budget, finish_reason=None, completion_tokens=None):
+    """
+    模型输出 → 事项: 容错解析、更新输出预算统计、截断时续写、schema 校验
+    同步调用与批量推理(batch_inference.py)的结果都经过这里
+    """
+    with stage("parse"):
+        events, info = parse_events_response(result, compact=compact_output)
+        if compact_output:
+            events = expand_compact_events(events, slice_id)
+    record_stat("responses")
+    record_stat(info["mode"])
+    if info["mode"] == "salvaged":
+        record_stat("salvaged_events", len(events))
+
+    truncated = info["truncated"] or finish_reason == "length"
+    output_tokens = completion_tokens or estimate_tokens(result)
+    budget_predictor.observe(len(slice_text), output_tokens, truncated)
+
+    # 输出被截断: 保留已完整的事项, 只针对缺失的尾部以更大的预算发起一次续写
+    if truncated:
+        record_stat("truncated")
+        events.extend(_continue_truncated_output(
+            prompt, result, info["tail_offset"], budget_predictor.escalate(budget), slice_id
+        ))
+
+    # 按 schema 校验、修复并过滤无效事项
+    events, _ = validate_events(events, slice_id)
+    return events
+
+def _continue_truncated_output(prompt, partial_output, tail_offset, max_tokens=2000, slice_id=None):
+    """对被截断的输出发起续写请求, 返回补回的事项"""
+    record_stat("continuations")
     try:
-        data = json.loads(result)
-    except Exception:
+        response = get_client().chat_completion(
+            messages=build_continuation_messages(prompt, partial_output, tail_offset),
+            max_tokens=max_tokens
+        )
+        result = response.choices[0].message.content.strip()
+    except Exception as e:
+        print(f"续写请求失败:{e}")
         return []
 
-    if isinstance(data, dict):
-        events = data.get("events", [])
-        return events if isinstance(events, list) else []
-
-    if isinstance(data, list):
-        return data
+    with stage("parse"):
+        events, _ = parse_events_response(result, compact=compact_output)
+        if compact_output:
+            events = expand_compact_events(events, slice_id)
+    record_stat("continuation_events", len(events))
+    return events
 
-    return []
+def run_batch_inference(tasks, endpoint="siliconflow", work_dir="batch_jobs", poll_interval=30.0,
+                        model=DEFAULT_MODEL, timeout=None):
+    """
+    把切片任务作为一个离线批次提交(见 batch_inference.py)
+    Returns:
+        {task: (prompt, 输出预算, BatchResult 或 None)}, custom_id 为切片ID(同名时加序号区分)
+    """
+    rendered = {}
+    requests = []
+    seen = set()
+    for task in tasks:
+        custom_id = task.slice_id
+        suffix = 1
+        while custom_id in seen:
+            suffix += 1
+            custom_id = f"{task.slice_id}#{suffix}"
+        seen.add(custom_id)
+        prompt = build_slice_prompt(task.text, task.slice_id, task.context)
+        budget = budget_predictor.predict(task.text, ceiling=task.max_tokens)
+        rendered[task] = (custom_id, prompt, budget)
+        requests.append(batch_request(custom_id, [{"role": "user", "content": prompt}], budget, model=model))
+
+    if endpoint == "local":
+        batch_endpoint = LocalBatchEndpoint(get_client(), root=os.path.join(work_dir, "local_endpoint"))
+    else:
+        batch_endpoint = OpenAIBatchEndpoint()
+    results = BatchJob(batch_endpoint, work_dir=work_dir, poll_interval=poll_interval, timeout=timeout).run(requests)
+    return {task: (prompt, budget, results.get(custom_id)) for task, (custom_id, prompt, budget) in rendered.items()}
 
+@profiled("dedup")
 def deduplicate_events(events, content_threshold=0.75, key_field_threshold=0.8):
     """
     基于内容相似度和关键字段匹配的智能去重与合并
@@ -243,6 +504,12 @@ def _merge_events(event1, event2):
             else:
                 merged[field] = value1 or value2
 
+        # 段落溯源: 合并两个事件的来源段落
+        elif field == "provenance":
+            spans = {(span.get("document"), span["paragraph_id"]): span
+                     for span in list(value1 or []) + list(value2 or [])}
+            merged[field] = list(spans.values())
+
         # 其他字段:保留更长/更详细的值
         else:
             if len(str(value1)) >= len(str(value2)):
@@ -250,11 +517,339 @@ def _merge_events(event1, event2):
             else:
                 merged[field] = value2
 
-    return merged
+    return Event(merged) if isinstance(event1, Event) else merged
+
+def configure_pipeline(compact=False, slicing="overlap"):
+    """设置输出格式与切片方式(main() 与分布式 worker 共用), 需在规划切片之前设置"""
+    global compact_output, slicing_mode
+    compact_output = compact
+    slicing_mode = slicing
+
+class FilePlanner:
+    """
+    逐文件规划模型调用任务, main() 与分布式 worker(process_file) 共用:
+    切片(与增量清单中上次的窗口划分对齐) → 切片缓存 → 预过滤 → 切片去重 → SliceTask;
+    任务完成后分发结果给重复切片并写入切片缓存, 文件全部切片完成后汇总为带溯源的事件
+    """
+
+    def __init__(self, coalescer, prefilter=None, manifest=None):
+        self.coalescer = coalescer
+        self.prefilter = prefilter
+        self.manifest = manifest
+        self.prompt_overhead = _prompt_overhead_tokens()
+        self.file_states = {}      # relative_path -> {"slice_count", "events": {切片序号: 事件列表}, ...}
+        self.tasks = []
+        self.task_clusters = {}    # slice_id -> cluster_id
+        self.cluster_tasks = {}    # cluster_id -> SliceTask
+
+    def plan_file(self, relative_path, paragraphs, fingerprint=None):
+        """
+        登记一个文件的切片并生成模型调用任务
+        Returns:
+            (切片数, 预过滤跳过数, 重复复用数, 缓存复用数); 没有有效切片时切片数为 0, 文件不登记
+        """
+        manifest = self.manifest
+        # 增量清单中有上次的窗口划分时与之对齐, 只有变化的段落附近重新切片
+        previous_windows = manifest.get_layout(relative_path) if manifest is not None else None
+        if slicing_mode == "context":
+            sources = segment_document(paragraphs, overlap=0, previous_windows=previous_windows)
+        else:
+            sources = segment_document(paragraphs, previous_windows=previous_windows)
+        if not sources:
+            return 0, 0, 0, 0
+
+        slices = [source.text for source in sources]
+        file_name = os.path.basename(relative_path)
+        state = {"slice_count": len(slices), "events": {}, "sources": sources, "fingerprint": fingerprint, "failed": False}
+        self.file_states[relative_path] = state
+        if manifest is not None:
+            manifest.put_layout(relative_path, [source.window for source in sources if source.window])
+        contexts = slice_contexts(slices) if slicing_mode == "context" else [""] * len(slices)
+        skipped = reused = cached = 0
+        for i, slice_text in enumerate(slices):
+            slice_id = f"{file_name}_slice_{i+1}"
+
+            # 增量清单: 内容(及上文摘要)未变的切片复用上次结果
+            if manifest is not None:
+                cache_text = f"{contexts[i]}\0{slice_text}" if contexts[i] else slice_text
+                slice_events = manifest.get_slice(manifest.slice_key(cache_text), slice_id)
+                if slice_events is not None:
+                    state["events"][i] = slice_events
+                    cached += 1
+                    continue
+
+            # 本地预过滤: 明显无价值的切片不调用模型
+            route = self.prefilter.route(slice_text)[0] if self.prefilter is not None else ROUTE_KEEP
+            if route == ROUTE_SKIP:
+                skipped += 1
+                continue
+            max_tokens = LOW_VALUE_MAX_TOKENS if route == ROUTE_LOW else budget_predictor.max_tokens
+
+            # 同一表格的分块共享标题和表头, SimHash 很接近, 只做精确去重
+            cluster_id, is_representative = self.coalescer.add(slice_id, slice_text, near=sources[i].window is not None)
+            if is_representative:
+                task = SliceTask(relative_path, i, slice_id, slice_text, max_tokens=max_tokens, context=contexts[i])
+                estimate_slice_cost(task, self.prompt_overhead)
+                self.tasks.append(task)
+                self.task_clusters[slice_id] = cluster_id
+                self.cluster_tasks[cluster_id] = task
+            else:
+                # 与已登记的切片重复, 复用其结果
+                self.cluster_tasks[cluster_id].followers.append((relative_path, i, slice_id))
+                reused += 1
+        return len(slices), skipped, reused, cached
+
+    def unscheduled_files(self):
+        """没有待执行任务的文件(切片全部被预过滤或命中缓存), 可以直接完成"""
+        scheduled = {t.file_key for t in self.tasks} | {f for t in self.tasks for f, _, _ in t.followers}
+        return [f for f in self.file_states if f not in scheduled]
+
+    def record_result(self, task, events, error=None):
+        """任务完成: 失败时标记相关文件(不记入清单), 结果分发给重复切片, 成功的结果写入切片缓存"""
+        if error is not None:
+            events = []
+            for file_key in [task.file_key] + [f for f, _, _ in task.followers]:
+                self.file_states[file_key]["failed"] = True
+        cluster_id = self.task_clusters[task.slice_id]
+        self.coalescer.set_result(cluster_id, events)
+        self.file_states[task.file_key]["events"][task.slice_index] = events
+        if self.manifest is not None and error is None:
+            cache_text = f"{task.context}\0{task.text}" if task.context else task.text
+            self.manifest.put_slice(self.manifest.slice_key(cache_text), task.slice_id, events)
+        for file_key, slice_index, slice_id in task.followers:
+            self.file_states[file_key]["events"][slice_index] = self.coalescer.fan_out(cluster_id, slice_id)
+
+    def file_events(self, relative_path):
+        """
+        文件的全部切片完成后汇总事件, 加上段落溯源并转为紧凑表示(字典只保留在切片结果与输出边界)
+        Returns:
+            (事件列表, 文件状态)
+        """
+        state = self.file_states[relative_path]
+        slice_events = state.pop("events")
+        sources = state.pop("sources")
+        events = to_events(
+            e for i in sorted(slice_events) for e in attach_provenance(slice_events[i], sources[i], relative_path)
+        )
+        return events, state
+
+def process_file(file_path, prefilter=None, slice_dedup="near", workers=1, document=None, manifest=None):
+    """
+    单个文件的完整流程: 读取 → 切片 → 预过滤 → 切片去重 → 抽取 → 文件级去重
+    供分布式 worker(work_queue.py)按文件处理使用, 规划与 main() 相同(FilePlanner);
+    输出格式与切片方式由 configure_pipeline() 设置
+    参数:
+        document: 溯源与清单中记录的文档路径, 应与 main() 一致为相对数据文件夹的路径; 默认使用 file_path
+        manifest: 增量抽取清单(Manifest), 复用未变化的文件/切片的上次结果
+    Returns:
+        去重后的事件列表(字典)
+    Raises:
+        RuntimeError: 有切片调用模型失败(不返回残缺的结果, 由调用方重试整个文件)
+    """
+    document = document or file_path
+    fingerprint = None
+    if manifest is not None and os.path.exists(file_path):
+        cached_events, fingerprint = manifest.lookup_file(document, file_path)
+        if cached_events is not None:
+            return cached_events
+
+    if file_path.startswith('http'):
+        loaded = Document(file_path, normalize_paragraphs(read_document(file_path)))
+    else:
+        loaded = next(CorpusLoader(workers=1).load([file_path]))
+        if loaded.error is not None:
+            raise loaded.error
+    if loaded.length < 50:
+        return []
+
+    planner = FilePlanner(SliceCoalescer(mode=slice_dedup), prefilter, manifest)
+    if not planner.plan_file(document, loaded.paragraphs, fingerprint)[0]:
+        return []
+
+    errors = []
+
+    def on_task_done(task, events, error):
+        if error is not None:
+            errors.append(f"{task.slice_id}: {error}")
+        planner.record_result(task, events, error)
+
+    SliceScheduler(max_workers=workers, strategy="lpt").run(
+        planner.tasks,
+        lambda task: extract_events_from_slice(
+            task.text, task.slice_id, max_tokens=task.max_tokens, raise_errors=True, context=task.context
+        ),
+        on_task_done,
+        lambda file_key: None
+    )
+    if errors:
+        raise RuntimeError(f"{len(errors)} 个切片抽取失败, 首个错误: {errors[0]}")
+
+    file_events, _ = planner.file_events(document)
+    file_events = list(iter_dicts(deduplicate_events(file_events, content_threshold=0.75)))
+    if manifest is not None and fingerprint is not None:
+        manifest.record_file(document, fingerprint, file_events)
+    return file_events
 
 def main():
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="AI事件抽取系统")
+    parser.add_argument(
+        "--data-folder",
+        default=r"C:\Users\PC\Desktop\git demo\test_data",
+        help="测试数据文件夹路径(包含 metadata.json)"
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=OUTPUT_FORMATS,
+        default="json",
+        help="结果输出格式: json / jsonl / jsonl.zst(需zstandard) / parquet、arrow(需pyarrow, 输出为目录)"
+    )
+    parser.add_argument(
+        "--slicing",
+        choices=SLICING_MODES,
+        default="overlap",
+        help="切片方式: overlap=相邻窗口重叠一个段落, context=窗口不重叠, 每个切片附带前一窗口的上文摘要(减少重复输入与重复事项)"
+    )
+    parser.add_argument(
+        "--slice-dedup",
+        choices=DEDUP_MODES,
+        default="near",
+        help="调用模型前的切片去重: off=关闭, exact=精确重复, near=精确+SimHash近似重复"
+    )
+    parser.add_argument(
+        "--no-prefilter",
+        action="store_true",
+        help="关闭本地低价值切片预过滤"
+    )
+    parser.add_argument(
+        "--prefilter-model",
+        help="可选的预过滤逻辑回归模型 JSON 路径(默认使用规则判定)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="并发模型调用数"
+    )
+    parser.add_argument(
+        "--io-workers",
+        type=int,
+        default=8,
+        help="并发读取本地文件的线程数"
+    )
+    parser.add_argument(
+        "--schedule",
+        choices=SCHEDULE_STRATEGIES,
+        default="file-lpt",
+        help="切片调度策略: file-lpt=大文件优先且文件内连续, lpt=全局最长切片优先, fifo=原始顺序"
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="启用对冲请求: 超过在线学习的延迟分位数仍未返回时发出重复请求, 取先返回的结果"
+    )
+    parser.add_argument(
+        "--model-tiers",
+        help="多模型路由配置 JSON(见 model_router.py), 出错或限流时自动降级到下一个模型; 也可通过环境变量 MODEL_TIERS 设置"
+    )
+    parser.add_argument(
+        "--routing-policy",
+        choices=ROUTING_POLICIES,
+        default="cost",
+        help="多模型路由策略: cost=最便宜优先, latency=最快优先, order=按配置顺序"
+    )
+    parser.add_argument(
+        "--compact-output",
+        action="store_true",
+        help="紧凑输出格式: 模型按定长数组输出事项, 省去重复的键名与缩进, 减少输出 token(本地还原为标准格式)"
+    )
+    parser.add_argument(
+        "--batch",
+        choices=BATCH_ENDPOINTS,
+        help="离线批量推理: siliconflow=供应商批量接口(吞吐高、价格低, 适合夜间任务), local=本地替身(用同步接口执行, 供测试)"
+    )
+    parser.add_argument(
+        "--batch-dir",
+        default="batch_jobs",
+        help="批量推理工作目录(输入/输出文件与提交状态), 重新运行相同输入时继续轮询或复用已下载的结果"
+    )
+    parser.add_argument(
+        "--batch-poll",
+        type=float,
+        default=30.0,
+        help="批次状态轮询间隔(秒)"
+    )
+    parser.add_argument(
+        "--batch-timeout",
+        type=float,
+        help="最长等待批次完成的时间(秒), 超时后退出, 重新运行可继续轮询; 默认一直等待"
+    )
+    parser.add_argument(
+        "--batch-model",
+        default=DEFAULT_MODEL,
+        help="批量推理使用的模型"
+    )
+    parser.add_argument(
+        "--token-stats",
+        default="token_budget_stats.json",
+        help="输出预算历史统计文件, 运行开始时读取、结束时更新; 传空字符串则不保存"
+    )
+    parser.add_argument(
+        "--manifest",
+        help="增量抽取清单数据库(如 extraction_manifest.db): 复用内容和流水线版本都未变化的文件/切片的上次结果"
+    )
+    parser.add_argument(
+        "--dedup",
+        choices=["string", "semantic"],
+        default="string",
+        help="全局事件去重: string=字符串相似度逐对比较, semantic=向量近邻检索(近线性, 可识别换说法的重复)"
+    )
+    parser.add_argument(
+        "--dedup-model",
+        default=HASH_EMBEDDER,
+        help="语义去重的编码器: hash=字符 n-gram 哈希(无需依赖), 或 sentence-transformers 模型名(如 BAAI/bge-small-zh-v1.5)"
+    )
+    parser.add_argument(
+        "--dedup-threshold",
+        type=float,
+        help="语义去重的余弦相似度阈值(默认按编码器选择)"
+    )
+    parser.add_argument(
+        "--entity-table",
+        help="跨切片实体消解: 合并别名/不同写法的实体, 实体表保存到该路径(JSON), 事项中的实体加上 entity_id"
+    )
+    parser.add_argument(
+        "--compact-entities",
+        action="store_true",
+        help="配合 --entity-table: 事项中的实体只保留实体ID和取值, 名称/类型/描述只在实体表中保存一次"
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="sample",
+        choices=PROFILE_MODES,
+        help="按阶段剖析 CPU 与内存(读取/切片/解析/去重/序列化): sample=调用栈采样(默认), cprofile=采样+cProfile"
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default="profile",
+        help="剖析报告输出目录(各阶段 top-N 报告与火焰图用的折叠调用栈)"
+    )
+    parser.add_argument(
+        "--sqlite",
+        help="同时写入 SQLite 事件库(全文与实体索引), 如 extracted_events.db"
+    )
+    args = parser.parse_args()
+
+    # Windows控制台UTF-8编码
+    if sys.platform == "win32":
+        import codecs
+        sys.stdout = codecs.getwriter("utf-8")(sys.stdout.detach())
+
     # 读取test_data文件夹中的测试数据
-    test_data_folder = r"C:\Users\PC\Desktop\git demo\test_data"
+    test_data_folder = args.data_folder
     metadata_path = os.path.join(test_data_folder, "metadata.json")
 
     print(f"\n{'='*80}")
@@ -277,14 +872,8 @@ def main():
     print(f"  随机种子: {metadata.get('random_seed', 'Unknown')}")
     print("="*80)
 
-    # 获取所有测试文件
-    input_files = []
-    for relative_path in metadata.get('file_list', []):
-        file_path = os.path.join(test_data_folder, relative_path)
-        if os.path.exists(file_path):
-            input_files.append(file_path)
-        else:
-            print(f"警告: 文件不存在 {file_path}")
+    # 获取所有测试文件(是否存在由并发加载时检查)
+    input_files = [os.path.join(test_data_folder, p) for p in metadata.get('file_list', [])]
 
     if not input_files:
         print(f"未找到有效的测试文件!")
@@ -292,86 +881,182 @@ def main():
         return
 
     print(f"\n从文件夹读取: {test_data_folder}")
-    print(f"共加载 {len(input_files)} 个测试文件")
+    print(f"共 {len(input_files)} 个测试文件")
     print("="*80)
 
     all_events = []
-    output_file = 'extracted_events.json'
-    temp_output_file = 'extracted_events_temp.json'
+    output_file = output_path_for('extracted_events', args.output_format)
+    temp_output_file = output_path_for('extracted_events_temp', args.output_format)
 
     # 每处理N个文件保存一次
     save_interval = 10
 
+    # 跨文件共享的切片指纹索引, 重复切片只调用一次模型
+    coalescer = SliceCoalescer(mode=args.slice_dedup)
+    prefilter = SlicePrefilter(enabled=not args.no_prefilter, model_path=args.prefilter_model)
+
+    configure_pipeline(compact=args.compact_output, slicing=args.slicing)
+    if args.profile:
+        PROFILER.enable(mode=args.profile, output_dir=args.profile_dir)
+
+    # ===== 阶段1: 读取、切片、预过滤、切片去重, 生成模型调用任务 =====
+    budget_predictor.load(args.token_stats)
+    if args.hedge:
+        configure_client(hedge=True)
+    if args.model_tiers:
+        configure_client(model_tiers=args.model_tiers)
+    configure_client(routing_policy=args.routing_policy)
+    manifest = Manifest(args.manifest, _pipeline_version()) if args.manifest else None
+    planner = FilePlanner(coalescer, prefilter, manifest)
+    file_states = planner.file_states
+    tasks = planner.tasks
+    reused_files = 0
+    processed_files = []   # 本次读取成功或复用结果的文件(相对路径), 写入事件库时清除它们的旧记录
+
+    # 增量清单: 先按指纹筛掉未变化的文件, 只加载需要重新处理的文件
+    pending_files = []     # (序号, 文件路径, 文件指纹)
     for file_index, file_path in enumerate(input_files, 1):
-        file_name = os.path.basename(file_path)
+        fingerprint = None
+        if manifest is not None and os.path.exists(file_path):
+            relative_path = os.path.relpath(file_path, test_data_folder)
+            cached_events, fingerprint = manifest.lookup_file(relative_path, file_path)
+            if cached_events is not None:
+                print(f"[{file_index}/{len(input_files)}] {relative_path}: "
+                      f"文件未变化, 复用上次结果 ({len(cached_events)} 个事件)")
+                all_events.extend(to_events(cached_events))
+                reused_files += 1
+                processed_files.append(relative_path)
+                continue
+        pending_files.append((file_index, file_path, fingerprint))
+
+    # 并发读取并规范化段落, 按顺序流式交给切片
+    loader = CorpusLoader(workers=args.io_workers)
+    documents = loader.load(file_path for _, file_path, _ in pending_files)
+    for (file_index, file_path, fingerprint), document in zip(pending_files, documents):
         relative_path = os.path.relpath(file_path, test_data_folder)
-        print(f"\n[{file_index}/{len(input_files)}] 处理文件: {relative_path}")
-        print("-" * 80)
+        print(f"\n[{file_index}/{len(input_files)}] 读取文件: {relative_path}")
 
+        if isinstance(document.error, FileNotFoundError):
+            print(f"  警告: 文件不存在 {file_path}")
+            continue
         try:
-            # 读取文件内容
-            content = read_document(file_path)
+            if document.error is not None:
+                raise document.error
+            processed_files.append(relative_path)
 
             # 检查内容是否为空或太短
-            if not content or len(content.strip()) < 50:
-                print(f"文件内容为空或过短 (长度: {len(content.strip())})")
+            if document.length < 50:
+                print(f"  文件内容为空或过短 (长度: {document.length})")
                 continue
 
-            print(f"内容长度: {len(content)} 字符")
+            # 分割段落&切片(复用加载时规范化的段落)并生成模型调用任务
+            slice_count, skipped, reused, cached = planner.plan_file(relative_path, document.paragraphs, fingerprint)
+        except Exception as e:
+            print(f"  处理文件时出错: {e}")
+            continue
 
-            # 分割段落&切片
-            slices = segment_into_slices(content)
+        if not slice_count:
+            print(f"  无法生成有效切片")
+            continue
 
-            if not slices:
-                print(f"无法生成有效切片")
-                continue
+        print(f"  内容长度: {document.length} 字符, 切片数量: {slice_count}" +
+              (f", 预过滤跳过 {skipped}" if skipped else "") +
+              (f", 重复复用 {reused}" if reused else "") +
+              (f", 缓存复用 {cached}" if cached else ""))
+
+    total_files = len(file_states)
+    completed_files = 0
+
+    def finalize_file(relative_path):
+        """文件的全部切片完成后: 文件级去重, 加入总结果, 按间隔写检查点"""
+        nonlocal completed_files
+        file_events, state = planner.file_events(relative_path)
+        file_events_count = len(file_events)
+        completed_files += 1
+
+        # 文件处理完成后,立即对当前文件的事件进行去重
+        if file_events:
+            file_events = deduplicate_events(file_events, content_threshold=0.75)
+            after_dedup = len(file_events)
+            removed = file_events_count - after_dedup
+
+            print(f"[{completed_files}/{total_files}] 文件完成: {relative_path}, "
+                  f"提取 {file_events_count} 个事件,去重后保留 {after_dedup} 个" +
+                  (f" (去除 {removed} 个重复)" if removed > 0 else ""))
+
+            # 添加到总事件列表
+            all_events.extend(file_events)
+        else:
+            print(f"[{completed_files}/{total_files}] 文件完成: {relative_path}, 未提取到事件")
 
-            print(f"切片数量: {len(slices)}")
-
-            # 提取事件
-            file_events_count = 0
-            file_events = []  # 当前文件的事件列表
-            for i, slice_text in enumerate(slices):
-                slice_id = f"{file_name}_slice_{i+1}"
-                print(f"  处理切片 {i+1}/{len(slices)}...", end="", flush=True)
-
-                try:
-                    events = extract_events_from_slice(slice_text, slice_id)
-                    file_events.extend(events)
-                    file_events_count += len(events)
-                    if len(events) > 0:
-                        print(f" {len(events)} 个事件")
-                    else:
-                        print(f" 无事件")
-                except Exception as slice_error:
-                    print(f" 失败: {slice_error}")
-                    continue
+        # 有切片调用失败的文件不记入清单, 下次运行重新处理
+        if manifest is not None and not state["failed"]:
+            manifest.record_file(relative_path, state["fingerprint"], list(iter_dicts(file_events)))
 
-            # 文件处理完成后,立即对当前文件的事件进行去重
-            if file_events:
-                before_dedup = len(file_events)
-                file_events = deduplicate_events(file_events, content_threshold=0.75)
-                after_dedup = len(file_events)
-                removed = before_dedup - after_dedup
+        # 增量保存: 每完成N个文件保存一次中间结果
+        if completed_files % save_interval == 0 or completed_files == total_files:
+            print(f"\n保存中间结果 ({completed_files}/{total_files} 文件已完成)...")
+            with stage("dumps"):
+                write_events(temp_output_file, iter_dicts(all_events), args.output_format)
+            print(f"   已保存 {len(all_events)} 个事件到 {temp_output_file}")
 
-                print(f"文件完成,提取 {file_events_count} 个事件,去重后保留 {after_dedup} 个" +
-                      (f" (去除 {removed} 个重复)" if removed > 0 else ""))
+    # 所有切片都被预过滤掉的文件直接完成
+    for relative_path in planner.unscheduled_files():
+        finalize_file(relative_path)
 
-                # 添加到总事件列表
-                all_events.extend(file_events)
-            else:
-                print(f"文件完成,未提取到事件")
+    # ===== 阶段2: 按成本调度并发抽取, 文件完成即去重并写检查点 =====
+    print(f"\n{'='*80}")
+    print(f"开始抽取: {len(tasks)} 次模型调用, 并发 {args.workers}, 调度策略 {args.schedule}")
+    print(f"预估 token: 输入 {sum(t.prompt_tokens for t in tasks)}, 输出 {sum(t.completion_tokens for t in tasks)}")
+    print("="*80)
 
-        except Exception as e:
-            print(f"处理文件时出错: {e}")
-            continue
+    done_tasks = 0
 
-        # 增量保存: 每处理N个文件保存一次中间结果
-        if file_index % save_interval == 0 or file_index == len(input_files):
-            print(f"\n保存中间结果 ({file_index}/{len(input_files)} 文件已处理)...")
-            with open(temp_output_file, 'w', encoding='utf-8') as f:
-                json.dump(all_events, f, ensure_ascii=False, indent=2)
-            print(f"   已保存 {len(all_events)} 个事件到 {temp_output_file}")
+    # 离线批量推理: 全部切片作为一个批次提交, 取回结果后按切片走同样的解析与文件完成流程
+    if args.batch and tasks:
+        try:
+            batch_outputs = run_batch_inference(
+                tasks, endpoint=args.batch, work_dir=args.batch_dir, poll_interval=args.batch_poll,
+                model=args.batch_model, timeout=args.batch_timeout
+            )
+        except TimeoutError as e:
+            print(f"批量推理未完成: {e}")
+            if manifest is not None:
+                manifest.close()
+            return
+
+        def run_task(task):
+            prompt, budget, result = batch_outputs[task]
+            if result is None:
+                raise RuntimeError("批量输出中缺少该切片的结果")
+            if result.error is not None:
+                raise RuntimeError(f"批量请求失败: {result.error}")
+            return events_from_output(
+                prompt, result.content.strip(), task.text, task.slice_id, budget,
+                finish_reason=result.finish_reason, completion_tokens=result.completion_tokens
+            )
+    else:
+        def run_task(task):
+            return extract_events_from_slice(
+                task.text, task.slice_id, max_tokens=task.max_tokens, raise_errors=manifest is not None,
+                context=task.context
+            )
+
+    def on_task_done(task, events, error):
+        nonlocal done_tasks
+        done_tasks += 1
+        if error is not None:
+            print(f"  [{done_tasks}/{len(tasks)}] {task.slice_id} 失败: {error}")
+        else:
+            print(f"  [{done_tasks}/{len(tasks)}] {task.slice_id}: " +
+                  (f"{len(events)} 个事件" if events else "无事件") +
+                  (f", 复用于 {len(task.followers)} 个重复切片" if task.followers else ""))
+
+        planner.record_result(task, events, error)
+
+    scheduler = SliceScheduler(max_workers=args.workers, strategy=args.schedule)
+    scheduler.run(tasks, run_task, on_task_done, finalize_file)
+    budget_predictor.save(args.token_stats)
 
     print(f"\n{'='*80}")
     print(f"统计信息:")
@@ -379,22 +1064,65 @@ def main():
     print(f"去重前事件数: {original_count}")
 
     # 去重
-    all_events = deduplicate_events(all_events, content_threshold=0.75)
+    semantic_dedup = None
+    if args.dedup == "semantic":
+        semantic_dedup = SemanticDeduplicator(embedder=args.dedup_model, threshold=args.dedup_threshold)
+        with stage("dedup"):
+            all_events = semantic_dedup.deduplicate(all_events, _merge_events)
+    else:
+        all_events = deduplicate_events(all_events, content_threshold=0.75)
     print(f"去重后事件数: {len(all_events)}")
     print(f"去除重复: {original_count - len(all_events)} 个")
+    if semantic_dedup is not None:
+        print(semantic_dedup.format_stats())
+
+    entity_store = None
+    if args.entity_table:
+        entity_store = EntityStore()
+        entity_store.add_events(all_events)
+        entity_store.resolve()
+        entity_store.annotate(all_events)
+        entity_store.save(args.entity_table)
+        print(entity_store.format_stats())
+    print(prefilter.format_stats())
+    print(coalescer.format_stats())
+    print(format_salvage_stats())
+    print(budget_predictor.format_stats())
+    if manifest is not None:
+        print(manifest.format_stats())
+        manifest.prune()
+        manifest.close()
+    if _client is not None:
+        print(_client.format_stats())
+    print(format_validation_stats())
     print(f"{'='*80}")
  
     # 输出最终结果并保存
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(all_events, f, ensure_ascii=False, indent=2)
+    with stage("dumps"):
+        if entity_store is not None and args.compact_entities:
+            write_events(output_file, entity_store.compact(all_events), args.output_format)
+        else:
+            write_events(output_file, iter_dicts(all_events), args.output_format)
 
     print(f"\n    最终结果已保存到: {output_file}")
+    if entity_store is not None:
+        print(f"    实体表已保存到: {args.entity_table}")
+
+    if args.sqlite:
+        with EventStore(args.sqlite) as store:
+            # 替换本次语料来源文件的已有记录, 重复运行不会累积重复事件
+            store.replace_events(iter_dicts(all_events), source_files=processed_files)
+            print(f"    已写入 SQLite 事件库: {args.sqlite} (共 {store.count()} 个事件)")
     print(f"共提取有效事件: {len(all_events)} 个")
 
     # 打印前几个事件作为预览
     if all_events and len(all_events) > 0:
         print(f"\n预览前 {min(3, len(all_events))} 个事件:")
-        print(json.dumps(all_events[:3], ensure_ascii=False, indent=2))
+        print(json.dumps(list(iter_dicts(all_events[:3])), ensure_ascii=False, indent=2))
+
+    if PROFILER.enabled:
+        print(f"\n{PROFILER.format_stats()}")
+        print(f"剖析报告已保存到: {PROFILER.write_reports()}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
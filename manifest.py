@@ -0,0 +1,205 @@
+"""
+语料清单(增量抽取)
+记录每个输入文件的路径、大小、修改时间和内容哈希, 以及生成结果所用的流水线版本
+(prompt 模板、schema、实体类型说明、切片参数的哈希)。再次运行时:
+- 文件大小/修改时间未变, 或内容哈希未变: 直接复用上次的文件级结果, 不读取、不切片、不调用模型
+- 文件内容变化: 重新切片, 但内容哈希未变的切片复用切片缓存中的结果, 只有新切片调用模型;
+  切片窗口与上次的窗口划分对齐(见 provenance.py), 插入/删除段落不会让后面的窗口整体错位
+- 流水线版本变化: 所有缓存失效
+
+清单保存在一个 SQLite 数据库中, 例如:
+    python main.py --manifest extraction_manifest.db
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS files (
+    path             TEXT PRIMARY KEY,
+    size             INTEGER,
+    mtime_ns         INTEGER,
+    sha256           TEXT,
+    pipeline_version TEXT,
+    events           TEXT
+);
+CREATE TABLE IF NOT EXISTS slices (
+    slice_hash       TEXT PRIMARY KEY,
+    pipeline_version TEXT,
+    slice_id         TEXT,
+    events           TEXT
+);
+CREATE TABLE IF NOT EXISTS layouts (
+    path             TEXT PRIMARY KEY,
+    pipeline_version TEXT,
+    windows          TEXT
+);
+"""
+
+
+def pipeline_version(*parts, **params) -> str:
+    """流水线版本: prompt 模板、schema 等文本与切片参数的哈希, 任何一项变化都会使缓存失效"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    digest.update(json.dumps(params, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def sha256_file(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileFingerprint:
+    """文件的大小、修改时间和(按需计算的)内容哈希"""
+
+    __slots__ = ("path", "size", "mtime_ns", "sha256")
+
+    def __init__(self, path: str):
+        stat = os.stat(path)
+        self.path = path
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self.sha256 = None
+
+    def content_hash(self) -> str:
+        if self.sha256 is None:
+            self.sha256 = sha256_file(self.path)
+        return self.sha256
+
+
+class Manifest:
+    """语料清单与切片结果缓存"""
+
+    def __init__(self, db_path: str, version: str):
+        """
+        Args:
+            db_path: 清单数据库路径
+            version: 当前流水线版本(见 pipeline_version)
+        """
+        self.db_path = db_path
+        self.version = version
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript(_SCHEMA_SQL)
+        self.stats = {"files_reused": 0, "files_changed": 0, "files_new": 0,
+                      "slices_reused": 0, "slices_extracted": 0}
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ===== 文件 =====
+
+    def lookup_file(self, relative_path: str, file_path: str) -> Tuple[Optional[List[Dict]], FileFingerprint]:
+        """
+        检查文件是否与上次运行相同
+        Returns:
+            (上次的文件级事件列表, 未变化时; 否则 None), 文件指纹(供 record_file 使用)
+        """
+        fingerprint = FileFingerprint(file_path)
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, sha256, pipeline_version, events FROM files WHERE path = ?",
+            (relative_path,)
+        ).fetchone()
+        if row is None or row[3] != self.version:
+            self.stats["files_new" if row is None else "files_changed"] += 1
+            return None, fingerprint
+
+        size, mtime_ns, sha256, _, events = row
+        if size == fingerprint.size and mtime_ns == fingerprint.mtime_ns:
+            fingerprint.sha256 = sha256
+        elif size != fingerprint.size or fingerprint.content_hash() != sha256:
+            self.stats["files_changed"] += 1
+            return None, fingerprint
+        else:
+            # 只有修改时间变化(如重新复制), 更新记录
+            self.conn.execute("UPDATE files SET mtime_ns = ? WHERE path = ?", (fingerprint.mtime_ns, relative_path))
+
+        self.stats["files_reused"] += 1
+        return json.loads(events), fingerprint
+
+    def record_file(self, relative_path: str, fingerprint: FileFingerprint, events: List[Dict]):
+        """记录文件处理完成后的结果(文件级去重之后)"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256, pipeline_version, events) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (relative_path, fingerprint.size, fingerprint.mtime_ns, fingerprint.content_hash(),
+             self.version, json.dumps(events, ensure_ascii=False))
+        )
+        self.conn.commit()
+
+    # ===== 切片 =====
+
+    def slice_key(self, slice_text: str) -> str:
+        return hashlib.sha256(f"{self.version}\0{slice_text}".encode("utf-8")).hexdigest()
+
+    def get_slice(self, slice_key: str, slice_id: str) -> Optional[List[Dict]]:
+        """
+        取缓存的切片结果; 切片在文件中的位置可能变了, references 中的旧切片ID替换为当前ID
+        """
+        row = self.conn.execute(
+            "SELECT slice_id, events FROM slices WHERE slice_hash = ? AND pipeline_version = ?",
+            (slice_key, self.version)
+        ).fetchone()
+        if row is None:
+            return None
+        old_slice_id, events = row
+        events = json.loads(events)
+        for event in events:
+            references = [slice_id if r == old_slice_id else r for r in event.get("references", [])]
+            event["references"] = references if slice_id in references else [slice_id]
+        self.stats["slices_reused"] += 1
+        return events
+
+    def put_slice(self, slice_key: str, slice_id: str, events: List[Dict]):
+        """缓存切片结果(在 record_file 时一并提交)"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO slices (slice_hash, pipeline_version, slice_id, events) VALUES (?, ?, ?, ?)",
+            (slice_key, self.version, slice_id, json.dumps(events, ensure_ascii=False))
+        )
+        self.stats["slices_extracted"] += 1
+
+    # ===== 窗口划分 =====
+
+    def get_layout(self, relative_path: str) -> Optional[List[List[str]]]:
+        """上次运行该文件的窗口划分(每个窗口的段落块哈希序列)"""
+        row = self.conn.execute(
+            "SELECT windows FROM layouts WHERE path = ? AND pipeline_version = ?",
+            (relative_path, self.version)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_layout(self, relative_path: str, windows: List[List[str]]):
+        """记录本次的窗口划分(文件有切片失败时也记录, 下次重试时已成功的切片仍能命中缓存)"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO layouts (path, pipeline_version, windows) VALUES (?, ?, ?)",
+            (relative_path, self.version, json.dumps(windows))
+        )
+
+    def prune(self):
+        """删除其他流水线版本的记录"""
+        self.conn.execute("DELETE FROM files WHERE pipeline_version != ?", (self.version,))
+        self.conn.execute("DELETE FROM slices WHERE pipeline_version != ?", (self.version,))
+        self.conn.execute("DELETE FROM layouts WHERE pipeline_version != ?", (self.version,))
+        self.conn.commit()
+
+    def format_stats(self) -> str:
+        s = self.stats
+        return (
+            f"增量清单(版本 {self.version}): 文件复用 {s['files_reused']}, 变化 {s['files_changed']}, "
+            f"新增 {s['files_new']}; 切片复用 {s['slices_reused']}, 新抽取 {s['slices_extracted']}"
+        )
@@ -0,0 +1,191 @@
+"""
+多模型路由与分级降级
+按顺序配置多个模型/接口(tier), 每个 tier 有各自的限流、单价和延迟统计:
+- 按策略选择最便宜(cost)或最快(latency)的健康 tier
+- 输出预算较小的请求(短切片、预过滤降级的切片)可以交给标记为 easy_only 的小模型
+- 调用出错或限流饱和时自动切换到下一个 tier, 出错的 tier 进入冷却期
+对外提供与 SiliconFlowClient 相同的 chat_completion 接口
+
+配置文件(JSON)示例:
+[
+  {"name": "small", "model": "Qwen/Qwen3-8B", "easy_only": true,
+   "cost_per_1k_input": 0.0, "cost_per_1k_output": 0.0},
+  {"name": "main", "model": "Qwen/Qwen3-32B", "rpm": 1000, "tpm": 50000,
+   "cost_per_1k_input": 0.001, "cost_per_1k_output": 0.004},
+  {"name": "backup", "model": "deepseek-ai/DeepSeek-V3", "base_url": "https://api.siliconflow.cn/v1",
+   "api_key_env": "SILICONFLOW_API_KEY", "cost_per_1k_input": 0.002, "cost_per_1k_output": 0.008}
+]
+"""
+
+import json
+import os
+import threading
+import time
+from typing import List, Optional
+
+from siliconflow_client import DEFAULT_BASE_URL, SiliconFlowClient
+from token_budget import estimate_tokens
+
+ROUTING_POLICIES = ["cost", "latency", "order"]
+
+# 出错后的冷却时间(秒), 连续出错时翻倍, 不超过上限
+_BASE_COOLDOWN = 10.0
+_MAX_COOLDOWN = 300.0
+# 延迟指数滑动平均系数
+_EWMA_ALPHA = 0.2
+
+
+class ModelTier:
+    """一个模型/接口, 及其健康状态和统计"""
+
+    def __init__(self, name: str, client, cost_per_1k_input: float = 0.0,
+                 cost_per_1k_output: float = 0.0, easy_only: bool = False):
+        self.name = name
+        self.client = client
+        self.cost_per_1k_input = cost_per_1k_input
+        self.cost_per_1k_output = cost_per_1k_output
+        self.easy_only = easy_only
+
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+        self.latency_per_token = None   # 耗时/max_tokens 的滑动平均
+        self.stats = {"requests": 0, "errors": 0, "fallbacks": 0, "tokens": 0, "cost": 0.0}
+        self._lock = threading.Lock()
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+    def saturated(self) -> bool:
+        limiter = getattr(self.client, "limiter", None)
+        return bool(limiter and limiter.enabled and limiter.remaining() <= 0)
+
+    def estimated_cost(self, prompt_tokens: int, max_tokens: int) -> float:
+        return (prompt_tokens * self.cost_per_1k_input + max_tokens * self.cost_per_1k_output) / 1000
+
+    def record_success(self, seconds: float, max_tokens: int, usage):
+        with self._lock:
+            self.consecutive_errors = 0
+            sample = seconds / max(1, max_tokens)
+            if self.latency_per_token is None:
+                self.latency_per_token = sample
+            else:
+                self.latency_per_token += _EWMA_ALPHA * (sample - self.latency_per_token)
+            self.stats["requests"] += 1
+            prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+            completion_tokens = getattr(usage, "completion_tokens", None) or 0
+            self.stats["tokens"] += prompt_tokens + completion_tokens
+            self.stats["cost"] += (prompt_tokens * self.cost_per_1k_input
+                                   + completion_tokens * self.cost_per_1k_output) / 1000
+
+    def record_error(self, now: float):
+        with self._lock:
+            self.stats["errors"] += 1
+            self.consecutive_errors += 1
+            cooldown = min(_MAX_COOLDOWN, _BASE_COOLDOWN * 2 ** (self.consecutive_errors - 1))
+            self.cooldown_until = now + cooldown
+
+
+class ModelRouter:
+    """多模型路由, 接口与 SiliconFlowClient 相同"""
+
+    def __init__(self, tiers: List[ModelTier], policy: str = "cost", easy_max_tokens: int = 800):
+        """
+        Args:
+            tiers: 按优先级排列的 tier 列表
+            policy: cost=最便宜优先, latency=最快优先, order=按配置顺序
+            easy_max_tokens: 输出预算不超过该值的请求视为简单请求, 可使用 easy_only 的 tier
+        """
+        if not tiers:
+            raise ValueError("至少需要配置一个模型 tier")
+        if policy not in ROUTING_POLICIES:
+            raise ValueError(f"不支持的路由策略: {policy}")
+        self.tiers = tiers
+        self.policy = policy
+        self.easy_max_tokens = easy_max_tokens
+
+    @classmethod
+    def from_config(cls, path: str, policy: str = "cost", **client_options) -> "ModelRouter":
+        """
+        从 JSON 配置文件创建路由
+        Args:
+            path: 配置文件路径
+            policy: 路由策略
+            client_options: 传给每个 SiliconFlowClient 的公共参数(如 hedge=True)
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+
+        tiers = []
+        for item in config:
+            api_key = os.getenv(item["api_key_env"]) if item.get("api_key_env") else None
+            client = SiliconFlowClient(
+                api_key=api_key,
+                rpm=item.get("rpm"),
+                tpm=item.get("tpm"),
+                model=item["model"],
+                base_url=item.get("base_url", DEFAULT_BASE_URL),
+                **client_options
+            )
+            tiers.append(ModelTier(
+                name=item.get("name", item["model"]),
+                client=client,
+                cost_per_1k_input=item.get("cost_per_1k_input", 0.0),
+                cost_per_1k_output=item.get("cost_per_1k_output", 0.0),
+                easy_only=item.get("easy_only", False),
+            ))
+        return cls(tiers, policy=policy)
+
+    def _candidates(self, prompt_tokens: int, max_tokens: int) -> List[ModelTier]:
+        """按策略排列可用 tier; 冷却中的 tier 排在最后, 作为所有 tier 都不健康时的兜底"""
+        easy = max_tokens <= self.easy_max_tokens
+        eligible = [t for t in self.tiers if easy or not t.easy_only]
+        if not eligible:
+            eligible = list(self.tiers)
+
+        if self.policy == "cost":
+            eligible.sort(key=lambda t: t.estimated_cost(prompt_tokens, max_tokens))
+        elif self.policy == "latency":
+            # 尚无延迟数据的 tier 优先试用
+            eligible.sort(key=lambda t: t.latency_per_token or 0.0)
+
+        now = time.time()
+        healthy = [t for t in eligible if t.healthy(now) and not t.saturated()]
+        unhealthy = sorted(
+            (t for t in eligible if t not in healthy), key=lambda t: t.cooldown_until
+        )
+        return healthy + unhealthy
+
+    def chat_completion(self, messages, max_tokens=2000, temperature=0.7, top_p=0.9):
+        """
+        与 SiliconFlowClient.chat_completion 相同的接口, 依次尝试候选 tier, 全部失败时抛出最后一个错误
+        """
+        prompt_tokens = sum(estimate_tokens(str(m.get("content", ""))) for m in messages)
+        last_error: Optional[Exception] = None
+        for attempt, tier in enumerate(self._candidates(prompt_tokens, max_tokens)):
+            if attempt > 0:
+                tier.stats["fallbacks"] += 1
+            started = time.monotonic()
+            try:
+                response = tier.client.chat_completion(
+                    messages, max_tokens=max_tokens, temperature=temperature, top_p=top_p
+                )
+            except Exception as e:
+                tier.record_error(time.time())
+                print(f"模型 {tier.name} 调用失败, 切换下一个: {e}")
+                last_error = e
+                continue
+            tier.record_success(time.monotonic() - started, max_tokens, getattr(response, "usage", None))
+            return response
+        raise last_error
+
+    def format_stats(self) -> str:
+        lines = [f"模型路由({self.policy}):"]
+        for tier in self.tiers:
+            stats = tier.stats
+            latency = f"{tier.latency_per_token * 1000:.2f}ms/token" if tier.latency_per_token else "-"
+            lines.append(
+                f"  {tier.name:12s} 成功 {stats['requests']}, 失败 {stats['errors']}, "
+                f"降级接收 {stats['fallbacks']}, token {stats['tokens']}, "
+                f"费用 {stats['cost']:.4f}, 延迟 {latency}"
+            )
+        return "\n".join(lines)
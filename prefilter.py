@@ -0,0 +1,154 @@
+"""
+切片低价值预过滤(本地, 调用模型之前)
+schema 中 is_valid=false 用来标记广告/乱码/纯链接, 但要等一次完整的模型调用之后才知道。
+这里用廉价的本地特征先判断切片是否值得调用模型:
+- link_density:   链接字符占比
+- text_ratio:     文字(中文/字母/数字)占非空白、非 Markdown 语法字符的比例, 乱码和符号堆砌时很低
+- cjk_ratio:      中文字符占比(仅作为特征, 英文内容不会因此被过滤)
+- repetition:     重复 3-gram 占比, 模板化/刷屏内容很高
+- entropy:        字符熵(bit), 过低说明内容单调重复
+  (这两项不计 Markdown 表格的 | 分隔符与对齐行)
+- garbled_ratio:  替换字符/控制字符占比
+
+判定结果:
+- skip: 明确无价值, 不调用模型
+- low:  价值较低, 降级处理(更小的输出预算)
+- keep: 正常抽取
+
+可选加载一个轻量逻辑回归模型(JSON: {"weights": {特征: 权重}, "bias": b,
+"skip_threshold": 0.9, "low_threshold": 0.6}), 以其输出的垃圾概率代替规则判定
+"""
+
+import json
+import math
+import re
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+_URL = re.compile(r"https?://\S+|www\.\S+|\[[^\]]*\]\([^)]*\)")
+_CJK = re.compile(r"[㐀-䶿一-鿿豈-﫿]")
+_WORD_CHAR = re.compile(r"[\w㐀-䶿一-鿿]")
+_GARBLED = re.compile(r"[�\x00-\x08\x0b\x0c\x0e-\x1f]")
+_WHITESPACE = re.compile(r"\s+")
+# Markdown 表格/标题/列表语法字符, 不计入文字占比
+_MARKDOWN_SYNTAX = re.compile(r"[|\-:#*>`_=+]")
+# Markdown 表格的对齐行(|---|:---:|)与单元格分隔符
+_TABLE_ALIGNMENT = re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$", re.MULTILINE)
+_TABLE_PIPE = re.compile(r"\|")
+
+ROUTE_SKIP = "skip"
+ROUTE_LOW = "low"
+ROUTE_KEEP = "keep"
+
+
+def extract_features(text: str) -> Dict[str, float]:
+    """计算切片的本地特征"""
+    compact = _WHITESPACE.sub("", text)
+    total = len(compact) or 1
+
+    link_chars = sum(len(_WHITESPACE.sub("", m)) for m in _URL.findall(text))
+    # 链接本身和 Markdown 语法字符不计入文字占比
+    plain = _MARKDOWN_SYNTAX.sub("", _WHITESPACE.sub("", _URL.sub("", text)))
+    plain_total = len(plain) or 1
+
+    # 熵与重复度只看内容: 表格的分隔符和对齐行每行重复, 会让数字表格被误判为单调/刷屏
+    content = _WHITESPACE.sub("", _TABLE_PIPE.sub("", _TABLE_ALIGNMENT.sub("", text)))
+    content_total = len(content) or 1
+    counts = Counter(content)
+    entropy = -sum(c / content_total * math.log2(c / content_total) for c in counts.values()) if content else 0.0
+
+    trigrams = [content[i:i + 3] for i in range(len(content) - 2)]
+    repetition = 1 - len(set(trigrams)) / len(trigrams) if trigrams else 0.0
+
+    return {
+        "length": len(compact),
+        "link_density": min(link_chars / total, 1.0),
+        "text_ratio": len(_WORD_CHAR.findall(plain)) / plain_total if plain else 0.0,
+        "cjk_ratio": len(_CJK.findall(compact)) / total,
+        "repetition": repetition,
+        "entropy": entropy,
+        "garbled_ratio": len(_GARBLED.findall(text)) / total,
+    }
+
+
+def _rule_route(features: Dict[str, float]) -> Tuple[str, str]:
+    """基于规则的判定, 阈值偏保守: 只过滤明显无价值的切片"""
+    if features["link_density"] >= 0.7:
+        return ROUTE_SKIP, "link_density"
+    if features["garbled_ratio"] >= 0.1:
+        return ROUTE_SKIP, "garbled"
+    if features["length"] >= 30 and features["text_ratio"] < 0.3:
+        return ROUTE_SKIP, "symbols"
+    if features["length"] >= 60 and features["repetition"] >= 0.8:
+        return ROUTE_SKIP, "repetition"
+    if features["length"] >= 30 and features["entropy"] < 2.5:
+        return ROUTE_SKIP, "low_entropy"
+
+    if features["link_density"] >= 0.4:
+        return ROUTE_LOW, "link_density"
+    if features["repetition"] >= 0.6:
+        return ROUTE_LOW, "repetition"
+    if features["text_ratio"] < 0.5:
+        return ROUTE_LOW, "symbols"
+    return ROUTE_KEEP, ""
+
+
+class SlicePrefilter:
+    """切片预过滤器, 在整个运行期间累计跳过率"""
+
+    def __init__(self, enabled: bool = True, model_path: Optional[str] = None):
+        """
+        Args:
+            enabled: 是否启用, 关闭时所有切片都返回 keep
+            model_path: 可选的逻辑回归模型 JSON 路径
+        """
+        self.enabled = enabled
+        self.model = None
+        if model_path:
+            with open(model_path, 'r', encoding='utf-8') as f:
+                self.model = json.load(f)
+        self.stats = Counter()
+
+    def _model_route(self, features: Dict[str, float]) -> Tuple[str, str]:
+        z = self.model.get("bias", 0.0)
+        for name, weight in self.model.get("weights", {}).items():
+            z += weight * features.get(name, 0.0)
+        junk_probability = 1 / (1 + math.exp(-z))
+        if junk_probability >= self.model.get("skip_threshold", 0.9):
+            return ROUTE_SKIP, "model"
+        if junk_probability >= self.model.get("low_threshold", 0.6):
+            return ROUTE_LOW, "model"
+        return ROUTE_KEEP, ""
+
+    def route(self, slice_text: str) -> Tuple[str, str]:
+        """
+        判定切片的处理方式
+        Returns:
+            (skip / low / keep, 原因)
+        """
+        self.stats["total"] += 1
+        if not self.enabled:
+            self.stats[ROUTE_KEEP] += 1
+            return ROUTE_KEEP, ""
+
+        features = extract_features(slice_text)
+        route, reason = self._model_route(features) if self.model else _rule_route(features)
+        self.stats[route] += 1
+        if reason:
+            self.stats[f"{route}:{reason}"] += 1
+        return route, reason
+
+    def format_stats(self) -> str:
+        total = self.stats["total"]
+        if not total or not self.enabled:
+            return "切片预过滤: 未启用" if not self.enabled else "切片预过滤: 无切片"
+        reasons = ", ".join(
+            f"{key.split(':', 1)[1]}={count}"
+            for key, count in sorted(self.stats.items())
+            if key.startswith(f"{ROUTE_SKIP}:")
+        )
+        return (
+            f"切片预过滤: 共 {total} 个切片, 跳过 {self.stats[ROUTE_SKIP]} "
+            f"({self.stats[ROUTE_SKIP] / total:.1%}), 降级 {self.stats[ROUTE_LOW]}"
+            + (f" [跳过原因: {reasons}]" if reasons else "")
+        )
@@ -0,0 +1,304 @@
+"""
+按流水线阶段的 CPU 与内存剖析(--profile)
+运行慢或内存膨胀时不必再手工用 cProfile 包住 main(): 各阶段用 stage() / profiled() 标记,
+开启剖析后按阶段分别统计:
+- 调用次数、墙钟时间
+- CPU: 采样(默认每 5ms 采集一次各线程的调用栈, 归入该线程当前所在的阶段),
+  cprofile 模式下另外用 cProfile 精确统计每个阶段的函数调用
+- 内存: tracemalloc 统计每个阶段的净分配量, 并对每个阶段前几次调用做快照对比, 给出分配最多的代码行
+结果写入剖析目录:
+    summary.txt           各阶段汇总
+    <阶段>.txt            top-N 报告(采样热点、cProfile 统计、内存分配位置)
+    <阶段>.collapsed      折叠调用栈, 可直接交给 flamegraph.pl / speedscope 生成火焰图
+    <阶段>.prof           cProfile 原始数据(cprofile 模式), 可用 snakeviz 等工具查看
+
+未开启时 stage() 返回同一个空上下文, profiled() 只多一次属性判断, 开销可以忽略。
+
+注意:
+- cProfile 同一时刻只统计一个阶段块(其他线程中同时进入的阶段块只计时和采样), 嵌套阶段计入外层
+- tracemalloc 是进程级的, 多线程阶段(如 parse)的内存数据包含同时运行的其他线程的分配
+"""
+
+import cProfile
+import functools
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+from typing import Dict, Optional
+
+PROFILE_MODES = ["sample", "cprofile"]
+
+_NULL_CONTEXT = nullcontext()
+_UNSAFE_FILENAME = re.compile(r"[^\w.-]+")
+# 快照对比时忽略剖析器自身的分配
+_IGNORED_FILES = {tracemalloc.__file__, __file__}
+
+
+class _StageStats:
+    __slots__ = ("calls", "wall", "memory_delta", "snapshots", "allocations", "profile", "stacks")
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.memory_delta = 0
+        self.snapshots = 0
+        self.allocations = Counter()     # 代码行 -> 分配字节数(快照对比)
+        self.profile = None              # cProfile.Profile
+        self.stacks = Counter()          # 折叠调用栈 -> 样本数
+
+
+class _Stage:
+    """一次阶段块: 计时、内存差值, 以及可选的 cProfile 与 tracemalloc 快照"""
+
+    __slots__ = ("profiler", "name", "stats", "start", "memory", "snapshot", "profiling", "previous")
+
+    def __init__(self, profiler: "StageProfiler", name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        profiler = self.profiler
+        with profiler._lock:
+            self.stats = profiler._stats[self.name]
+            self.stats.calls += 1
+            take_snapshot = self.stats.snapshots < profiler.snapshot_blocks
+            if take_snapshot:
+                self.stats.snapshots += 1
+
+        # 快照本身的开销不计入采样
+        self.snapshot = tracemalloc.take_snapshot() if take_snapshot else None
+        ident = threading.get_ident()
+        self.previous = profiler._active.get(ident)
+        profiler._active[ident] = self.name
+        self.memory = tracemalloc.get_traced_memory()[0]
+        self.profiling = profiler.mode == "cprofile" and profiler._cprofile_lock.acquire(blocking=False)
+        if self.profiling:
+            if self.stats.profile is None:
+                self.stats.profile = cProfile.Profile()
+            self.stats.profile.enable()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        if self.profiling:
+            self.stats.profile.disable()
+            self.profiler._cprofile_lock.release()
+        memory_delta = tracemalloc.get_traced_memory()[0] - self.memory
+
+        ident = threading.get_ident()
+        if self.previous is None:
+            self.profiler._active.pop(ident, None)
+        else:
+            self.profiler._active[ident] = self.previous
+
+        allocations = None
+        if self.snapshot is not None:
+            allocations = Counter()
+            for diff in tracemalloc.take_snapshot().compare_to(self.snapshot, "lineno"):
+                frame = diff.traceback[0]
+                if diff.size_diff > 0 and frame.filename not in _IGNORED_FILES:
+                    allocations[f"{frame.filename}:{frame.lineno}"] += diff.size_diff
+
+        with self.profiler._lock:
+            self.stats.wall += elapsed
+            self.stats.memory_delta += memory_delta
+            if allocations:
+                self.stats.allocations.update(allocations)
+        return False
+
+
+class StageProfiler:
+    """
+    分阶段剖析器
+    用法:
+        PROFILER.enable(mode="sample", output_dir="profile")
+        with stage("read_paragraphs"):
+            ...
+        PROFILER.write_reports()
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.mode = "sample"
+        self.output_dir = "profile"
+        self.top_n = 30
+        self.interval = 0.005
+        self.snapshot_blocks = 3
+        self._stats: Dict[str, _StageStats] = defaultdict(_StageStats)
+        self._active: Dict[int, str] = {}   # 线程ID -> 当前阶段
+        self._lock = threading.Lock()
+        self._cprofile_lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def enable(self, mode: str = "sample", output_dir: str = "profile", top_n: int = 30,
+               interval: float = 0.005, snapshot_blocks: int = 3):
+        """
+        Args:
+            mode: sample=只采样, cprofile=采样 + cProfile
+            output_dir: 报告输出目录
+            top_n: 每个报告保留的条目数
+            interval: 采样间隔(秒)
+            snapshot_blocks: 每个阶段做 tracemalloc 快照对比的前几次调用
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"未知的剖析模式: {mode}, 可选: {PROFILE_MODES}")
+        self.mode = mode
+        self.output_dir = output_dir
+        self.top_n = top_n
+        self.interval = interval
+        self.snapshot_blocks = snapshot_blocks
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample_loop, name="stage-profiler", daemon=True)
+        self._sampler.start()
+        self.enabled = True
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._stop.set()
+        self._sampler.join()
+        tracemalloc.stop()
+
+    def stage(self, name: str):
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return _Stage(self, name)
+
+    # ===== 采样 =====
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            active = dict(self._active)
+            if not active:
+                continue
+            frames = sys._current_frames()
+            samples = []
+            for ident, name in active.items():
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                samples.append((name, _collapse(frame)))
+            del frames
+            with self._lock:
+                for name, stack in samples:
+                    self._stats[name].stacks[f"{name};{stack}"] += 1
+
+    # ===== 报告 =====
+
+    def format_stats(self) -> str:
+        if not self._stats:
+            return "阶段剖析: 无数据"
+        lines = ["阶段剖析:"]
+        for name, s in sorted(self._stats.items(), key=lambda item: -item[1].wall):
+            samples = sum(s.stacks.values())
+            lines.append(
+                f"  {name:<22} 调用 {s.calls:>6}  耗时 {s.wall:>9.3f}s  "
+                f"净分配 {_format_bytes(s.memory_delta):>10}  采样 {samples}"
+            )
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            lines.append(f"  tracemalloc: 当前 {_format_bytes(current)}, 峰值 {_format_bytes(peak)}")
+        return "\n".join(lines)
+
+    def write_reports(self) -> str:
+        """停止采样并写出各阶段报告, 返回剖析目录"""
+        summary = self.format_stats()
+        self.disable()
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(os.path.join(self.output_dir, "summary.txt"), "w", encoding="utf-8") as f:
+            f.write(summary + "\n")
+
+        for name, s in self._stats.items():
+            base = os.path.join(self.output_dir, _UNSAFE_FILENAME.sub("_", name))
+            with open(base + ".collapsed", "w", encoding="utf-8") as f:
+                for stack, count in s.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            if s.profile is not None:
+                s.profile.dump_stats(base + ".prof")
+            with open(base + ".txt", "w", encoding="utf-8") as f:
+                f.write(self._stage_report(name, s))
+        return self.output_dir
+
+    def _stage_report(self, name: str, s: _StageStats) -> str:
+        out = io.StringIO()
+        out.write(f"阶段: {name}\n调用 {s.calls} 次, 耗时 {s.wall:.3f}s, 净分配 {_format_bytes(s.memory_delta)}\n")
+
+        samples = sum(s.stacks.values())
+        if samples:
+            own, inclusive = Counter(), Counter()
+            for stack, count in s.stacks.items():
+                frames = stack.split(";")[1:]
+                if frames:
+                    own[frames[-1]] += count
+                for frame in set(frames):
+                    inclusive[frame] += count
+            for title, counter in (("采样热点(自身)", own), ("采样热点(含子调用)", inclusive)):
+                out.write(f"\n== {title}, 共 {samples} 个样本 ==\n")
+                for frame, count in counter.most_common(self.top_n):
+                    out.write(f"{count / samples:7.1%}  {count:>6}  {frame}\n")
+
+        if s.profile is not None:
+            out.write("\n== cProfile(按累计耗时) ==\n")
+            stats = pstats.Stats(s.profile, stream=out)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top_n)
+
+        if s.allocations:
+            out.write(f"\n== 内存分配位置(前 {min(s.calls, self.snapshot_blocks)} 次调用的快照对比) ==\n")
+            for location, size in s.allocations.most_common(self.top_n):
+                out.write(f"{_format_bytes(size):>10}  {location}\n")
+        return out.getvalue()
+
+
+def _collapse(frame) -> str:
+    """调用栈 -> 折叠格式 "外层;...;内层" (函数名 (文件名:行号))"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+
+def _format_bytes(size: int) -> str:
+    sign = "-" if size < 0 else ""
+    size = abs(size)
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{sign}{size:.0f}{unit}" if unit == "B" else f"{sign}{size:.1f}{unit}"
+        size /= 1024
+    return f"{sign}{size:.2f}GB"
+
+
+# 进程内共享的剖析器, 默认关闭
+PROFILER = StageProfiler()
+
+
+def stage(name: str):
+    """标记一个阶段块: with stage("parse"): ..."""
+    return PROFILER.stage(name)
+
+
+def profiled(name: str):
+    """把整个函数标记为一个阶段"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            with _Stage(PROFILER, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
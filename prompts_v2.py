@@ -51,7 +51,10 @@ PROMPT_TEMPLATE = """
   - 数值实体: `value_type: "int"/"float"`, `value: "100"`
   - 带单位的实体: 添加 `unit` 字段,如 `"unit": "g/mol"`
 
-### 4. 输出格式
+### 4. 表格
+- 文本片段可能是 Markdown 表格的一部分(表头 + 若干数据行),请逐行抽取,每一行可能是一个独立的事实,不要遗漏任何一行
+
+### 5. 输出格式
 - 直接输出 JSON,不要添加任何解释文字或 markdown 标记
 - 无可识别事项时返回: {{"events": []}}
 - 所有字段按 schema 要求填写,未提及的可选字段可省略
@@ -205,3 +208,59 @@ PROMPT_TEMPLATE = """
 
 请输出 JSON:
 """
+
+
+# 紧凑输出格式(--compact-output): 抽取规则与 PROMPT_TEMPLATE 相同, 只替换输出格式说明和示例
+# 输出为定长数组, 本地由 compact_format.expand_events 还原为标准事项
+COMPACT_PROMPT_TEMPLATE = PROMPT_TEMPLATE[:PROMPT_TEMPLATE.index("### 5. 输出格式")] + """### 5. 输出格式(紧凑数组)
+- 直接输出单行 JSON,不要缩进、换行、解释文字或 markdown 标记
+- 每个事项是一个数组: [title, summary, content, category, is_valid, entities]
+  - is_valid: 1=有效, 0=无效
+  - 不需要输出 references
+- 每个实体是一个数组: [type, name, description, value_type, value, unit]
+  - 末尾为空的字段直接省略; 中间为空的字段写 ""
+- 无可识别事项时返回: {{"events":[]}}
+
+---
+
+## 输出 Schema
+
+{schema_json}
+
+---
+
+## 示例
+
+**输入文本:**
+"直播吧9月30日讯 北京时间9月30日20:15,亚冠精英联赛东亚区第2轮成都蓉城迎战江原FC的比赛在五粮液文化体育中心体育场进行,最终成都蓉城1-0江原FC收获队史亚冠首胜。"
+
+**输出 JSON:**
+{{"events":[["成都蓉城1-0战胜江原FC","亚冠精英联赛东亚区第2轮,成都蓉城主场1-0击败江原FC,收获队史亚冠首胜","北京时间9月30日20点15分,亚冠精英联赛东亚区第2轮比赛在五粮液文化体育中心体育场进行。成都蓉城主场迎战江原FC,最终以1比0的比分获胜,这也是成都蓉城在亚冠联赛中的首场胜利。","体育赛事",1,[["organization","成都蓉城","主场球队"],["organization","江原FC","客场球队"],["event","亚冠精英联赛东亚区第2轮","赛事名称"],["location","五粮液文化体育中心体育场","比赛场地"],["time","比赛时间","比赛开始时间","datetime","2024-09-30T20:15:00"],["metric","比分","最终比分","","1-0"]]]]}}
+
+**输入文本:**
+"化学式C7H7I（摩尔质量 218.03 g/mol）可能指：碘甲苯 - 2-碘甲苯，CAS号：615-37-2 - 3-碘甲苯，CAS号：625-95-6"
+
+**输出 JSON:**
+{{"events":[["C7H7I化学物质索引","化学式C7H7I包含多种同分异构体,摩尔质量218.03 g/mol","化学式C7H7I代表一组同分异构体,包括2-碘甲苯和3-碘甲苯,其摩尔质量为218.03克每摩尔。","化学物质",1,[["knowledge","C7H7I","化学分子式"],["metric","摩尔质量","分子量","float","218.03","g/mol"],["knowledge","2-碘甲苯","同分异构体,CAS号615-37-2"],["knowledge","3-碘甲苯","同分异构体,CAS号625-95-6"]]]]}}
+
+---
+
+## 当前任务
+
+**文本片段 ID:** {slice_id}
+
+**文本内容:**
+{slice_text}
+
+---
+"""
+
+
+# 不重叠切片(--slicing context)时插入在"文本内容"之前的上文摘要
+CONTEXT_SECTION = """**上文摘要(同一文档中紧邻的前文, 仅用于理解指代和背景):**
+{context}
+
+注意: 只从下面的"文本内容"中抽取事项, 不要抽取只在上文摘要中出现的事项;
+可以用上文摘要补全文本内容中省略的主语、时间、地点等信息。
+
+"""
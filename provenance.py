@@ -0,0 +1,164 @@
+"""
+段落级溯源与局部重抽取
+references 中的切片ID(文件名_slice_序号)随切片参数和文件编辑而变化, 也无法映射回原文位置。
+这里为每个规范化段落生成稳定的段落ID:
+    p-<内容哈希前 12 位>[-n]    相同内容在文档中第 n 次(n>1)出现时加序号
+并记录它在文档内容(规范化段落以空行拼接, 即 read_document 的返回值)中的字符偏移和完整内容哈希。
+段落ID只由段落内容决定, 不随切片参数、前后段落的增删而变化。
+切片记录所覆盖的段落, 抽取出的事项在 provenance 字段中携带这些段落:
+    "provenance": [{"document": "wiki/a.md", "paragraph_id": "p-1a2b3c4d5e6f", "start": 120, "end": 480,
+                    "sha256": "..."}]
+跨文件去重合并事项时, 来源段落按 (文档, 段落ID) 合并。
+
+局部重抽取(--manifest): 清单保存每个文件上次的窗口划分(每个窗口的段落块哈希序列)。
+文件被编辑后重新切片时, 仍完整存在的旧窗口原样保留, 只在变化的段落附近重新划分, 随后的窗口与旧划分重新对齐。
+否则在文件开头插入一个段落就会让之后所有固定步长的窗口错位, 每个切片的文本都变化而全部重新调用模型;
+对齐后只有覆盖了变化段落的切片文本不同, 其余切片命中切片缓存。
+(context 模式下, 紧跟在变化段落之后的切片上文摘要也会变化, 同样重新抽取。)
+"""
+
+import hashlib
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 事项携带溯源字段的格式版本, 计入流水线版本(旧缓存结果没有 provenance 字段)
+PROVENANCE_VERSION = 1
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ParagraphSpan:
+    """段落ID、在文档内容中的字符区间 [start, end) 与内容哈希"""
+
+    __slots__ = ("paragraph_id", "start", "end", "sha256")
+
+    def __init__(self, paragraph_id: str, start: int, end: int, sha256: str):
+        self.paragraph_id = paragraph_id
+        self.start = start
+        self.end = end
+        self.sha256 = sha256
+
+    def to_dict(self, document: Optional[str] = None) -> Dict:
+        data = {"document": document} if document is not None else {}
+        data.update({"paragraph_id": self.paragraph_id, "start": self.start, "end": self.end, "sha256": self.sha256})
+        return data
+
+
+def paragraph_spans(paragraphs: Sequence[str]) -> List[ParagraphSpan]:
+    """为规范化后的段落列表生成段落ID与偏移"""
+    spans = []
+    occurrences = defaultdict(int)
+    offset = 0
+    for paragraph in paragraphs:
+        digest = content_hash(paragraph)
+        occurrences[digest] += 1
+        paragraph_id = f"p-{digest[:12]}"
+        if occurrences[digest] > 1:
+            paragraph_id += f"-{occurrences[digest]}"
+        spans.append(ParagraphSpan(paragraph_id, offset, offset + len(paragraph), digest))
+        offset += len(paragraph) + 2
+    return spans
+
+
+class SliceSource:
+    """
+    切片及其来源
+    Attributes:
+        text: 切片文本
+        paragraphs: 覆盖的段落(ParagraphSpan, 按文档顺序)
+        window: 滑动窗口切片的段落块哈希序列(记入清单供下次对齐); 表格分块切片为 None
+    """
+
+    __slots__ = ("text", "paragraphs", "window")
+
+    def __init__(self, text: str, paragraphs: List[ParagraphSpan], window: Optional[Tuple[str, ...]] = None):
+        self.text = text
+        self.paragraphs = paragraphs
+        self.window = window
+
+    def provenance(self, document: Optional[str] = None) -> List[Dict]:
+        return [span.to_dict(document) for span in self.paragraphs]
+
+
+def align_windows(keys: Sequence[str], previous_windows: Optional[Sequence[Sequence[str]]]) -> Dict[int, int]:
+    """
+    在当前段落块序列中查找仍完整存在的旧窗口
+    Returns:
+        {起始位置: 窗口长度}
+    """
+    if not previous_windows:
+        return {}
+    positions = defaultdict(list)
+    for position, key in enumerate(keys):
+        positions[key].append(position)
+    reusable = {}
+    for window in previous_windows:
+        if not window:
+            continue
+        window = tuple(window)
+        for start in positions.get(window[0], ()):
+            if start not in reusable and tuple(keys[start:start + len(window)]) == window:
+                reusable[start] = len(window)
+                break
+    return reusable
+
+
+def plan_windows(count: int, window_size: int, overlap: int,
+                 reusable: Optional[Dict[int, int]] = None) -> List[Tuple[int, int]]:
+    """
+    滑动窗口划分 [(起始, 结束)]
+    没有可复用窗口时与固定步长(window_size - overlap)的滑动窗口完全一致;
+    有可复用窗口时保留这些窗口, 并缩短它们之前的新窗口, 使下一个窗口恰好从旧窗口的起点开始。
+    """
+    reusable = reusable or {}
+    step = window_size - overlap
+    windows = []
+    start = 0
+    while start < count:
+        size = reusable.get(start)
+        if size is None:
+            size = window_size
+            for following in range(start + 1, start + step + 1):
+                if following in reusable:
+                    size = following - start + overlap
+                    break
+        end = min(start + size, count)
+        windows.append((start, end))
+        if end >= count:
+            break
+        start += max(1, size - overlap)
+    return windows
+
+
+def _self_check():
+    """编辑文档后对齐旧窗口: 只有覆盖变化段落的窗口不同"""
+    paragraphs = [f"第{i}段内容" for i in range(10)]
+    keys = [content_hash(p)[:16] for p in paragraphs]
+    old = [tuple(keys[s:e]) for s, e in plan_windows(len(keys), 3, 1)]
+    assert plan_windows(len(keys), 3, 1) == [(0, 3), (2, 5), (4, 7), (6, 9), (8, 10)]
+
+    # 开头插入一个段落: 固定步长下所有窗口错位, 对齐后只多一个新窗口
+    edited = ["新增段落"] + paragraphs
+    new_keys = [content_hash(p)[:16] for p in edited]
+    aligned = [tuple(new_keys[s:e]) for s, e in plan_windows(len(new_keys), 3, 1, align_windows(new_keys, old))]
+    fixed = [tuple(new_keys[s:e]) for s, e in plan_windows(len(new_keys), 3, 1)]
+    assert not set(fixed) & set(old)
+    assert set(old) <= set(aligned) and len(set(aligned) - set(old)) == 1
+
+    # 修改中间一个段落: 只有包含它的窗口变化
+    edited = list(paragraphs)
+    edited[5] = "修改后的第5段"
+    new_keys = [content_hash(p)[:16] for p in edited]
+    aligned = [tuple(new_keys[s:e]) for s, e in plan_windows(len(new_keys), 3, 1, align_windows(new_keys, old))]
+    assert len(set(aligned) - set(old)) == 1
+
+    spans = paragraph_spans(["甲乙丙", "丁戊", "甲乙丙"])
+    assert [(s.start, s.end) for s in spans] == [(0, 3), (5, 7), (9, 12)]
+    assert spans[2].paragraph_id == spans[0].paragraph_id + "-2"
+    print("溯源与窗口对齐检查通过")
+
+
+if __name__ == "__main__":
+    _self_check()
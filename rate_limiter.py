@@ -0,0 +1,124 @@
+"""
+RPM/TPM 限流器(线程安全)
+按 60 秒滑动窗口统计请求数和 token 数。请求发出前按 "预估输入 + max_tokens" 预留额度,
+响应返回后按实际用量结算; 因此 max_tokens 预测得越准, 同样的 TPM 额度内能并发的请求越多。
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+_WINDOW_SECONDS = 60.0
+
+
+class Reservation:
+    """一次请求预留的额度"""
+
+    __slots__ = ("timestamp", "tokens")
+
+    def __init__(self, timestamp: float, tokens: int):
+        self.timestamp = timestamp
+        self.tokens = tokens
+
+
+class RateLimiter:
+    """滑动窗口限流, rpm/tpm 为 None 表示不限制"""
+
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._window = deque()      # Reservation, 按时间排序
+        self._tokens_in_window = 0
+        self._cond = threading.Condition()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.rpm or self.tpm)
+
+    def _expire(self, now: float):
+        while self._window and now - self._window[0].timestamp >= _WINDOW_SECONDS:
+            self._tokens_in_window -= self._window.popleft().tokens
+
+    def _wait_time(self, now: float, tokens: int) -> float:
+        """当前还需等待多久才能预留 tokens, 0 表示可以立即发出"""
+        if self.rpm and len(self._window) >= self.rpm:
+            return self._window[0].timestamp + _WINDOW_SECONDS - now
+        if self.tpm and self._window and self._tokens_in_window + tokens > self.tpm:
+            # 释放到足够额度为止
+            needed = self._tokens_in_window + tokens - self.tpm
+            for reservation in self._window:
+                needed -= reservation.tokens
+                if needed <= 0:
+                    return reservation.timestamp + _WINDOW_SECONDS - now
+            # 单个请求超过 TPM 上限: 等窗口清空后再发
+            return self._window[-1].timestamp + _WINDOW_SECONDS - now
+        return 0.0
+
+    def wait_time(self, tokens: int) -> float:
+        """预留 tokens 还需等待的秒数, 0 表示可以立即发出"""
+        with self._cond:
+            now = time.monotonic()
+            self._expire(now)
+            return max(0.0, self._wait_time(now, tokens))
+
+    def try_acquire(self, tokens: int) -> Optional[Reservation]:
+        """不等待, 额度不足时返回 None"""
+        with self._cond:
+            now = time.monotonic()
+            self._expire(now)
+            if self._wait_time(now, tokens) > 0:
+                return None
+            return self._reserve(now, tokens)
+
+    def acquire(self, tokens: int) -> Reservation:
+        """阻塞直到可以预留 tokens"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+                wait = self._wait_time(now, tokens)
+                if wait <= 0:
+                    return self._reserve(now, tokens)
+                self._cond.wait(timeout=wait)
+
+    def _reserve(self, now: float, tokens: int) -> Reservation:
+        reservation = Reservation(now, tokens)
+        self._window.append(reservation)
+        self._tokens_in_window += tokens
+        return reservation
+
+    def settle(self, reservation: Reservation, actual_tokens: Optional[int]):
+        """按实际用量结算, 多预留的部分立即归还"""
+        if actual_tokens is None or reservation is None:
+            return
+        with self._cond:
+            if reservation.tokens == actual_tokens:
+                return
+            if any(r is reservation for r in self._window):
+                self._tokens_in_window += actual_tokens - reservation.tokens
+            reservation.tokens = actual_tokens
+            self._cond.notify_all()
+
+    def cancel(self, reservation: Optional[Reservation]):
+        """撤销未发出的请求的预留(请求数与 token 额度都归还)"""
+        if reservation is None:
+            return
+        with self._cond:
+            for i, r in enumerate(self._window):
+                if r is reservation:
+                    del self._window[i]
+                    self._tokens_in_window -= r.tokens
+                    self._cond.notify_all()
+                    break
+
+    def remaining(self) -> float:
+        """剩余额度比例(0-1), 取 RPM 与 TPM 中更紧的一项"""
+        with self._cond:
+            self._expire(time.monotonic())
+            ratios = []
+            if self.rpm:
+                ratios.append(1 - len(self._window) / self.rpm)
+            if self.tpm:
+                ratios.append(1 - self._tokens_in_window / self.tpm)
+        return max(0.0, min(ratios)) if ratios else 1.0
@@ -0,0 +1,125 @@
+"""
+基于成本估计的切片调度
+并发抽取时, 如果按 metadata.json 的顺序派发, 一个超大文件排在末尾就会让整个运行拖着长尾。
+这里先估计每个切片的 prompt/completion token 成本, 再按 LPT(最长任务优先)顺序派发以缩短总耗时;
+同时按文件跟踪完成情况, 一个文件的切片全部完成后立即回调, 让文件级去重和检查点尽早进行。
+
+调度策略:
+- file-lpt: 文件按总成本降序, 文件内切片按成本降序 (默认; 兼顾总耗时和文件尽早完成)
+- lpt:      全局按切片成本降序 (总耗时最优, 文件完成较晚)
+- fifo:     原始顺序
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+from token_budget import estimate_tokens
+
+SCHEDULE_STRATEGIES = ["file-lpt", "lpt", "fifo"]
+
+# 输出 token 数 ≈ 输入 token 数 × 系数 + 固定开销(JSON 外壳)
+_COMPLETION_RATIO = 1.2
+_COMPLETION_BASE = 60
+# 生成一个 token 的耗时远大于预填充一个 token
+_PREFILL_WEIGHT = 0.05
+
+
+class SliceTask:
+    """一次模型调用: 代表切片, 以及复用其结果的重复切片"""
+
+    __slots__ = (
+        "file_key", "slice_index", "slice_id", "text", "max_tokens", "context",
+        "followers", "prompt_tokens", "completion_tokens", "cost",
+    )
+
+    def __init__(self, file_key: str, slice_index: int, slice_id: str, text: str, max_tokens: int = 2000,
+                 context: str = ""):
+        self.file_key = file_key
+        self.slice_index = slice_index
+        self.slice_id = slice_id
+        self.text = text
+        self.max_tokens = max_tokens
+        # 不重叠切片时随 prompt 发送的上文摘要(见 slice_context.py)
+        self.context = context
+        # 复用本任务结果的重复切片: [(file_key, slice_index, slice_id)]
+        self.followers = []
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+
+
+def estimate_slice_cost(task: SliceTask, prompt_overhead_tokens: int = 0,
+                        completion_ratio: float = _COMPLETION_RATIO) -> float:
+    """估计单个切片的 token 成本, 结果写回 task"""
+    slice_tokens = estimate_tokens(task.text)
+    context_tokens = estimate_tokens(task.context) if task.context else 0
+    task.prompt_tokens = prompt_overhead_tokens + slice_tokens + context_tokens
+    task.completion_tokens = min(task.max_tokens, int(_COMPLETION_BASE + slice_tokens * completion_ratio))
+    task.cost = task.prompt_tokens * _PREFILL_WEIGHT + task.completion_tokens
+    return task.cost
+
+
+def order_tasks(tasks: List[SliceTask], strategy: str = "file-lpt") -> List[SliceTask]:
+    """按调度策略排序"""
+    if strategy == "fifo":
+        return list(tasks)
+    if strategy == "lpt":
+        return sorted(tasks, key=lambda t: t.cost, reverse=True)
+    if strategy == "file-lpt":
+        file_cost = {}
+        for task in tasks:
+            file_cost[task.file_key] = file_cost.get(task.file_key, 0.0) + task.cost
+        return sorted(tasks, key=lambda t: (-file_cost[t.file_key], t.file_key, -t.cost))
+    raise ValueError(f"不支持的调度策略: {strategy}")
+
+
+class SliceScheduler:
+    """
+    并发执行切片任务, 并按文件跟踪完成情况
+
+    回调均在调用 run() 的线程中执行, 因此文件去重、检查点写入不需要加锁
+    """
+
+    def __init__(self, max_workers: int = 4, strategy: str = "file-lpt"):
+        if strategy not in SCHEDULE_STRATEGIES:
+            raise ValueError(f"不支持的调度策略: {strategy}")
+        self.max_workers = max(1, max_workers)
+        self.strategy = strategy
+
+    def run(
+        self,
+        tasks: List[SliceTask],
+        worker: Callable[[SliceTask], List[Dict]],
+        on_task_done: Callable[[SliceTask, Optional[List[Dict]], Optional[Exception]], None],
+        on_file_done: Callable[[str], None],
+    ):
+        """
+        Args:
+            tasks: 待执行的切片任务
+            worker: 执行单个任务, 返回事件列表(在线程池中调用)
+            on_task_done: 任务完成回调 (task, events, error), 负责记录结果并分发给重复切片
+            on_file_done: 文件的所有切片(含重复切片)都已完成时回调
+        """
+        pending = {}
+        for task in tasks:
+            pending[task.file_key] = pending.get(task.file_key, 0) + 1
+            for file_key, _, _ in task.followers:
+                pending[file_key] = pending.get(file_key, 0) + 1
+
+        ordered = order_tasks(tasks, self.strategy)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            # 线程池按提交顺序派发, 提交顺序即调度顺序
+            futures = {pool.submit(worker, task): task for task in ordered}
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    events, error = future.result(), None
+                except Exception as e:
+                    events, error = None, e
+                on_task_done(task, events, error)
+
+                finished_files = [task.file_key] + [f for f, _, _ in task.followers]
+                for file_key in finished_files:
+                    pending[file_key] -= 1
+                    if pending[file_key] == 0:
+                        on_file_done(file_key)
@@ -0,0 +1,285 @@
+"""
+事件 Schema 校验与修复
+根据 config.SCHEMA 一次性编译出校验函数(而不是对每条事件解释执行 schema),
+批量完成: 字段校验 -> 缺失字段修复 -> value 按 value_type 类型化 -> 过滤无效事项
+"""
+
+import re
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import SCHEMA
+
+# 全局统计(多线程抽取时共享)
+VALIDATION_STATS = Counter()
+_stats_lock = threading.Lock()
+
+_TRUE_VALUES = {"true", "yes", "1", "是", "对", "有", "真"}
+_FALSE_VALUES = {"false", "no", "0", "否", "错", "无", "假"}
+
+# 常见日期写法: 2024-01-15 / 2024/1/15 / 2024.1.15 / 2024年1月15日 / 2024年1月 / 2024年
+_DATE_PATTERN = re.compile(
+    r"^\s*(\d{4})\s*(?:[-/.年]\s*(\d{1,2})\s*(?:[-/.月]\s*(\d{1,2})\s*日?)?\s*月?)?\s*年?"
+    r"(?:[T\s]+(\d{1,2}):(\d{2})(?::(\d{2}))?)?\s*$"
+)
+_NUMBER_CLEAN = re.compile(r"[,，\s]")
+
+
+def _coerce_int(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    text = _NUMBER_CLEAN.sub("", str(value))
+    try:
+        return int(text)
+    except ValueError:
+        try:
+            number = float(text)
+        except ValueError:
+            return None
+        return int(number) if number.is_integer() else None
+
+
+def _coerce_float(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = _NUMBER_CLEAN.sub("", str(value))
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _coerce_datetime(value):
+    """标准化为 ISO 字符串(JSON 输出需要字符串),精度与原文一致: 2024 / 2024-01 / 2024-01-15"""
+    match = _DATE_PATTERN.match(str(value))
+    if not match:
+        return None
+    year, month, day, hour, minute, second = match.groups()
+    if month and not 1 <= int(month) <= 12:
+        return None
+    if day and not 1 <= int(day) <= 31:
+        return None
+    iso = year
+    if month:
+        iso += f"-{int(month):02d}"
+        if day:
+            iso += f"-{int(day):02d}"
+            if hour:
+                iso += f"T{int(hour):02d}:{minute}:{second or '00'}"
+    return iso
+
+
+def _coerce_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE_VALUES:
+        return True
+    if text in _FALSE_VALUES:
+        return False
+    return None
+
+
+_COERCERS = {
+    "int": _coerce_int,
+    "float": _coerce_float,
+    "datetime": _coerce_datetime,
+    "bool": _coerce_bool,
+}
+
+
+def _compile_string_field(field: str, required: bool) -> Callable:
+    """字符串字段: 非字符串标量转为字符串并去除首尾空白"""
+    def check(obj, stats):
+        value = obj.get(field)
+        if value is None:
+            if required:
+                obj[field] = ""
+                stats["repaired_missing_field"] += 1
+            return True
+        if not isinstance(value, str):
+            if isinstance(value, (dict, list)):
+                return False
+            value = str(value)
+            stats["repaired_type"] += 1
+        obj[field] = value.strip()
+        return True
+    return check
+
+
+def _compile_entity_validator(entity_schema: Dict) -> Callable:
+    """编译实体校验函数, 返回 None 表示丢弃该实体"""
+    properties = entity_schema.get("properties", {})
+    required = set(entity_schema.get("required", []))
+    string_checks = [
+        _compile_string_field(name, name in required)
+        for name, prop in properties.items()
+        if prop.get("type") == "string" and name not in ("value", "value_type")
+    ]
+    value_types = set(properties.get("value_type", {}).get("enum", []))
+
+    def validate_entity(entity, stats):
+        if not isinstance(entity, dict):
+            return None
+        for check in string_checks:
+            if not check(entity, stats):
+                return None
+        if not entity.get("name") or not entity.get("type"):
+            return None
+        entity["type"] = entity["type"].lower()
+
+        value_type = entity.get("value_type")
+        if value_type is None:
+            return entity
+        value_type = str(value_type).strip().lower()
+        if value_type not in value_types:
+            entity["value_type"] = "text"
+            stats["repaired_value_type"] += 1
+            return entity
+        entity["value_type"] = value_type
+
+        coercer = _COERCERS.get(value_type)
+        if coercer is None or entity.get("value") in (None, ""):
+            return entity
+        coerced = coercer(entity["value"])
+        if coerced is None:
+            # 无法按声明类型解析,退化为文本值
+            entity["value_type"] = "text"
+            entity["value"] = str(entity["value"])
+            stats["repaired_value_type"] += 1
+        else:
+            entity["value"] = coerced
+            stats["coerced_values"] += 1
+        return entity
+
+    return validate_entity
+
+
+def compile_event_validator(schema: Dict = SCHEMA) -> Callable:
+    """
+    由 schema 编译事件校验函数
+    Returns:
+        validate_event(event, slice_id, stats) -> 修复后的事件 或 None(应丢弃)
+    """
+    event_schema = schema["properties"]["events"]["items"]
+    properties = event_schema["properties"]
+    required = set(event_schema.get("required", []))
+
+    string_checks = [
+        _compile_string_field(name, name in required)
+        for name, prop in properties.items()
+        if prop.get("type") == "string"
+    ]
+    # title 与 content 为空的事项没有信息量,去重阶段同样会跳过
+    non_empty_fields = [name for name in ("title", "content") if name in properties]
+    validate_entity = _compile_entity_validator(properties["entities"]["items"])
+
+    def validate_event(event, slice_id, stats):
+        if not isinstance(event, dict):
+            stats["dropped_malformed"] += 1
+            return None
+
+        # is_valid=false 的事项(广告/乱码/纯链接)直接过滤
+        is_valid = event.get("is_valid", True)
+        if not isinstance(is_valid, bool):
+            is_valid = _coerce_bool(is_valid)
+            if is_valid is None:
+                is_valid = True
+            stats["repaired_type"] += 1
+        if not is_valid:
+            stats["dropped_invalid"] += 1
+            return None
+        event["is_valid"] = True
+
+        for check in string_checks:
+            if not check(event, stats):
+                stats["dropped_malformed"] += 1
+                return None
+        for name in non_empty_fields:
+            if not event[name]:
+                stats["dropped_malformed"] += 1
+                return None
+
+        references = event.get("references")
+        if isinstance(references, str):
+            references = [references]
+        if isinstance(references, list):
+            references = [str(r).strip() for r in references if str(r).strip()]
+        if not references:
+            references = [slice_id] if slice_id else []
+            stats["repaired_references"] += 1
+        event["references"] = references
+
+        entities = event.get("entities")
+        if not isinstance(entities, list):
+            entities = []
+            stats["repaired_missing_field"] += 1
+        clean_entities = []
+        seen_names = set()
+        for entity in entities:
+            entity = validate_entity(entity, stats)
+            if entity is None:
+                stats["dropped_entities"] += 1
+                continue
+            if entity["name"] in seen_names:
+                stats["dropped_duplicate_entities"] += 1
+                continue
+            seen_names.add(entity["name"])
+            clean_entities.append(entity)
+        event["entities"] = clean_entities
+
+        return event
+
+    return validate_event
+
+
+# 模块加载时编译一次
+_validate_event = compile_event_validator(SCHEMA)
+
+
+def validate_events(events: List, slice_id: Optional[str] = None) -> Tuple[List[Dict], Dict]:
+    """
+    批量校验、修复并过滤事件
+    Args:
+        events: 模型返回的事件列表
+        slice_id: 切片ID, 用于补全缺失的 references
+    Returns:
+        (有效事件列表, 本批次统计)
+    """
+    stats = Counter()
+    clean = []
+    for event in events:
+        stats["total"] += 1
+        event = _validate_event(event, slice_id, stats)
+        if event is not None:
+            clean.append(event)
+    stats["kept"] = len(clean)
+
+    with _stats_lock:
+        VALIDATION_STATS.update(stats)
+
+    return clean, dict(stats)
+
+
+def format_validation_stats(stats: Dict = None) -> str:
+    """格式化统计信息, 用于运行结束时打印"""
+    stats = VALIDATION_STATS if stats is None else stats
+    total = stats.get("total", 0)
+    if not total:
+        return "Schema校验: 无事件"
+    kept = stats.get("kept", 0)
+    return (
+        f"Schema校验: 共 {total} 个事件, 保留 {kept} 个 ({kept / total:.1%}), "
+        f"无效过滤 {stats.get('dropped_invalid', 0)}, "
+        f"结构错误 {stats.get('dropped_malformed', 0)}, "
+        f"补全references {stats.get('repaired_references', 0)}, "
+        f"值类型化 {stats.get('coerced_values', 0)}, "
+        f"丢弃实体 {stats.get('dropped_entities', 0) + stats.get('dropped_duplicate_entities', 0)}"
+    )
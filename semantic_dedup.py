@@ -0,0 +1,236 @@
+"""
+基于向量相似度的语义去重
+deduplicate_events 用 SequenceMatcher 逐对比较, 换一种说法的同一事实识别不出, 且耗时随事件数平方增长。
+这里把每个事件的 title + summary 编码为向量, 逐个插入增量近邻索引, 只与 top-k 近邻比较,
+相似度超过阈值即合并, 全量去重的开销接近线性。
+
+编码器:
+- hash(默认): 字符 n-gram 哈希稀疏向量, 纯 Python, 无需额外依赖; 只能识别措辞相近的重复
+- 句向量模型: 传入 sentence-transformers 模型名, 如 BAAI/bge-small-zh-v1.5 (需 sentence-transformers)
+年份不同的两个事件(如不同届的同名赛事)向量很接近, 不予合并
+索引:
+- 稀疏向量: 倒排索引, 只在最稀有的若干特征的倒排表中召回候选, 再精确计算余弦相似度
+- 稠密向量: 安装 hnswlib 时使用 HNSW, 否则退回暴力检索; 暴力检索是 O(n²),
+  只与最近入库的 brute_force_limit 个向量比较(默认 5000), 大规模去重请安装 hnswlib
+"""
+
+import hashlib
+import math
+import re
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+HASH_EMBEDDER = "hash"
+
+# 各编码器的默认合并阈值(余弦相似度)
+_DEFAULT_THRESHOLDS = {HASH_EMBEDDER: 0.65}
+_MODEL_THRESHOLD = 0.88
+
+_NON_WORD = re.compile(r"[\s\W_]+")
+_YEAR = re.compile(r"(?<!\d)(1\d{3}|20\d{2})(?!\d)")
+
+
+def _event_text(event: Dict) -> str:
+    return f"{event.get('title', '')} {event.get('summary', '')}".strip()
+
+
+def _years_conflict(a: str, b: str) -> bool:
+    """两段文本都提到年份且没有共同年份"""
+    years_a, years_b = set(_YEAR.findall(a)), set(_YEAR.findall(b))
+    return bool(years_a and years_b and not years_a & years_b)
+
+
+class HashingEmbedder:
+    """字符 1-3 gram 哈希为稀疏向量(特征ID -> 权重), L2 归一化"""
+
+    def __init__(self, dim: int = 1 << 20, ngram_range: Tuple[int, int] = (1, 3)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def _feature(self, gram: str) -> int:
+        digest = hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") % self.dim
+
+    def embed(self, texts: Sequence[str]) -> List[Dict[int, float]]:
+        vectors = []
+        low, high = self.ngram_range
+        for text in texts:
+            text = _NON_WORD.sub(" ", text.lower()).strip()
+            counts = defaultdict(float)
+            for n in range(low, high + 1):
+                # 单字权重较低, 避免常用字主导相似度
+                weight = 0.5 if n == 1 else 1.0
+                for i in range(len(text) - n + 1):
+                    gram = text[i:i + n]
+                    if " " in gram:
+                        continue
+                    counts[self._feature(gram)] += weight
+            norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+            vectors.append({k: v / norm for k, v in counts.items()})
+        return vectors
+
+
+class SentenceEmbedder:
+    """sentence-transformers 句向量(CPU 上的小模型即可)"""
+
+    def __init__(self, model_name: str, batch_size: int = 64):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError("语义去重使用句向量模型需要安装 sentence-transformers: pip install sentence-transformers")
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.batch_size = batch_size
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        vectors = self.model.encode(list(texts), batch_size=self.batch_size, normalize_embeddings=True)
+        return [list(map(float, v)) for v in vectors]
+
+
+class SparseIndex:
+    """
+    稀疏向量的增量倒排索引
+    查询时只在文档频率最低的 probe 个特征的倒排表中召回候选, 再精确计算余弦相似度
+    """
+
+    def __init__(self, probe: int = 16, max_postings: int = 2000):
+        self.probe = probe
+        self.max_postings = max_postings
+        self._postings = defaultdict(list)
+        self._vectors = []
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def _probe_features(self, vector: Dict[int, float]) -> List[int]:
+        # 优先使用稀有特征; 索引中没有的特征召回不到候选, 过长的倒排表(高频 n-gram)召回价值低, 都跳过
+        features = [f for f in vector if 0 < len(self._postings.get(f, ())) < self.max_postings]
+        features.sort(key=lambda f: (len(self._postings[f]), -vector[f]))
+        return features[:self.probe]
+
+    def query(self, vector: Dict[int, float], k: int) -> List[Tuple[int, float]]:
+        candidates = set()
+        for feature in self._probe_features(vector):
+            candidates.update(self._postings.get(feature, ()))
+        scored = []
+        for label in candidates:
+            other = self._vectors[label]
+            if len(other) < len(vector):
+                sim = sum(w * vector.get(f, 0.0) for f, w in other.items())
+            else:
+                sim = sum(w * other.get(f, 0.0) for f, w in vector.items())
+            scored.append((label, sim))
+        scored.sort(key=lambda item: -item[1])
+        return scored[:k]
+
+    def add(self, vector: Dict[int, float]) -> int:
+        label = len(self._vectors)
+        self._vectors.append(vector)
+        for feature in vector:
+            self._postings[feature].append(label)
+        return label
+
+
+class DenseIndex:
+    """稠密向量索引: 优先 hnswlib(HNSW), 未安装时暴力检索(只检索最近的 brute_force_limit 个向量)"""
+
+    def __init__(self, initial_capacity: int = 10000, brute_force_limit: int = 5000):
+        self._capacity = initial_capacity
+        self.brute_force_limit = brute_force_limit
+        self._hnsw = None
+        self._vectors = []
+        try:
+            import hnswlib
+            self._hnswlib = hnswlib
+        except ImportError:
+            self._hnswlib = None
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def query(self, vector: List[float], k: int) -> List[Tuple[int, float]]:
+        if not self._vectors:
+            return []
+        k = min(k, len(self._vectors))
+        if self._hnsw is not None:
+            labels, distances = self._hnsw.knn_query([vector], k=k)
+            return [(int(label), 1.0 - float(dist)) for label, dist in zip(labels[0], distances[0])]
+        first = max(0, len(self._vectors) - self.brute_force_limit)
+        scored = [(label, sum(a * b for a, b in zip(vector, self._vectors[label])))
+                  for label in range(first, len(self._vectors))]
+        scored.sort(key=lambda item: -item[1])
+        return scored[:k]
+
+    def add(self, vector: List[float]) -> int:
+        label = len(self._vectors)
+        self._vectors.append(vector)
+        if self._hnswlib is not None:
+            if self._hnsw is None:
+                self._hnsw = self._hnswlib.Index(space="cosine", dim=len(vector))
+                self._hnsw.init_index(max_elements=self._capacity, ef_construction=200, M=16)
+                self._hnsw.set_ef(64)
+            elif label >= self._capacity:
+                self._capacity *= 2
+                self._hnsw.resize_index(self._capacity)
+            self._hnsw.add_items([vector], [label])
+        return label
+
+
+class SemanticDeduplicator:
+    """增量语义去重: 每个新事件与索引中的 top-k 近邻比较, 超过阈值则并入最相似的事件"""
+
+    def __init__(self, embedder: str = HASH_EMBEDDER, threshold: Optional[float] = None, k: int = 10):
+        """
+        Args:
+            embedder: "hash" 或 sentence-transformers 模型名
+            threshold: 合并阈值(余弦相似度), 默认按编码器选择
+            k: 每次查询的近邻数
+        """
+        self.embedder = HashingEmbedder() if embedder == HASH_EMBEDDER else SentenceEmbedder(embedder)
+        self.embedder_name = embedder
+        self.threshold = threshold if threshold is not None else _DEFAULT_THRESHOLDS.get(embedder, _MODEL_THRESHOLD)
+        self.k = k
+        self.stats = {"events": 0, "merged": 0}
+
+    def _new_index(self):
+        return SparseIndex() if self.embedder_name == HASH_EMBEDDER else DenseIndex()
+
+    def deduplicate(self, events: List[Dict], merge: Callable[[Dict, Dict], Dict]) -> List[Dict]:
+        """
+        Args:
+            events: 待去重事件
+            merge: 合并函数 (已有事件, 新事件) -> 合并后的事件
+        每次调用使用新的索引, 索引标签只指向本次调用的去重结果
+        """
+        index = self._new_index()
+        labels = []         # 索引标签 -> 去重结果中的位置
+        unique = []
+        texts = []          # 索引标签 -> 入库时的文本(用于年份校验)
+        valid = [e for e in events if e.get("content") and e.get("title")]
+        valid_texts = [_event_text(e) for e in valid]
+        vectors = self.embedder.embed(valid_texts)
+        for event, text, vector in zip(valid, valid_texts, vectors):
+            self.stats["events"] += 1
+            match = None
+            for label, similarity in index.query(vector, self.k):
+                if similarity < self.threshold:
+                    break
+                if not _years_conflict(text, texts[label]):
+                    match = label
+                    break
+            if match is not None:
+                position = labels[match]
+                unique[position] = merge(unique[position], event)
+                self.stats["merged"] += 1
+                continue
+            index.add(vector)
+            labels.append(len(unique))
+            texts.append(text)
+            unique.append(event)
+        return unique
+
+    def format_stats(self) -> str:
+        s = self.stats
+        return (
+            f"语义去重({self.embedder_name}, 阈值 {self.threshold}): "
+            f"{s['events']} 个事件, 合并 {s['merged']} 个"
+        )
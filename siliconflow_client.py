@@ -1,53 +1,259 @@
 """
 SiliconFlow API 客户端 - 兼容 OpenAI 接口
 """
-from openai import OpenAI
 import os
 import sys
 import codecs
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-# Windows控制台UTF-8编码
-if sys.platform == "win32":
-    sys.stdout = codecs.getwriter("utf-8")(sys.stdout.detach())
+from config import load_env
+from rate_limiter import RateLimiter
+from token_budget import estimate_tokens
 
-# 加载.env文件
-def load_env():
-    env_path = os.path.join(os.path.dirname(__file__), '.env')
-    if os.path.exists(env_path):
-        with open(env_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    os.environ[key.strip()] = value.strip()
 
-load_env()
+DEFAULT_MODEL = "Qwen/Qwen3-8B"
+DEFAULT_BASE_URL = "https://api.siliconflow.cn/v1"
+
+
+def _env_int(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+class LatencyTracker:
+    """
+    在线统计最近请求延迟的分位数, 作为对冲请求的触发阈值
+    延迟主要由生成长度决定, 因此统计的是 "耗时 / max_tokens", 使用时再按本次请求的 max_tokens 换算
+    """
+
+    def __init__(self, percentile=0.95, window=200, min_samples=20):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._threshold = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds, max_tokens):
+        with self._lock:
+            self._samples.append(seconds / max(1, max_tokens))
+            self._threshold = None
+
+    def threshold(self, max_tokens):
+        """本次请求的延迟阈值(秒), 样本不足时返回 None"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            if self._threshold is None:
+                ordered = sorted(self._samples)
+                self._threshold = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+            return self._threshold * max(1, max_tokens)
+
+
+def _status_code(error):
+    """从 openai 异常中取 HTTP 状态码"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def _is_transient(error):
+    """超时、连接错误和 5xx 等可以重试的错误"""
+    status = _status_code(error)
+    if status is None:
+        return isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__ in (
+            "APIConnectionError", "APITimeoutError"
+        )
+    return status in (408, 409) or status >= 500
+
+
+class ApiKey:
+    """密钥池中的一个 API Key: 独立的 OpenAI 客户端、限流状态和隔离期"""
+
+    def __init__(self, api_key, client, limiter):
+        self.label = f"...{api_key[-4:]}" if len(api_key) > 8 else "***"
+        self.client = client
+        self.limiter = limiter
+        self.quarantined_until = 0.0
+        self.auth_failed = False    # 当前隔离是否由 401/403 引起(等待无法恢复)
+        self.strikes = 0
+        self.inflight = 0
+        self.stats = {"requests": 0, "rate_limited": 0, "auth_failed": 0}
+
+
+class KeyPool:
+    """
+    多个 API Key 的额度分片: 每个 Key 按各自账号的 RPM/TPM 限流, 请求发给剩余额度最多的 Key;
+    遇到 429 的 Key 短暂隔离(连续触发时翻倍), 遇到 401/403 的 Key 长时间隔离。
+    剩余额度相同(如未配置限流)时, 发给进行中请求最少的 Key
+    """
+
+    RATE_LIMIT_COOLDOWN = 15.0
+    AUTH_COOLDOWN = 600.0
+    MAX_COOLDOWN = 600.0
+
+    def __init__(self, keys):
+        self.keys = keys
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return any(key.limiter.enabled for key in self.keys)
+
+    def _available(self, now):
+        return [key for key in self.keys if key.quarantined_until <= now]
+
+    def remaining(self):
+        """未隔离 Key 的平均剩余额度比例(0-1)"""
+        available = self._available(time.monotonic())
+        if not available:
+            return 0.0
+        return sum(key.limiter.remaining() for key in available) / len(self.keys)
+
+    @staticmethod
+    def _rank(keys):
+        return sorted(keys, key=lambda k: (-k.limiter.remaining(), k.inflight))
+
+    def _reserve(self, keys, tokens):
+        for key in self._rank(keys):
+            reservation = key.limiter.try_acquire(tokens) if key.limiter.enabled else None
+            if reservation is not None or not key.limiter.enabled:
+                with self._lock:
+                    key.inflight += 1
+                return key, reservation
+        return None
+
+    def try_acquire(self, tokens):
+        """不等待, 所有 Key 额度都不足时返回 None; 成功时返回 (key, reservation)"""
+        return self._reserve(self._available(time.monotonic()), tokens)
+
+    def acquire(self, tokens):
+        """阻塞直到某个 Key 可以预留 tokens, 返回 (key, reservation)"""
+        while True:
+            now = time.monotonic()
+            candidates = self._available(now)
+            if not candidates:
+                # 全部隔离时等待最早解除 429 隔离的 Key; 全部因鉴权失败隔离时等待没有意义, 直接报错
+                transient = [key for key in self.keys if not key.auth_failed]
+                if not transient:
+                    labels = ", ".join(key.label for key in self.keys)
+                    raise RuntimeError(f"所有 API Key 鉴权失败(401/403), 请检查密钥配置: {labels}")
+                first = min(transient, key=lambda k: k.quarantined_until)
+                time.sleep(max(0.0, first.quarantined_until - now))
+                candidates = [first]
+            lease = self._reserve(candidates, tokens)
+            if lease is not None:
+                return lease
+            # 等待最先恢复额度的 Key
+            time.sleep(max(0.01, min(key.limiter.wait_time(tokens) for key in candidates)))
+
+    def release(self, key):
+        with self._lock:
+            key.inflight -= 1
+
+    def report_error(self, key, error):
+        """
+        记录请求错误, 429/401/403 时隔离该 Key
+        Returns:
+            是否已隔离(调用方可换一个 Key 重试)
+        """
+        status = _status_code(error)
+        # 只有一个 Key 时无处可换, 保持原有行为(由 openai 客户端自行重试)
+        if status not in (401, 403, 429) or len(self.keys) == 1:
+            return False
+        with self._lock:
+            if status == 429:
+                key.stats["rate_limited"] += 1
+                key.strikes += 1
+                cooldown = min(self.MAX_COOLDOWN, self.RATE_LIMIT_COOLDOWN * 2 ** (key.strikes - 1))
+                key.auth_failed = False
+            else:
+                key.stats["auth_failed"] += 1
+                cooldown = self.AUTH_COOLDOWN
+                key.auth_failed = True
+            key.quarantined_until = time.monotonic() + cooldown
+        print(f"API Key {key.label} 返回 {status}, 隔离 {cooldown:.0f} 秒")
+        return True
+
+    def report_success(self, key):
+        with self._lock:
+            key.stats["requests"] += 1
+            key.strikes = 0
+            key.auth_failed = False
+
+    def format_stats(self):
+        lines = [f"API Key 池: {len(self.keys)} 个"]
+        now = time.monotonic()
+        for key in self.keys:
+            state = "隔离中" if key.quarantined_until > now else "可用"
+            lines.append(
+                f"  {key.label}: 成功 {key.stats['requests']}, 429 {key.stats['rate_limited']} 次, "
+                f"认证失败 {key.stats['auth_failed']} 次, {state}, 剩余额度 {key.limiter.remaining():.0%}"
+            )
+        return "\n".join(lines)
 
 
 class SiliconFlowClient:
     """SiliconFlow API 客户端,兼容现有接口"""
 
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, rpm=None, tpm=None, hedge=None, hedge_percentile=0.95,
+                 model=DEFAULT_MODEL, base_url=DEFAULT_BASE_URL):
         """
         初始化 SiliconFlow 客户端
         Args:
-            api_key: API密钥,如果不提供则从环境变量读取
+            api_key: API密钥, 可以是单个 Key、逗号分隔的多个 Key 或 Key 列表;
+                     不提供则读取 SILICONFLOW_API_KEYS(逗号分隔), 其次 SILICONFLOW_API_KEY
+            rpm: 每个 Key 每分钟请求数上限,不提供则读取 SILICONFLOW_RPM, 均未设置时不限流
+            tpm: 每个 Key 每分钟token数上限,不提供则读取 SILICONFLOW_TPM
+            hedge: 是否启用对冲请求,不提供则读取 SILICONFLOW_HEDGE(1/true 启用)
+            hedge_percentile: 请求耗时超过该延迟分位数仍未返回时, 发出一个重复请求
+            model: 模型名称
+            base_url: OpenAI 兼容接口地址
         """
+        load_env()
         if api_key is None:
-            api_key = os.getenv('SILICONFLOW_API_KEY')
+            api_key = os.getenv('SILICONFLOW_API_KEYS') or os.getenv('SILICONFLOW_API_KEY')
+        if isinstance(api_key, str):
+            api_key = api_key.split(',')
+        api_keys = [key.strip() for key in api_key or [] if key and key.strip()]
 
-        if not api_key:
+        if not api_keys:
             raise ValueError(
                 "未设置 SILICONFLOW_API_KEY!\n"
                 "请在 .env 文件中设置或传入 api_key 参数"
             )
 
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url="https://api.siliconflow.cn/v1"
-        )
+        # 延迟导入: 只有真正创建客户端时才加载 openai
+        from openai import OpenAI
+
+        self.model = model
+        if rpm is None:
+            rpm = _env_int('SILICONFLOW_RPM')
+        if tpm is None:
+            tpm = _env_int('SILICONFLOW_TPM')
+        # 每个 Key 对应一个账号的额度, 各自限流; 多个 Key 时 max_retries=0:
+        # 429/401/403 由密钥池换 Key 处理, 超时/5xx 由 _request 退避重试(可能换到另一个 Key)
+        self.keys = KeyPool([
+            ApiKey(key, OpenAI(api_key=key, base_url=base_url, max_retries=0 if len(api_keys) > 1 else 2),
+                   RateLimiter(rpm=rpm, tpm=tpm))
+            for key in api_keys
+        ])
 
-        print("✓ SiliconFlow API 客户端初始化成功")
+        if hedge is None:
+            hedge = os.getenv('SILICONFLOW_HEDGE', '').lower() in ('1', 'true', 'yes')
+        self.hedge = hedge
+        self.latency = LatencyTracker(percentile=hedge_percentile)
+        self.hedge_stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "no_budget": 0}
+        self._stats_lock = threading.Lock()
+        self._hedge_pool = ThreadPoolExecutor(max_workers=64, thread_name_prefix="hedge") if hedge else None
+
+        if len(api_keys) > 1:
+            print(f"✓ SiliconFlow API 客户端初始化成功 ({len(api_keys)} 个 API Key)")
+        else:
+            print("✓ SiliconFlow API 客户端初始化成功")
 
     def chat_completion(self, messages, max_tokens=2000, temperature=0.7, top_p=0.9):
         """
@@ -60,17 +266,129 @@ class SiliconFlowClient:
         Returns:
             包含 choices 的响应对象
         """
-        response = self.client.chat.completions.create(
-            model="Qwen/Qwen3-8B",
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            top_p=top_p,
-            stream=False
+        request = dict(messages=messages, max_tokens=max_tokens, temperature=temperature, top_p=top_p)
+        self._count("requests")
+        threshold = self.latency.threshold(max_tokens) if self.hedge else None
+        if threshold is None:
+            return self._request(request)
+        return self._hedged_request(request, threshold)
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.hedge_stats[key] += 1
+
+    @property
+    def limiter(self):
+        """整个密钥池的限流状态(enabled / remaining), 供路由判断是否饱和"""
+        return self.keys
+
+    def format_stats(self):
+        if len(self.keys.keys) > 1:
+            return self.format_hedge_stats() + "\n" + self.keys.format_stats()
+        return self.format_hedge_stats()
+
+    def format_hedge_stats(self):
+        stats = self.hedge_stats
+        if not self.hedge:
+            return "对冲请求: 未启用"
+        return (
+            f"对冲请求: 共 {stats['requests']} 个请求, 发出对冲 {stats['hedged']} 次, "
+            f"对冲先返回 {stats['hedge_wins']} 次, 额度不足未对冲 {stats['no_budget']} 次"
         )
 
-        # 已经是兼容格式,直接返回
-        return response
+    def _request_tokens(self, request):
+        prompt_tokens = sum(estimate_tokens(str(m.get("content", ""))) for m in request["messages"])
+        return prompt_tokens + request["max_tokens"]
+
+    def _hedged_request(self, request, threshold):
+        """
+        对冲请求: 主请求超过延迟阈值仍未返回时, 再发一个相同请求, 取先返回的结果
+        对冲请求同样计入限流额度; 额度不足时不发对冲, 继续等待主请求。
+        同步 HTTP 请求无法中途打断: 落后的请求若尚未开始则直接取消, 已在进行中的请求结果被丢弃
+        """
+        primary = self._hedge_pool.submit(self._request, request)
+        done, _ = wait([primary], timeout=threshold)
+        if done:
+            return primary.result()
+
+        lease = None
+        if self.keys.enabled:
+            lease = self.keys.try_acquire(self._request_tokens(request))
+            if lease is None:
+                self._count("no_budget")
+                return primary.result()
+
+        self._count("hedged")
+        hedge = self._hedge_pool.submit(self._request, request, lease)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        if loser.cancel() and loser is hedge and lease is not None:
+                            # 对冲请求未开始就被取消, 归还为它占用的 Key 和预留的额度
+                            self.keys.release(lease[0])
+                            lease[0].limiter.cancel(lease[1])
+                    if future is hedge:
+                        self._count("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    # 多个 Key 时(openai 客户端不自动重试)超时/5xx 的重试次数, 与单 Key 时 openai 的默认重试次数一致
+    TRANSIENT_RETRIES = 2
+
+    def _request(self, request, lease=None):
+        """
+        发出单个请求; 按 "预估输入 + max_tokens" 在剩余额度最多的 Key 上预留额度, 返回后按实际用量结算,
+        请求失败时归还预留的 token 额度
+        Key 返回 429/401 时隔离该 Key, 并换一个 Key 重试(每个 Key 最多一次);
+        多个 Key 时超时、连接错误和 5xx 退避后重试(最多 TRANSIENT_RETRIES 次)
+        """
+        tokens = self._request_tokens(request)
+        failovers = retries = 0
+        delay = 0.0
+        while True:
+            if delay:
+                time.sleep(delay)
+                delay = 0.0
+            if lease is None:
+                lease = self.keys.acquire(tokens)
+            key, reservation = lease
+            lease = None
+
+            started = time.monotonic()
+            used_tokens = 0     # 失败的请求不占 token 额度
+            try:
+                response = key.client.chat.completions.create(
+                    model=self.model,
+                    messages=request["messages"],
+                    max_tokens=request["max_tokens"],
+                    temperature=request["temperature"],
+                    top_p=request["top_p"],
+                    stream=False
+                )
+                used_tokens = getattr(getattr(response, "usage", None), "total_tokens", None)
+            except Exception as e:
+                if self.keys.report_error(key, e):
+                    failovers += 1
+                    if failovers < len(self.keys.keys):
+                        continue
+                elif len(self.keys.keys) > 1 and _is_transient(e) and retries < self.TRANSIENT_RETRIES:
+                    retries += 1
+                    delay = 0.5 * 2 ** retries
+                    continue
+                raise
+            finally:
+                self.keys.release(key)
+                key.limiter.settle(reservation, used_tokens)
+            self.latency.record(time.monotonic() - started, request["max_tokens"])
+            self.keys.report_success(key)
+
+            # 已经是兼容格式,直接返回
+            return response
 
 
 def test_siliconflow():
@@ -101,4 +419,7 @@ def test_siliconflow():
 
 
 if __name__ == "__main__":
+    # Windows控制台UTF-8编码
+    if sys.platform == "win32":
+        sys.stdout = codecs.getwriter("utf-8")(sys.stdout.detach())
     test_siliconflow()
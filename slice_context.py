@@ -0,0 +1,106 @@
+"""
+不重叠切片的上文摘要
+默认切片(overlap=1)相邻窗口共享一个段落, 约三分之一的段落会发给模型两次, 产生的重复事项再由去重删除。
+context 模式下窗口不重叠, 每个切片改为携带前一个窗口的简短摘要:
+- 当前所在章节标题(逐切片向后传递)
+- 前一个窗口提及的关键词: 书名号/引号中的名称、外文专名、日期、机构地名等
+- 前一个窗口的最后一句
+摘要由本地规则生成, 不依赖前一个切片的模型输出, 切片之间仍可并发抽取;
+同一窗口文本的关键词只计算一次(重复的模板段落跨文件命中缓存)。
+"""
+
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from prompts_v2 import CONTEXT_SECTION
+
+SLICING_MODES = ["overlap", "context"]
+
+_TEXT_MARKER = "**文本内容:**"
+
+_TERM_PATTERNS = [
+    re.compile(r"《([^》]{1,30})》"),
+    re.compile(r"[“「『]([^”」』]{2,20})[”」』]"),
+    re.compile(r"\b([A-Z][A-Za-z0-9.\-]*(?:\s+[A-Z][A-Za-z0-9.\-]*){0,3})\b"),
+    re.compile(r"(\d{4}年(?:\d{1,2}月(?:\d{1,2}日)?)?)"),
+    re.compile(
+        r"([一-鿿]{2,10}?(?:大学|学院|公司|集团|协会|委员会|政府|医院|银行|研究所|研究院|俱乐部|"
+        r"联赛|锦标赛|运动会|奥运会|大会|会议|战争|条约|省|市|县|区))"
+    ),
+]
+# 机构地名等的左边界不可靠, 截掉最后一个虚词/日期字之前的部分: "刘佳利为中国自行车协会" -> "中国自行车协会"
+_NAME_PREFIX = re.compile(r"^.*[年月日为在于和与的是由将被对向从及、]")
+_NAME_PATTERN = _TERM_PATTERNS[-1]
+_SENTENCE_END = re.compile(r"[^。！？!?；;\n]+[。！？!?；;]?")
+
+
+@lru_cache(maxsize=4096)
+def extract_key_terms(text: str, limit: int = 8) -> Tuple[str, ...]:
+    """窗口文本中的关键词, 出现次数多的优先, 其次按最后出现位置(越靠后越可能被下文指代)"""
+    counts = Counter()
+    last_seen = {}
+    for pattern in _TERM_PATTERNS:
+        for match in pattern.finditer(text):
+            term = match.group(1).strip()
+            if pattern is _NAME_PATTERN:
+                term = _NAME_PREFIX.sub("", term)
+            if len(term) < 2 or term.isdigit():
+                continue
+            counts[term] += 1
+            last_seen[term] = max(last_seen.get(term, -1), match.start())
+    # 去掉被更长关键词包含的短词(如 "2023年" 与 "2023年6月12日")
+    candidates = [t for t in counts if not any(t != other and t in other for other in counts)]
+    ranked = sorted(candidates, key=lambda t: (-counts[t], -last_seen[t]))
+    return tuple(ranked[:limit])
+
+
+def last_sentence(text: str, max_chars: int = 80) -> str:
+    """窗口的最后一句(跳过表格行与标题)"""
+    lines = [l for l in text.strip().split('\n') if l.strip() and not l.lstrip().startswith(('|', '#'))]
+    if not lines:
+        return ""
+    sentences = _SENTENCE_END.findall(lines[-1].strip())
+    sentence = sentences[-1].strip() if sentences else lines[-1].strip()
+    return sentence if len(sentence) <= max_chars else "…" + sentence[-max_chars:]
+
+
+def build_digest(heading: Optional[str], previous_text: str, max_terms: int = 8) -> str:
+    """由章节标题与前一个窗口生成上文摘要, 没有可用信息时返回空字符串"""
+    lines = []
+    if heading:
+        lines.append(f"- 所在章节: {heading.lstrip('#').strip()}")
+    terms = extract_key_terms(previous_text, max_terms) if previous_text else ()
+    if terms:
+        lines.append(f"- 上文提及: {'、'.join(terms)}")
+    sentence = last_sentence(previous_text) if previous_text else ""
+    if sentence:
+        lines.append(f"- 上文末句: {sentence}")
+    return '\n'.join(lines)
+
+
+def slice_contexts(slices: List[str], max_terms: int = 8) -> List[str]:
+    """为每个切片生成上文摘要(第一个切片没有上文, 摘要为空)"""
+    contexts = []
+    heading = None
+    previous = ""
+    for text in slices:
+        # 切片以标题开头时本身已有章节信息
+        starts_with_heading = text.lstrip().startswith('#')
+        contexts.append(build_digest(None if starts_with_heading else heading, previous, max_terms))
+        for line in text.split('\n'):
+            if line.startswith('#'):
+                heading = line.strip()
+        previous = text
+    return contexts
+
+
+def with_context(prompt: str, context: str) -> str:
+    """把上文摘要插入 prompt 中当前任务的"文本内容"之前"""
+    if not context:
+        return prompt
+    position = prompt.rfind(_TEXT_MARKER)
+    if position == -1:
+        return prompt
+    return prompt[:position] + CONTEXT_SECTION.format(context=context) + prompt[position:]
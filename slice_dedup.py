@@ -0,0 +1,183 @@
+"""
+切片去重合并(调用模型之前)
+百科/新闻语料中大量重复的模板段落, 以及滑动窗口重叠, 会让相同或几乎相同的切片多次发送给模型。
+这里对切片做指纹:
+- 精确指纹: 规范化文本的 SHA1
+- 近似指纹: 64位 SimHash(字符3-gram), 汉明距离 <= max_distance 视为近重复;
+  指纹切成 max_distance+1 段分桶, 由抽屉原理, 近重复切片至少有一段完全相同, 只需比较同桶候选
+每个簇只把代表切片发送给模型, 结果再分发给簇内其他切片, references 替换为各自的 slice_id
+"""
+
+import copy
+import hashlib
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+_WHITESPACE = re.compile(r"\s+")
+_SIMHASH_BITS = 64
+
+DEDUP_MODES = ["off", "exact", "near"]
+
+
+def normalize_slice(text: str) -> str:
+    """规范化: 全半角统一、合并空白"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def exact_fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def simhash(normalized: str, ngram: int = 3) -> int:
+    """字符 n-gram SimHash, 中文无需分词"""
+    weights = [0] * _SIMHASH_BITS
+    if len(normalized) < ngram:
+        shingles = [normalized]
+    else:
+        shingles = [normalized[i:i + ngram] for i in range(len(normalized) - ngram + 1)]
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(_SIMHASH_BITS):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def _hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class SliceCoalescer:
+    """
+    切片指纹索引, 在整个运行期间(跨文件)共享
+
+    用法:
+        cluster_id, is_representative = coalescer.add(slice_id, slice_text)
+        if is_representative:
+            events = extract_events_from_slice(slice_text, slice_id)
+            coalescer.set_result(cluster_id, events)
+        else:
+            events = coalescer.fan_out(cluster_id, slice_id)
+    """
+
+    def __init__(self, mode: str = "near", max_distance: int = 4, min_length_ratio: float = 0.8):
+        """
+        Args:
+            mode: off=不去重, exact=仅精确去重, near=精确+SimHash近重复
+            max_distance: SimHash 汉明距离阈值
+            min_length_ratio: 近重复切片的长度比下限, 防止短切片误匹配长切片
+        """
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"不支持的切片去重模式: {mode}")
+        self.mode = mode
+        self.max_distance = max_distance
+        self.min_length_ratio = min_length_ratio
+
+        self._band_bits = _SIMHASH_BITS // (max_distance + 1)
+        self._band_mask = (1 << self._band_bits) - 1
+
+        self._exact = {}                                            # sha1 -> cluster_id
+        self._bands = [dict() for _ in range(max_distance + 1)]    # 分段值 -> [cluster_id]
+        self._clusters = []                                         # cluster_id -> 簇信息
+        self.stats = {"total": 0, "exact_hits": 0, "near_hits": 0}
+
+    def add(self, slice_id: str, slice_text: str, near: bool = True) -> Tuple[int, bool]:
+        """
+        登记一个切片
+        Args:
+            near: 是否参与近重复匹配; False 时只做精确去重, 也不作为其他切片的近重复候选
+                  (如同一表格的各个分块: 标题和表头相同, 只有数据行不同)
+        Returns:
+            (cluster_id, 是否为代表切片(需要调用模型))
+        """
+        self.stats["total"] += 1
+        if self.mode == "off":
+            return self._new_cluster(slice_id, 0, 0), True
+
+        normalized = normalize_slice(slice_text)
+        digest = exact_fingerprint(normalized)
+        cluster_id = self._exact.get(digest)
+        if cluster_id is not None:
+            self.stats["exact_hits"] += 1
+            return cluster_id, False
+
+        near = near and self.mode == "near"
+        fingerprint = 0
+        if near:
+            fingerprint = simhash(normalized)
+            cluster_id = self._find_near(fingerprint, len(normalized))
+            if cluster_id is not None:
+                self.stats["near_hits"] += 1
+                self._exact[digest] = cluster_id
+                return cluster_id, False
+
+        cluster_id = self._new_cluster(slice_id, fingerprint, len(normalized))
+        self._exact[digest] = cluster_id
+        if near:
+            for band, index in enumerate(self._bands):
+                key = (fingerprint >> (band * self._band_bits)) & self._band_mask
+                index.setdefault(key, []).append(cluster_id)
+        return cluster_id, True
+
+    def _new_cluster(self, slice_id: str, fingerprint: int, length: int) -> int:
+        self._clusters.append({
+            "representative": slice_id,
+            "fingerprint": fingerprint,
+            "length": length,
+            "events": None,
+        })
+        return len(self._clusters) - 1
+
+    def _find_near(self, fingerprint: int, length: int) -> Optional[int]:
+        candidates = set()
+        for band, index in enumerate(self._bands):
+            key = (fingerprint >> (band * self._band_bits)) & self._band_mask
+            candidates.update(index.get(key, ()))
+        best, best_distance = None, self.max_distance + 1
+        for cluster_id in candidates:
+            cluster = self._clusters[cluster_id]
+            shorter, longer = sorted((length, cluster["length"]))
+            if longer and shorter / longer < self.min_length_ratio:
+                continue
+            distance = _hamming(fingerprint, cluster["fingerprint"])
+            if distance < best_distance:
+                best, best_distance = cluster_id, distance
+        return best
+
+    def representative(self, cluster_id: int) -> str:
+        return self._clusters[cluster_id]["representative"]
+
+    def has_result(self, cluster_id: int) -> bool:
+        return self._clusters[cluster_id]["events"] is not None
+
+    def set_result(self, cluster_id: int, events: List[Dict]):
+        """记录代表切片的抽取结果"""
+        self._clusters[cluster_id]["events"] = events
+
+    def fan_out(self, cluster_id: int, slice_id: str) -> List[Dict]:
+        """把代表切片的结果复制给簇内切片, references 中的代表ID替换为该切片自己的ID"""
+        cluster = self._clusters[cluster_id]
+        representative = cluster["representative"]
+        events = copy.deepcopy(cluster["events"] or [])
+        for event in events:
+            references = [slice_id if r == representative else r for r in event.get("references", [])]
+            event["references"] = references if slice_id in references else [slice_id]
+        return events
+
+    @property
+    def saved_calls(self) -> int:
+        return self.stats["exact_hits"] + self.stats["near_hits"]
+
+    def format_stats(self) -> str:
+        total = self.stats["total"]
+        if not total:
+            return "切片去重: 无切片"
+        return (
+            f"切片去重({self.mode}): 共 {total} 个切片, 精确重复 {self.stats['exact_hits']}, "
+            f"近似重复 {self.stats['near_hits']}, 节省模型调用 {self.saved_calls} 次 "
+            f"({self.saved_calls / total:.1%})"
+        )
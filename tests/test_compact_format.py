@@ -0,0 +1,89 @@
+"""紧凑输出格式与标准格式的往返一致性"""
+
+import json
+
+import pytest
+
+from compact_format import compact_event, dumps_compact, expand_event, expand_events
+from json_salvage import parse_events_response
+
+SLICE_ID = "doc.md_slice_3"
+
+EVENTS = [
+    {
+        "title": "成都蓉城1-0战胜江原FC",
+        "summary": "亚冠精英联赛东亚区第2轮,成都蓉城主场1-0击败江原FC",
+        "content": "北京时间9月30日20点15分,成都蓉城主场迎战江原FC,最终以1比0获胜。",
+        "category": "体育赛事",
+        "references": [SLICE_ID],
+        "entities": [
+            {"type": "organization", "name": "成都蓉城", "description": "主场球队"},
+            {"type": "time", "name": "比赛时间", "description": "比赛开始时间",
+             "value_type": "datetime", "value": "2024-09-30T20:15:00"},
+            {"type": "metric", "name": "比分", "description": "最终比分", "value": "1-0"},
+            {"type": "metric", "name": "摩尔质量", "description": "分子量",
+             "value_type": "float", "value": "218.03", "unit": "g/mol"},
+            {"type": "other", "name": "含\"引号\"的名称", "description": ""},
+        ],
+        "is_valid": True,
+    },
+    {
+        "title": "广告",
+        "summary": "",
+        "content": "点击链接购买",
+        "category": "广告",
+        "references": [SLICE_ID],
+        "entities": [],
+        "is_valid": False,
+    },
+]
+
+
+@pytest.mark.parametrize("event", EVENTS, ids=["sports", "invalid"])
+def test_standard_to_compact_and_back(event):
+    assert expand_event(compact_event(event), SLICE_ID) == event
+
+
+def test_compact_to_standard_and_back():
+    rows = [compact_event(e) for e in EVENTS]
+    assert [compact_event(e) for e in expand_events(rows, SLICE_ID)] == rows
+
+
+def test_round_trip_through_model_output():
+    rows, info = parse_events_response(dumps_compact(EVENTS), compact=True)
+    assert info["mode"] == "clean"
+    assert expand_events(rows, SLICE_ID) == EVENTS
+
+
+def test_round_trip_inside_code_fence():
+    text = "```json\n" + dumps_compact(EVENTS) + "\n```"
+    rows, info = parse_events_response(text, compact=True)
+    assert info["mode"] == "clean"
+    assert expand_events(rows, SLICE_ID) == EVENTS
+
+
+def test_truncated_output_keeps_closed_events():
+    text = dumps_compact(EVENTS)
+    truncated = text[:text.index('["广告"') + 5]
+    rows, info = parse_events_response(truncated, compact=True)
+    assert info["truncated"]
+    assert expand_events(rows, SLICE_ID) == EVENTS[:1]
+
+
+def test_compact_output_is_smaller():
+    standard = json.dumps({"events": EVENTS}, ensure_ascii=False, indent=2)
+    assert len(dumps_compact(EVENTS)) < len(standard)
+
+
+def test_expand_fills_missing_fields():
+    event = expand_event(["标题", "摘要"], SLICE_ID)
+    assert event["content"] == "" and event["category"] == ""
+    assert event["is_valid"] is True
+    assert event["entities"] == []
+    assert event["references"] == [SLICE_ID]
+    assert expand_event(["标题", "", "", "", "false", []], SLICE_ID)["is_valid"] is False
+
+
+def test_standard_objects_pass_through():
+    # 模型误输出标准对象时原样保留
+    assert expand_events([EVENTS[0], "无效"], SLICE_ID) == [EVENTS[0]]
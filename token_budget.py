@@ -0,0 +1,139 @@
+"""
+输出 token 预算预测
+固定 max_tokens=2000 会为很短的切片预留过多的服务端容量和 TPM 额度, 而信息密集的切片仍可能被截断。
+这里根据运行中收集的 "输出token数/输入字符数" 历史统计, 为每个切片预测输出预算;
+只有输出被截断时才以更大的预算续写。统计可以保存到文件, 供下次运行直接使用。
+"""
+
+import json
+import os
+import re
+import threading
+from collections import deque
+
+_CJK = re.compile(r"[㐀-䶿一-鿿豈-﫿]")
+
+# 经验值: Qwen 分词器约 1.4 个汉字/token, 约 4 个其他字符/token
+_CJK_CHARS_PER_TOKEN = 1.4
+_OTHER_CHARS_PER_TOKEN = 4.0
+
+DEFAULT_MAX_TOKENS = 2000
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计文本 token 数(无需加载分词器)"""
+    cjk = len(_CJK.findall(text))
+    other = len(text) - cjk
+    return int(cjk / _CJK_CHARS_PER_TOKEN + other / _OTHER_CHARS_PER_TOKEN) + 1
+
+
+class TokenBudgetPredictor:
+    """
+    按输入长度预测输出预算: budget = base + 比例分位数 × 输入字符数 × 安全系数
+    样本不足时退回默认预算, 与原先固定 2000 的行为一致
+    """
+
+    def __init__(
+        self,
+        default_tokens: int = DEFAULT_MAX_TOKENS,
+        min_tokens: int = 256,
+        max_tokens: int = 4096,
+        base_tokens: int = 80,
+        quantile: float = 0.9,
+        safety: float = 1.2,
+        min_samples: int = 20,
+        window: int = 500,
+    ):
+        """
+        Args:
+            default_tokens: 样本不足时的预算
+            min_tokens / max_tokens: 预算上下限(max_tokens 也是截断后续写的上限)
+            base_tokens: JSON 外壳等固定开销
+            quantile: 使用的比例分位数, 越高越不容易截断
+            safety: 安全系数
+            min_samples: 开始预测所需的最少样本数
+            window: 只保留最近的样本
+        """
+        self.default_tokens = default_tokens
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.base_tokens = base_tokens
+        self.quantile = quantile
+        self.safety = safety
+        self.min_samples = min_samples
+        self._ratios = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._ratio_cache = None
+        self.stats = {"observed": 0, "truncated": 0, "predicted": 0, "reserved_tokens": 0}
+
+    def _ratio(self):
+        if self._ratio_cache is None:
+            ordered = sorted(self._ratios)
+            self._ratio_cache = ordered[min(len(ordered) - 1, int(len(ordered) * self.quantile))]
+        return self._ratio_cache
+
+    def predict(self, slice_text: str, ceiling: int = None) -> int:
+        """
+        预测切片的输出预算
+        Args:
+            slice_text: 切片文本
+            ceiling: 本次调用允许的最大预算(如预过滤降级的切片), 默认使用 max_tokens
+        """
+        ceiling = min(ceiling or self.max_tokens, self.max_tokens)
+        with self._lock:
+            if len(self._ratios) < self.min_samples:
+                budget = self.default_tokens
+            else:
+                budget = int(self.base_tokens + self._ratio() * len(slice_text) * self.safety)
+                self.stats["predicted"] += 1
+            budget = max(self.min_tokens, min(budget, ceiling))
+            self.stats["reserved_tokens"] += budget
+        return budget
+
+    def escalate(self, budget: int) -> int:
+        """截断后续写使用的更大预算"""
+        return min(self.max_tokens, max(budget * 2, self.default_tokens))
+
+    def observe(self, input_chars: int, output_tokens: int, truncated: bool = False):
+        """
+        记录一次调用的实际输出
+        被截断的输出只是下限, 按 1.5 倍计入, 让预测尽快上调
+        """
+        if input_chars <= 0:
+            return
+        if truncated:
+            output_tokens = int(output_tokens * 1.5)
+        with self._lock:
+            self._ratios.append(max(0, output_tokens - self.base_tokens) / input_chars)
+            self._ratio_cache = None
+            self.stats["observed"] += 1
+            if truncated:
+                self.stats["truncated"] += 1
+
+    def load(self, path: str):
+        """读取历史统计"""
+        if not path or not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        with self._lock:
+            self._ratios.extend(data.get("ratios", []))
+            self._ratio_cache = None
+
+    def save(self, path: str):
+        """保存历史统计"""
+        if not path:
+            return
+        with self._lock:
+            data = {"ratios": list(self._ratios)}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+
+    def format_stats(self) -> str:
+        observed = self.stats["observed"]
+        calls = self.stats["predicted"]
+        text = f"输出预算: 观测 {observed} 次, 截断 {self.stats['truncated']} 次, 按历史预测 {calls} 次"
+        with self._lock:
+            if len(self._ratios) >= self.min_samples:
+                text += f", 当前 p{int(self.quantile * 100)} 比例 {self._ratio():.3f} token/字符"
+        return text
@@ -0,0 +1,391 @@
+"""
+分布式抽取任务队列(基于租约)
+main.py 是单进程运行; 这里用一个 SQLite 数据库作为共享队列, 把文件分发给任意数量的 worker 进程/节点:
+- 租约: worker 领取任务时获得一个有期限的租约, 处理期间定期心跳续约
+- 过期回收: worker 崩溃后租约过期, 任务自动回到待处理状态, 由其他 worker 重新领取
+- 幂等提交: 结果以 task_id 为主键写入, 同一任务重复提交(如租约过期后原 worker 又完成)只保留第一次
+- 合并: 全部完成后读出所有结果, 做一次全局去重并输出
+
+多节点时数据库需放在所有节点都能访问且支持文件锁的位置
+
+命令行用法:
+    python work_queue.py --db queue.db init --data-folder <test_data>
+    python work_queue.py --db queue.db worker --workers 4          # 可在多个进程/节点上同时运行
+    python work_queue.py --db queue.db status
+    python work_queue.py --db queue.db merge --output-format json
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Iterator, List, Optional
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS queue_meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id       TEXT PRIMARY KEY,
+    state         TEXT NOT NULL DEFAULT 'pending',
+    owner         TEXT,
+    lease_expires REAL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    last_error    TEXT,
+    updated       REAL
+);
+CREATE TABLE IF NOT EXISTS results (
+    task_id   TEXT PRIMARY KEY,
+    worker_id TEXT,
+    events    TEXT NOT NULL,
+    committed REAL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_state ON tasks(state, lease_expires);
+"""
+
+STATE_PENDING = "pending"
+STATE_LEASED = "leased"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+
+
+class WorkQueue:
+    """SQLite 租约队列, 每个进程/线程使用各自的 WorkQueue 实例"""
+
+    def __init__(self, db_path: str, max_attempts: int = 3):
+        """
+        Args:
+            db_path: 队列数据库路径
+            max_attempts: 单个任务最多尝试次数, 超过后标记为 failed
+        """
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        # isolation_level=None: 事务由下面显式的 BEGIN IMMEDIATE 控制
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA_SQL)
+
+    def close(self):
+        self.conn.close()
+
+    def _transaction(self):
+        return _ImmediateTransaction(self.conn)
+
+    # ===== 队列元数据 =====
+
+    def set_meta(self, key: str, value: str):
+        with self._transaction():
+            self.conn.execute(
+                "INSERT OR REPLACE INTO queue_meta (key, value) VALUES (?, ?)", (key, value)
+            )
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM queue_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    # ===== 任务生命周期 =====
+
+    def enqueue(self, task_ids: List[str]) -> int:
+        """登记任务, 已存在的任务不会重复登记"""
+        now = time.time()
+        with self._transaction():
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO tasks (task_id, state, updated) VALUES (?, ?, ?)",
+                [(task_id, STATE_PENDING, now) for task_id in task_ids]
+            )
+            return self.conn.total_changes - before
+
+    def lease(self, worker_id: str, lease_seconds: float = 300) -> Optional[str]:
+        """
+        领取一个任务
+        Returns:
+            task_id, 没有可领取的任务时返回 None
+        """
+        now = time.time()
+        with self._transaction():
+            self._reclaim_expired(now)
+            row = self.conn.execute(
+                "SELECT task_id FROM tasks WHERE state = ? ORDER BY rowid LIMIT 1", (STATE_PENDING,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE tasks SET state = ?, owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated = ? WHERE task_id = ?",
+                (STATE_LEASED, worker_id, now + lease_seconds, now, row[0])
+            )
+            return row[0]
+
+    def _reclaim_expired(self, now: float):
+        """回收过期租约: 未超过尝试次数的回到 pending, 否则标记 failed"""
+        self.conn.execute(
+            "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+            "owner = NULL, last_error = COALESCE(last_error, 'lease expired'), updated = ? "
+            "WHERE state = ? AND lease_expires < ?",
+            (self.max_attempts, STATE_FAILED, STATE_PENDING, now, STATE_LEASED, now)
+        )
+
+    def heartbeat(self, task_id: str, worker_id: str, lease_seconds: float = 300) -> bool:
+        """续约, 返回 False 表示租约已丢失(已过期并被回收或被其他 worker 领取)"""
+        now = time.time()
+        with self._transaction():
+            cursor = self.conn.execute(
+                "UPDATE tasks SET lease_expires = ?, updated = ? "
+                "WHERE task_id = ? AND owner = ? AND state = ?",
+                (now + lease_seconds, now, task_id, worker_id, STATE_LEASED)
+            )
+            return cursor.rowcount == 1
+
+    def commit(self, task_id: str, worker_id: str, events: List[Dict]) -> bool:
+        """
+        幂等提交结果
+        Returns:
+            True 表示本次提交生效, False 表示该任务已有结果
+        """
+        now = time.time()
+        with self._transaction():
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO results (task_id, worker_id, events, committed) VALUES (?, ?, ?, ?)",
+                (task_id, worker_id, json.dumps(events, ensure_ascii=False), now)
+            )
+            accepted = cursor.rowcount == 1
+            self.conn.execute(
+                "UPDATE tasks SET state = ?, owner = NULL, lease_expires = NULL, updated = ? WHERE task_id = ?",
+                (STATE_DONE, now, task_id)
+            )
+            return accepted
+
+    def fail(self, task_id: str, worker_id: str, error: str):
+        """处理失败: 释放租约, 未超过尝试次数的任务回到 pending"""
+        now = time.time()
+        with self._transaction():
+            self.conn.execute(
+                "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "owner = NULL, lease_expires = NULL, last_error = ?, updated = ? "
+                "WHERE task_id = ? AND owner = ? AND state = ?",
+                (self.max_attempts, STATE_FAILED, STATE_PENDING, error, now, task_id, worker_id, STATE_LEASED)
+            )
+
+    # ===== 查询 =====
+
+    def progress(self) -> Dict[str, int]:
+        counts = {STATE_PENDING: 0, STATE_LEASED: 0, STATE_DONE: 0, STATE_FAILED: 0}
+        for state, count in self.conn.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state"):
+            counts[state] = count
+        return counts
+
+    def is_finished(self) -> bool:
+        progress = self.progress()
+        return progress[STATE_PENDING] == 0 and progress[STATE_LEASED] == 0
+
+    def iter_results(self) -> Iterator[List[Dict]]:
+        """按任务登记顺序读出每个任务的事件列表"""
+        for (events,) in self.conn.execute(
+            "SELECT r.events FROM results r JOIN tasks t ON t.task_id = r.task_id ORDER BY t.rowid"
+        ):
+            yield json.loads(events)
+
+
+class _ImmediateTransaction:
+    """BEGIN IMMEDIATE 事务: 领取任务时立即加写锁, 避免多个 worker 领到同一个任务"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        return False
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def run_worker(db_path: str, data_folder: Optional[str] = None, worker_id: Optional[str] = None,
+               workers: int = 1, lease_seconds: float = 300, idle_exit: bool = True,
+               poll_seconds: float = 5.0, no_prefilter: bool = False, compact_output: bool = False,
+               slicing: str = "overlap", token_stats: str = "token_budget_stats.json",
+               manifest_path: Optional[str] = None) -> int:
+    """
+    worker 主循环: 领取文件 → 处理 → 提交, 处理期间后台线程定期心跳
+    Args:
+        db_path: 队列数据库路径
+        data_folder: 数据文件夹, 默认使用 init 时登记的路径(各节点挂载路径不同时可覆盖)
+        worker_id: worker 标识, 默认 主机名-进程号-随机后缀
+        workers: 单个文件内的并发模型调用数
+        lease_seconds: 租约时长
+        idle_exit: 队列中没有可领取任务且没有处理中的任务时退出
+        poll_seconds: 其他 worker 仍在处理时的轮询间隔
+        no_prefilter / compact_output / slicing / token_stats / manifest_path: 与 main.py 的同名参数相同
+    Returns:
+        本 worker 成功提交的任务数
+    """
+    from main import _pipeline_version, budget_predictor, configure_pipeline, process_file
+    from manifest import Manifest
+    from prefilter import SlicePrefilter
+
+    configure_pipeline(compact=compact_output, slicing=slicing)
+    budget_predictor.load(token_stats)
+    queue = WorkQueue(db_path)
+    data_folder = data_folder or queue.get_meta("data_folder")
+    worker_id = worker_id or default_worker_id()
+    prefilter = SlicePrefilter(enabled=not no_prefilter)
+    manifest = Manifest(manifest_path, _pipeline_version()) if manifest_path else None
+    committed = 0
+    print(f"worker {worker_id} 启动, 数据文件夹: {data_folder}")
+
+    try:
+        while True:
+            task_id = queue.lease(worker_id, lease_seconds)
+            if task_id is None:
+                if idle_exit and queue.is_finished():
+                    break
+                time.sleep(poll_seconds)
+                continue
+
+            print(f"[{worker_id}] 领取: {task_id}")
+            stop = threading.Event()
+            heartbeat = threading.Thread(
+                target=_heartbeat_loop,
+                args=(db_path, task_id, worker_id, lease_seconds, stop),
+                daemon=True
+            )
+            heartbeat.start()
+            try:
+                events = process_file(
+                    os.path.join(data_folder, task_id), prefilter=prefilter, workers=workers, document=task_id,
+                    manifest=manifest
+                )
+            except Exception as e:
+                stop.set()
+                heartbeat.join()
+                print(f"[{worker_id}] 失败: {task_id}: {e}")
+                queue.fail(task_id, worker_id, str(e))
+                continue
+            stop.set()
+            heartbeat.join()
+
+            if queue.commit(task_id, worker_id, events):
+                committed += 1
+                print(f"[{worker_id}] 完成: {task_id}, {len(events)} 个事件")
+            else:
+                print(f"[{worker_id}] 完成: {task_id}, 已有其他 worker 提交的结果, 忽略本次结果")
+    finally:
+        queue.close()
+        budget_predictor.save(token_stats)
+        if manifest is not None:
+            manifest.close()
+
+    print(f"worker {worker_id} 退出, 共提交 {committed} 个任务")
+    return committed
+
+
+def _heartbeat_loop(db_path: str, task_id: str, worker_id: str, lease_seconds: float, stop: threading.Event):
+    # SQLite 连接不能跨线程共享, 心跳线程使用独立连接
+    queue = WorkQueue(db_path)
+    try:
+        while not stop.wait(lease_seconds / 3):
+            if not queue.heartbeat(task_id, worker_id, lease_seconds):
+                print(f"[{worker_id}] 警告: {task_id} 的租约已丢失")
+                return
+    finally:
+        queue.close()
+
+
+def merge_results(db_path: str, output_file: str, output_format: str = None) -> int:
+    """读出所有任务结果, 全局去重后输出"""
+    from main import deduplicate_events
+    from event_io import write_events
+
+    queue = WorkQueue(db_path)
+    try:
+        progress = queue.progress()
+        if not queue.is_finished():
+            print(f"警告: 仍有未完成的任务 {progress}")
+        all_events = [e for events in queue.iter_results() for e in events]
+    finally:
+        queue.close()
+
+    original_count = len(all_events)
+    all_events = deduplicate_events(all_events, content_threshold=0.75)
+    write_events(output_file, all_events, output_format)
+    print(f"合并 {progress[STATE_DONE]} 个任务: 去重前 {original_count} 个事件, 去重后 {len(all_events)} 个")
+    print(f"最终结果已保存到: {output_file}")
+    return len(all_events)
+
+
+def main():
+    """命令行入口"""
+    import argparse
+    from event_io import OUTPUT_FORMATS, output_path_for
+    from slice_context import SLICING_MODES
+
+    parser = argparse.ArgumentParser(description="分布式抽取任务队列")
+    parser.add_argument("--db", default="extract_queue.db", help="队列数据库路径")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p_init = subparsers.add_parser("init", help="根据 metadata.json 登记文件任务")
+    p_init.add_argument("--data-folder", required=True, help="测试数据文件夹路径(包含 metadata.json)")
+
+    p_worker = subparsers.add_parser("worker", help="启动 worker")
+    p_worker.add_argument("--data-folder", help="覆盖 init 时登记的数据文件夹路径")
+    p_worker.add_argument("--worker-id", help="worker 标识")
+    p_worker.add_argument("--workers", type=int, default=4, help="单个文件内的并发模型调用数")
+    p_worker.add_argument("--lease", type=float, default=300, help="租约时长(秒)")
+    p_worker.add_argument("--no-prefilter", action="store_true", help="关闭本地低价值切片预过滤")
+    p_worker.add_argument("--compact-output", action="store_true", help="紧凑输出格式(同 main.py)")
+    p_worker.add_argument("--slicing", choices=SLICING_MODES, default="overlap", help="切片方式(同 main.py)")
+    p_worker.add_argument("--token-stats", default="token_budget_stats.json",
+                          help="输出预算历史统计文件, 启动时读取、退出时更新; 传空字符串则不保存")
+    p_worker.add_argument("--manifest", help="增量抽取清单数据库, 复用未变化的文件/切片的上次结果(同 main.py)")
+    p_worker.add_argument("--keep-alive", action="store_true", help="队列为空时不退出, 继续等待新任务")
+
+    subparsers.add_parser("status", help="查看队列进度")
+
+    p_merge = subparsers.add_parser("merge", help="合并结果并全局去重")
+    p_merge.add_argument("--output-format", choices=OUTPUT_FORMATS, default="json", help="输出格式")
+
+    args = parser.parse_args()
+
+    if args.command == "init":
+        metadata_path = os.path.join(args.data_folder, "metadata.json")
+        with open(metadata_path, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        queue = WorkQueue(args.db)
+        queue.set_meta("data_folder", os.path.abspath(args.data_folder))
+        added = queue.enqueue(metadata.get('file_list', []))
+        print(f"已登记 {added} 个新任务, 队列进度: {queue.progress()}")
+        queue.close()
+    elif args.command == "worker":
+        run_worker(
+            args.db,
+            data_folder=args.data_folder,
+            worker_id=args.worker_id,
+            workers=args.workers,
+            lease_seconds=args.lease,
+            idle_exit=not args.keep_alive,
+            no_prefilter=args.no_prefilter,
+            compact_output=args.compact_output,
+            slicing=args.slicing,
+            token_stats=args.token_stats,
+            manifest_path=args.manifest,
+        )
+    elif args.command == "status":
+        queue = WorkQueue(args.db)
+        print(f"队列进度: {queue.progress()}")
+        queue.close()
+    else:
+        merge_results(args.db, output_path_for('extracted_events', args.output_format), args.output_format)
+
+
+if __name__ == "__main__":
+    main()